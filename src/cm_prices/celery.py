@@ -24,6 +24,7 @@ app.autodiscover_tasks()
 app.conf.beat_schedule = {
     'sync_scryfall': {'task': 'sync_scryfall_task', 'schedule': crontab(minute='28', hour='*/4')},
     'update_mtg': {'task': 'update_mtg_task', 'schedule': crontab(minute='58', hour='*')},
+    'price_retention': {'task': 'apply_price_retention_task', 'schedule': crontab(minute='13', hour='3')},
 }
 
 app.conf.timezone = 'Europe/London'
@@ -156,7 +156,70 @@ SHELL_PLUS_POST_IMPORTS = (
 SCRAPING_RETRIES = 8
 SCRAPING_SLEEP_TIME = 15.5
 SLOPE_THRESHOLD = 0.4
+ANALYTICS_WORKERS = None  # processes used by show_stats, defaults to os.cpu_count()
 
 PRICE_FIELD = 'trend'
 
+# slopes computed for every combination of these MTGCardPrice fields and intervals (days)
+SLOPE_PRICE_FIELDS = [PRICE_FIELD, 'low', 'avg1', 'trend_foil', 'low_foil']
+SLOPE_INTERVALS = [2, 7, 30]
+
+# MTGCardPrice fields diffed against the previous catalog at ingest (MTGCardPriceMove)
+MOVES_PRICE_FIELDS = [PRICE_FIELD, 'low', 'avg1', 'trend_foil']
+
+# MTGCardPrice fields whose cheapest print per metacard is stored at ingest (MTGMetacardFloor)
+FLOOR_PRICE_FIELDS = [PRICE_FIELD]
+
+# MTGCardPrice fields aggregated per set and per format after every ingest (MTGPriceIndex)
+INDEX_PRICE_FIELDS = [PRICE_FIELD, 'low']
+
+# rolling EMA / std / drawdown / z-score windows (catalogs) per MTGCardPrice field (MTGCardRollingStats)
+ROLLING_PRICE_FIELDS = [PRICE_FIELD]
+ROLLING_WINDOWS = [7, 30]
+
+# "cards moving like this one": daily returns per card in the index and where it is stored
+SIMILARITY_WINDOW = 60
+SIMILARITY_INDEX_DIR = os.path.join(BASE_DIR, '../similarity_index')
+
+# movers kept per (format, min price tier, interval, price field, direction), the tiers being the min_price
+# values show_changes() can be asked for
+LEADERBOARD_SIZE = 50
+LEADERBOARD_MIN_PRICES = [1, 3]
+
+# in-process price history cache: total price points kept, seconds between checks for a new catalog
+PRICE_HISTORY_CACHE_POINTS = 2_000_000
+PRICE_HISTORY_CACHE_TTL = 60
+
+# catalog months of MTGCardPrice kept live before prices.partitions.archive_prices() moves them to the archive tier
+# (run daily by the price_retention beat, see below), where SQLite archives are written, and months of MySQL
+# partitions created ahead of the ingest
+PRICE_ARCHIVE_AFTER_MONTHS = 12
+PRICE_ARCHIVE_DIR = os.path.join(BASE_DIR, '../price_archive')
+PRICE_PARTITION_MONTHS_AHEAD = 2
+
+# prices.retention: days of daily prices before whole months are rolled up into weekly and monthly
+# MTGCardPriceRollup rows, then 'archive'd once also older than PRICE_ARCHIVE_AFTER_MONTHS or 'delete'd, the price
+# fields rolled up, days of weekly rollups kept and read by MTGCardPrice.objects.history() before monthly ones,
+# daily prices read per chunk
+PRICE_RETENTION_DAYS = 180
+PRICE_RETENTION_ACTION = 'archive'
+ROLLUP_PRICE_FIELDS = [PRICE_FIELD, 'low', 'avg', 'avg1']
+PRICE_ROLLUP_WEEKLY_DAYS = 365
+PRICE_ROLLUP_CHUNK_SIZE = 200_000
+
+# prices.query_plans.check_query_plans(): timings and plan problems of the hot queries, one JSON line per run
+QUERY_PLAN_LOG = os.path.join(BASE_DIR, '../query_plans.jsonl')
+
+# local CSV / NDJSON / Parquet exports (prices.exporters): output directory and rows per database fetch and write
+LOCAL_EXPORT_DIR = os.path.join(BASE_DIR, '../exports')
+LOCAL_EXPORT_CHUNK_SIZE = 10_000
+
 GOOGLE_SECRET_CREDENTIALS = os.path.join(BASE_DIR, '../google_secrets.json')
+# push only changed cells to Google Sheets, diffing against the last uploaded grid kept in GSHEETS_SNAPSHOT_DIR
+GSHEETS_INCREMENTAL_EXPORT = True
+GSHEETS_SNAPSHOT_DIR = os.path.join(BASE_DIR, '../gsheets_snapshots')
+# Sheets upload limits: cells per batch_update request, retries of 429/5xx errors and their backoff
+GSHEETS_MAX_CELLS_PER_REQUEST = 50_000
+GSHEETS_MAX_RETRIES = 6
+GSHEETS_BACKOFF_SECONDS = 1
+GSHEETS_MAX_BACKOFF_SECONDS = 64
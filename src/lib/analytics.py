@@ -0,0 +1,405 @@
+import logging
+import math
+import os
+import statistics
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from prices.models import Catalog, MTGCardPrice
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+RANK_PRICE_FIELDS = ['avg', 'avg1', 'low', 'trend']
+
+# Attached SharedPriceHistory of the current worker process, set by the pool initializer.
+_worker_history = None
+
+
+def linear_slope(time_values, price_values):
+    """Least squares slope of price_values over time_values (in days)."""
+    num_values = len(time_values)
+    time_values = np.asarray(time_values, dtype=np.float64)
+    price_values = np.asarray(price_values, dtype=np.float64)
+
+    sum_time = time_values.sum()
+    sum_price = price_values.sum()
+    sum_time_price = (time_values * price_values).sum()
+    sum_time_squared = (time_values * time_values).sum()
+
+    numerator = num_values * sum_time_price - sum_time * sum_price
+    denominator = num_values * sum_time_squared - sum_time * sum_time
+    return float(numerator / denominator) if denominator != 0 else 0
+
+
+def rising_increase(price_values):
+    """Return the percentage increase of a never decreasing series of prices, 0 otherwise."""
+    price_values = np.asarray(price_values, dtype=np.float64)
+    if len(price_values) < 2 or price_values[0] >= price_values[-1]:
+        return 0
+
+    if (np.diff(price_values) < 0).any():
+        return 0
+
+    return float((price_values[-1] - price_values[0]) / price_values[0]) * 100
+
+
+def spike_mask(prices, min_price, min_percentage_change, accelerating_increase_factor, min_price_difference):
+    """
+    Evaluate the find_spiking_cards() rules over a (cards x entries) matrix of prices, newest price first.
+
+    Return (mask, price_differences): which rows are spiking and their increase over the whole window.
+    Rows holding a NaN never spike.
+    """
+    current_price, previous_price, earliest_price = prices[:, 0], prices[:, 1], prices[:, -1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage_change = np.where(previous_price != 0, (current_price - previous_price) / previous_price * 100, 0)
+
+    # increases[:, i] is the increase of the i-th newest day, each one must beat the one before it
+    increases = prices[:, :-1] - prices[:, 1:]
+    accelerating = (increases[:, :-1] >= accelerating_increase_factor * increases[:, 1:]).all(axis=1)
+    price_differences = current_price - earliest_price
+
+    mask = (
+        ~np.isnan(prices).any(axis=1)
+        & (current_price > min_price)
+        & (percentage_change >= min_percentage_change)
+        & accelerating
+        & (price_differences > min_price_difference)
+    )
+    return mask, price_differences
+
+
+def ema_fold(ema, prices, window):
+    """
+    Fold a (cards x entries) matrix of prices, oldest first, into exponential moving averages.
+
+    ema holds the previous average of every row (NaN to seed it from the first price); NaN prices are skipped.
+    """
+    alpha = 2 / (window + 1)
+    ema = np.array(ema, dtype=float)
+    for column in prices.T:
+        seeded = np.isnan(ema)
+        updated = np.where(seeded, column, alpha * column + (1 - alpha) * ema)
+        ema = np.where(np.isnan(column), ema, updated)
+    return ema
+
+
+def window_stats(prices):
+    """
+    Return (last, std, zscore, max_drawdown) of every row of a (cards x entries) matrix of prices, oldest first.
+
+    NaN prices are ignored; max_drawdown is the deepest percent fall from a running peak (0 or negative).
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # rows without enough prices give NaN
+        filled = pd.DataFrame(prices).ffill(axis=1).to_numpy()
+        last = filled[:, -1]
+        mean = np.nanmean(prices, axis=1)
+        std = np.nanstd(prices, axis=1, ddof=1)
+        zscore = np.where(std > 0, (last - mean) / std, np.nan)
+
+        peaks = np.fmax.accumulate(prices, axis=1)
+        drawdowns = np.where(peaks > 0, (prices - peaks) / peaks * 100, np.nan)
+        max_drawdown = np.nanmin(drawdowns, axis=1)
+    return last, std, zscore, max_drawdown
+
+
+class SlidingRegression:
+    """
+    Least squares sums over a sliding window of (day, price) points, updated in O(1) per point.
+
+    Sums are kept relative to the first day of the window (origin) so they stay small and precise no matter
+    how long the window has been sliding.
+    """
+
+    def __init__(self, points=(), origin=0.0, sums=(0.0, 0.0, 0.0, 0.0)):
+        """Start a window over points, sums being the sums of those points relative to origin."""
+        self.points = deque(tuple(point) for point in points)
+        self.origin = origin
+        self.sum_time, self.sum_price, self.sum_time_price, self.sum_time_squared = sums
+
+    def __len__(self):
+        """Return the number of points in the window."""
+        return len(self.points)
+
+    @property
+    def sums(self):
+        """Return (sum_time, sum_price, sum_time_price, sum_time_squared) relative to origin."""
+        return self.sum_time, self.sum_price, self.sum_time_price, self.sum_time_squared
+
+    def _accumulate(self, day, price, sign):
+        time_value = day - self.origin
+        self.sum_time += sign * time_value
+        self.sum_price += sign * price
+        self.sum_time_price += sign * time_value * price
+        self.sum_time_squared += sign * time_value * time_value
+
+    def _rebase(self, origin):
+        """Move the sums origin without revisiting the points."""
+        shift = origin - self.origin
+        num_values = len(self.points)
+        self.sum_time_squared += num_values * shift * shift - 2 * shift * self.sum_time
+        self.sum_time_price -= shift * self.sum_price
+        self.sum_time -= num_values * shift
+        self.origin = origin
+
+    def add(self, day, price):
+        """Append a point newer than every point of the window."""
+        if not self.points:
+            self.origin = day
+            self.sum_time = self.sum_price = self.sum_time_price = self.sum_time_squared = 0.0
+        self.points.append((day, price))
+        self._accumulate(day, price, 1)
+
+    def evict_before(self, start_day):
+        """Drop the points older than start_day."""
+        while self.points and self.points[0][0] < start_day:
+            self._accumulate(*self.points.popleft(), -1)
+        if self.points:
+            self._rebase(self.points[0][0])
+
+    def slide(self, day, price, interval_days):
+        """Add a point and keep only the points of the last interval_days calendar days (UTC)."""
+        self.add(day, price)
+        self.evict_before(math.floor(day) - interval_days)
+
+    def slope(self):
+        """Return the least squares slope of the window, as linear_slope gives for the same points."""
+        num_values = len(self.points)
+        numerator = num_values * self.sum_time_price - self.sum_time * self.sum_price
+        denominator = num_values * self.sum_time_squared - self.sum_time * self.sum_time
+        return numerator / denominator if denominator != 0 else 0
+
+    def percent_change(self):
+        """Percentage change between the first and the last price of the window."""
+        initial_price, final_price = self.points[0][1], self.points[-1][1]
+        return ((final_price - initial_price) / initial_price) * 100 if initial_price != 0 else 0
+
+
+def recent_catalogs_start(last_catalogs):
+    """Return the date of the oldest of the latest last_catalogs price catalogs, None for the whole history."""
+    if not last_catalogs:
+        return None
+
+    catalog_dates = list(
+        Catalog.objects.filter(catalog_id=Catalog.MTG, catalog_type=Catalog.PRICES)
+        .order_by('-catalog_date')
+        .values_list('catalog_date', flat=True)[:last_catalogs]
+    )
+    return catalog_dates[-1] if catalog_dates else None
+
+
+class SharedPriceHistory:
+    """
+    Price history of many cards packed into flat arrays living in shared memory.
+
+    Rows are sorted by card and then by catalog date, ``offsets[i]:offsets[i + 1]`` being the rows of
+    ``card_ids[i]``. Dates are stored as days since the epoch and missing prices as NaN, so workers only
+    need the block names to rebuild numpy views over the same memory.
+    """
+
+    def __init__(self, fields, arrays, blocks=None):
+        """Wrap {name: array} views, blocks being the shared memory blocks behind them."""
+        self.fields = list(fields)
+        self.arrays = arrays
+        self.blocks = blocks or []
+
+    @property
+    def card_ids(self):
+        """Ids of the stored cards, sorted."""
+        return self.arrays['card_ids']
+
+    @property
+    def offsets(self):
+        """Row boundaries of each card."""
+        return self.arrays['offsets']
+
+    def __len__(self):
+        """Return the number of stored cards."""
+        return len(self.card_ids)
+
+    def card_rows(self, index):
+        """Return the dates and a {field: values} dict for the card at position index."""
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        return self.arrays['days'][start:stop], {field: self.arrays[field][start:stop] for field in self.fields}
+
+    @classmethod
+    def from_queryset(cls, cards_qs, fields, last_catalogs=None):
+        """
+        Load the price history of cards_qs with a single query and publish it in shared memory.
+
+        When last_catalogs is given only the rows of the latest last_catalogs price catalogs are loaded, daily ones
+        even where the window reaches into the rolled up weeks.
+        """
+        since = recent_catalogs_start(last_catalogs)
+        rows = MTGCardPrice.objects.history(fields, card_ids=cards_qs, since=since, daily=last_catalogs is not None)
+
+        card_column, day_column = [], []
+        field_columns = {field: [] for field in fields}
+        for card_id, catalog_date, *values in rows:
+            card_column.append(card_id)
+            day_column.append(catalog_date.timestamp() / SECONDS_PER_DAY)
+            for field, value in zip(fields, values):
+                field_columns[field].append(math.nan if value is None else value)
+
+        # rows of archived months come before the live ones, a stable sort groups every card oldest first
+        order = np.argsort(np.asarray(card_column, dtype=np.int64), kind='stable')
+        card_column = np.asarray(card_column, dtype=np.int64)[order]
+        card_ids, offsets = np.unique(card_column, return_index=True)
+        arrays = {
+            'card_ids': card_ids,
+            'offsets': np.append(offsets, len(card_column)).astype(np.int64),
+            'days': np.asarray(day_column, dtype=np.float64)[order],
+        }
+        arrays.update({field: np.asarray(column, dtype=np.float64)[order] for field, column in field_columns.items()})
+
+        return cls.publish(fields, arrays)
+
+    @classmethod
+    def publish(cls, fields, arrays):
+        """Copy arrays into new shared memory blocks."""
+        shared_arrays = {}
+        blocks = []
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            shared_arrays[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared_arrays[name][:] = array
+        return cls(fields, shared_arrays, blocks)
+
+    def spec(self):
+        """Picklable description of the shared blocks, used by workers to attach."""
+        return {
+            'fields': self.fields,
+            'arrays': {
+                name: (block.name, array.shape, array.dtype.str)
+                for (name, array), block in zip(self.arrays.items(), self.blocks)
+            },
+        }
+
+    @classmethod
+    def attach(cls, spec):
+        """Map the shared blocks described by spec without copying them."""
+        arrays = {}
+        blocks = []
+        for name, (block_name, shape, dtype) in spec['arrays'].items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        return cls(spec['fields'], arrays, blocks)
+
+    def close(self, unlink=False):
+        """Release the shared blocks, removing them as well when unlink is set (owner only)."""
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            if unlink:
+                block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        """Return the history, owned by the with block."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Release and remove the shared blocks."""
+        self.close(unlink=True)
+
+
+def _last_values(days, values, count):
+    """Return the last count non null (date, value) pairs."""
+    mask = ~np.isnan(values)
+    return days[mask][-count:], values[mask][-count:]
+
+
+def card_stats(history, index, days, price_field, min_value, min_percentage, now_days):
+    """
+    Array version of rank_card_by_price and price_slope for the card at position index of history.
+
+    Return a (mean price increase, slope) tuple.
+    """
+    card_days, card_values = history.card_rows(index)
+    if not card_days.size:
+        return 0, 0
+
+    # price_slope()
+    slope = 0
+    slope_days, slope_values = _last_values(card_days, card_values[price_field], days)
+    if len(slope_values) > 1:
+        slope = linear_slope(slope_days - slope_days[0], slope_values)
+
+    # rank_card_by_price(), skip card if it has no recent price or the last one is below min_value
+    last_value = card_values[price_field][-1]
+    if card_days[-1] < now_days - days or (not np.isnan(last_value) and last_value and last_value < min_value):
+        return 0, slope
+
+    increase_list = []
+    for p_field in RANK_PRICE_FIELDS:
+        increase = rising_increase(_last_values(card_days, card_values[p_field], days)[1])
+        if increase < min_percentage:
+            return 0, slope
+        increase_list.append(increase)
+
+    return statistics.mean(increase_list), slope
+
+
+def _attach_worker(spec):
+    """Pool initializer: map the shared history once per worker process."""
+    global _worker_history  # pylint: disable=global-statement
+    _worker_history = SharedPriceHistory.attach(spec)
+
+
+def _card_stats_range(start, stop, days, price_field, min_value, min_percentage, now_days):
+    """Compute card_stats for the card positions [start, stop) of the attached history."""
+    history = _worker_history
+    return [
+        (
+            int(history.card_ids[index]),
+            *card_stats(history, index, days, price_field, min_value, min_percentage, now_days),
+        )
+        for index in range(start, stop)
+    ]
+
+
+def run_card_stats(cards_qs, days, workers=None, min_value=1, min_percentage=1):
+    """
+    Compute price increase rankings and slopes for every card of cards_qs in parallel.
+
+    Price history is loaded once and shared with the workers, which receive index ranges instead of model
+    instances and never touch the database. Return a list of (card_id, increase, slope) sorted by card_id.
+    """
+    workers = workers or getattr(settings, 'ANALYTICS_WORKERS', None) or os.cpu_count() or 1
+    price_field = settings.PRICE_FIELD
+    fields = sorted(set(RANK_PRICE_FIELDS) | {price_field})
+    now_days = timezone.now().timestamp() / SECONDS_PER_DAY
+
+    with SharedPriceHistory.from_queryset(cards_qs, fields, last_catalogs=days) as history:
+        num_cards = len(history)
+        logger.info('Processing stats for %d cards with %d workers', num_cards, workers)
+        if not num_cards:
+            return []
+
+        # forked workers must not inherit open database connections
+        connections.close_all()
+
+        range_size = max(1, math.ceil(num_cards / (workers * 4)))
+        ranges = [(start, min(start + range_size, num_cards)) for start in range(0, num_cards, range_size)]
+        args = (days, price_field, min_value, min_percentage, now_days)
+
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker, initargs=(history.spec(),)) as pool:
+            futures = [pool.submit(_card_stats_range, start, stop, *args) for start, stop in ranges]
+            for future in futures:  # submission order keeps results sorted by card_id
+                results.extend(future.result())
+
+    return results
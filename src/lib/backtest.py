@@ -0,0 +1,193 @@
+import logging
+import math
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections
+
+from lib.analytics import SECONDS_PER_DAY, SharedPriceHistory, spike_mask
+from prices.models import MTGCardPrice
+
+logger = logging.getLogger(__name__)
+
+_worker_matrix = None  # SharedPriceHistory mapped by each backtest pool worker
+_worker_returns = None  # {horizon: forward returns} of the worker's matrix
+
+
+def load_price_matrix(cards_qs=None, field='trend', since=None):
+    """
+    Load the price history of cards_qs (every card by default) as a (cards x catalogs) matrix with one query.
+
+    Return (card_ids, days, prices): catalogs are sorted oldest first, days are days since the epoch and
+    missing prices are NaN. Archived months are included, weekly and monthly rollups are not.
+    """
+    rows = MTGCardPrice.objects.history([field], card_ids=cards_qs, since=since, daily=True)
+    frame = pd.DataFrame.from_records(rows, columns=['card_id', 'catalog_date', 'price'])
+    matrix = frame.pivot(index='card_id', columns='catalog_date', values='price').astype(float)
+
+    days = np.array([catalog_date.timestamp() / SECONDS_PER_DAY for catalog_date in matrix.columns])
+    return matrix.index.to_numpy(dtype=np.int64), days, matrix.to_numpy()
+
+
+def forward_returns(prices, days, horizon):
+    """
+    Return the percent change from every catalog to horizon days later, NaN when it is unknown.
+
+    The later price is the one of the first catalog published on or after the calendar day horizon days after,
+    so missing catalogs do not stretch the horizon.
+    """
+    calendar_days = np.floor(days)
+    targets = np.searchsorted(calendar_days, calendar_days + horizon)
+    known = targets < prices.shape[1]
+
+    returns = np.full(prices.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[:, known] = (prices[:, targets[known]] - prices[:, known]) / prices[:, known] * 100
+    returns[~np.isfinite(returns)] = np.nan
+    return returns
+
+
+def spike_signals(
+    prices,
+    days,
+    min_price=3,
+    last_entries=3,
+    min_percentage_change=5,
+    accelerating_increase_factor=1.0,
+    min_price_difference=0.50,
+):  # pylint: disable=unused-argument
+    """
+    Replay the find_spiking_cards() rules on every catalog of a (cards x catalogs) matrix.
+
+    Return a boolean matrix of the same shape, True where a card would have been reported as spiking on
+    that catalog. Every catalog is evaluated on all cards at once through spike_mask().
+    """
+    signals = np.zeros(prices.shape, dtype=bool)
+
+    # cards never priced above min_price cannot spike, most of the catalog is skipped up front
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN rows
+        candidates = np.flatnonzero(np.nanmax(prices, axis=1) > min_price)
+    prices = prices[candidates]
+
+    for column in range(last_entries - 1, prices.shape[1]):
+        start, stop = column - last_entries + 1, column + 1
+        window = prices[:, start:stop][:, ::-1]  # newest first
+        signals[candidates, column] = spike_mask(
+            window, min_price, min_percentage_change, accelerating_increase_factor, min_price_difference
+        )[0]
+    return signals
+
+
+def trend_signals(prices, days, window=7, slope_threshold=None, min_price=0):
+    """
+    Replay the show_stats() slope rule on every catalog of a (cards x catalogs) matrix.
+
+    A card signals when the least squares slope (price per day) of its prices over the last window catalogs
+    reaches slope_threshold (settings.SLOPE_THRESHOLD by default). NaN prices are left out of the fit.
+    """
+    if slope_threshold is None:
+        slope_threshold = settings.SLOPE_THRESHOLD
+
+    signals = np.zeros(prices.shape, dtype=bool)
+    for column in range(window - 1, prices.shape[1]):
+        start, stop = column - window + 1, column + 1
+        values = prices[:, start:stop]
+        valid = ~np.isnan(values)
+        time_values = np.where(valid, days[start:stop] - days[start], 0)
+        price_values = np.where(valid, values, 0)
+
+        count = valid.sum(axis=1)
+        sum_time, sum_price = time_values.sum(axis=1), price_values.sum(axis=1)
+        numerator = count * (time_values * price_values).sum(axis=1) - sum_time * sum_price
+        denominator = count * (time_values**2).sum(axis=1) - sum_time**2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = np.where((count > 1) & (denominator != 0), numerator / denominator, np.nan)
+
+        last_price = values[:, -1]
+        signals[:, column] = (slopes >= slope_threshold) & (last_price >= min_price)
+    return signals
+
+
+SIGNAL_RULES = {
+    'spike': spike_signals,
+    'trend': trend_signals,
+}
+
+
+def score_signals(signals, returns):
+    """Summarize the forward returns that followed the signals."""
+    outcomes = returns[signals & ~np.isnan(returns)]
+    if not outcomes.size:
+        return {'signals': 0, 'mean_return': math.nan, 'median_return': math.nan, 'hit_rate': math.nan}
+
+    return {
+        'signals': int(outcomes.size),
+        'mean_return': float(outcomes.mean()),
+        'median_return': float(np.median(outcomes)),
+        'hit_rate': float((outcomes > 0).mean()),
+    }
+
+
+def _attach_backtest_worker(spec, horizons):
+    """Pool initializer: map the shared price matrix and compute its forward returns once per worker."""
+    global _worker_matrix, _worker_returns  # pylint: disable=global-statement
+    _worker_matrix = SharedPriceHistory.attach(spec)
+    arrays = _worker_matrix.arrays
+    _worker_returns = {horizon: forward_returns(arrays['prices'], arrays['days'], horizon) for horizon in horizons}
+
+
+def _backtest_parameters(rule, parameters):
+    """Score one parameter combination of rule against every forward return horizon."""
+    arrays = _worker_matrix.arrays
+    signals = SIGNAL_RULES[rule](arrays['prices'], arrays['days'], **parameters)
+    result = dict(parameters)
+    for horizon, returns in _worker_returns.items():
+        result.update({f'{name}_{horizon}d': value for name, value in score_signals(signals, returns).items()})
+    return result
+
+
+def run_backtest(rule, grid, horizons=(7,), cards_qs=None, field='trend', since=None, workers=None):
+    """
+    Backtest every parameter combination of grid for a signal rule ('spike' or 'trend') over the price history.
+
+    grid maps parameter names of the rule function to lists of values, e.g.
+    ``run_backtest('spike', {'min_percentage_change': [3, 5, 10], 'last_entries': [3, 4]}, horizons=(7, 30))``.
+    The price matrix is loaded once and shared with workers processes, each scoring whole combinations.
+    horizons are calendar days, see forward_returns(). Return one dict per combination with its parameters and
+    signals/mean_return/median_return/hit_rate for every horizon (suffixed with e.g. ``_7d``), best mean return
+    of the first horizon first.
+    """
+    workers = workers or getattr(settings, 'ANALYTICS_WORKERS', None) or os.cpu_count() or 1
+    combinations = [dict(zip(grid, values)) for values in product(*grid.values())]
+
+    card_ids, days, prices = load_price_matrix(cards_qs, field, since)
+    logger.info(
+        'Backtesting %d %s combinations on %d cards x %d catalogs with %d workers',
+        len(combinations),
+        rule,
+        *prices.shape,
+        workers,
+    )
+
+    # forked workers must not inherit open database connections
+    connections.close_all()
+
+    arrays = {'card_ids': card_ids, 'days': days, 'prices': prices}
+    with SharedPriceHistory.publish(['prices'], arrays) as matrix:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_attach_backtest_worker, initargs=(matrix.spec(), horizons)
+        ) as pool:
+            chunksize = max(1, len(combinations) // (workers * 4))
+            results = list(
+                pool.map(_backtest_parameters, [rule] * len(combinations), combinations, chunksize=chunksize)
+            )
+
+    sort_key = f'mean_return_{horizons[0]}d'
+    results.sort(key=lambda result: -math.inf if math.isnan(result[sort_key]) else result[sort_key], reverse=True)
+    return results
@@ -0,0 +1,98 @@
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+from prices.models import MTGPriceHistoryVersion
+
+
+class PriceHistoryCache:
+    """
+    Per-process LRU cache of decoded price histories.
+
+    Entries are keyed by (cm_id, field, window) and tagged with MTGPriceHistoryVersion, bumped by the ingest,
+    the archive and the retention jobs, so everything cached is dropped once stored prices change. Memory is
+    bounded by the total number of price points held; the least recently used histories are evicted first.
+    The version is re-read at most every version_ttl seconds to keep lookups off the database.
+    """
+
+    def __init__(self, max_points=None, version_ttl=None):
+        """Size the cache, settings.PRICE_HISTORY_CACHE_POINTS and PRICE_HISTORY_CACHE_TTL by default."""
+        self.max_points = max_points or settings.PRICE_HISTORY_CACHE_POINTS
+        self.version_ttl = settings.PRICE_HISTORY_CACHE_TTL if version_ttl is None else version_ttl
+        self.entries = OrderedDict()
+        self.points = 0
+        self.version = None
+        self.version_checked = 0
+        self.counters = Counter()  # hits, misses, evictions
+
+    def __len__(self):
+        """Return the number of cached histories."""
+        return len(self.entries)
+
+    def check_version(self):
+        """Drop every entry if stored prices changed since they were cached."""
+
+        now = time.monotonic()
+        if self.version is not None and now - self.version_checked < self.version_ttl:
+            return
+
+        version = MTGPriceHistoryVersion.current()
+        if version != self.version:
+            self.clear()
+            self.version = version
+        self.version_checked = now
+
+    def get(self, key):
+        """Return the cached history for key (or None), marking it as recently used."""
+
+        self.check_version()
+        history = self.entries.get(key)
+        if history is None:
+            self.counters['misses'] += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.counters['hits'] += 1
+        return history
+
+    def set(self, key, history):
+        """Store a history as an immutable tuple and evict old entries beyond the point budget."""
+
+        self.check_version()
+        history = tuple(history)
+        if len(history) > self.max_points:
+            return
+
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.points -= len(previous)
+
+        self.entries[key] = history
+        self.points += len(history)
+        while self.points > self.max_points:
+            _, evicted = self.entries.popitem(last=False)
+            self.points -= len(evicted)
+            self.counters['evictions'] += 1
+
+    def clear(self):
+        """Remove all entries, keeping the counters."""
+
+        self.entries.clear()
+        self.points = 0
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+
+        hits, misses = self.counters['hits'], self.counters['misses']
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0,
+            'evictions': self.counters['evictions'],
+            'entries': len(self.entries),
+            'points': self.points,
+        }
+
+
+price_history_cache = PriceHistoryCache()
@@ -1,3 +1,4 @@
+from django import forms
 from django.db import models
 
 
@@ -27,3 +28,38 @@ class BaseAbstractModel(models.Model):
         """Meta."""
 
         abstract = True
+
+
+class CentsField(models.Field):
+    """
+    Euro amount stored as a 4-byte integer number of cents, read and written as a float of euros.
+
+    Lookups take euros too (``trend__gt=0.01`` compares against 1 cent). Its internal type is its own rather
+    than IntegerField, so Avg(), Sum(), Min() and Max() resolve to this field without being truncated to
+    integers and come back in euros as well. Raw SQL sees cents.
+    """
+
+    description = "Euro amount in integer cents"
+
+    def db_type(self, connection):
+        """Store as the database's 4-byte integer column."""
+        return connection.data_types['IntegerField']
+
+    def from_db_value(self, value, expression, connection):  # pylint: disable=unused-argument
+        """Return cents read from the database as euros."""
+        return None if value is None else value / 100
+
+    def to_python(self, value):
+        """Return value as a float of euros."""
+        return None if value in (None, '') else float(value)
+
+    def get_prep_value(self, value):
+        """Return euros as the integer number of cents stored."""
+        value = super().get_prep_value(value)
+        return None if value is None else round(float(value) * 100)
+
+    def formfield(self, form_class=None, choices_form_class=None, **kwargs):
+        """Edit as a float of euros."""
+        return super().formfield(
+            form_class=form_class or forms.FloatField, choices_form_class=choices_form_class, **kwargs
+        )
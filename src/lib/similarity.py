@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+
+from lib.analytics import recent_catalogs_start
+from lib.backtest import load_price_matrix
+from prices.models import MTGCardPrice
+
+logger = logging.getLogger(__name__)
+
+
+def log_returns(prices, last_prices=None):
+    """
+    Return the daily log returns of a (cards x catalogs) price matrix, oldest first, as float32.
+
+    Missing or non positive prices carry the previous price forward, so gaps count as no move. last_prices
+    are the prices preceding the first column (NaN when unknown).
+    """
+    if last_prices is None:
+        last_prices = np.full(len(prices), np.nan)
+
+    filled = np.column_stack([last_prices, np.where(prices > 0, prices, np.nan)])
+    for column in range(1, filled.shape[1]):
+        missing = np.isnan(filled[:, column])
+        filled[missing, column] = filled[missing, column - 1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.log(filled[:, 1:] / filled[:, :-1])
+    returns[~np.isfinite(returns)] = 0
+    return returns.astype(np.float32), filled[:, -1]
+
+
+class SimilarityIndex:
+    """
+    Price behaviour of every card as aligned daily log returns over the latest window catalogs.
+
+    Rows of ``matrix`` are the returns centered and scaled to unit length, so the dot product of two rows is
+    the Pearson correlation of the two cards and a single matrix product ranks the whole catalog. Cards with
+    fewer than ``min_moves`` price moves in the window get an all-zero row and never match.
+    """
+
+    def __init__(self, card_ids, returns, last_prices, last_date, field, min_moves=5):
+        """Index the (cards x window) returns of card_ids, last_prices being the prices of last_date."""
+        self.card_ids = np.asarray(card_ids, dtype=np.int64)
+        self.returns = np.asarray(returns, dtype=np.float32)
+        self.last_prices = np.asarray(last_prices, dtype=np.float64)
+        self.last_date = last_date
+        self.field = field
+        self.min_moves = min_moves
+        self.positions = {card_id: position for position, card_id in enumerate(self.card_ids.tolist())}
+        self.matrix = self.normalize(self.returns, min_moves)
+
+    def __len__(self):
+        """Return the number of indexed cards."""
+        return len(self.card_ids)
+
+    @property
+    def window(self):
+        """Return the number of daily returns per card."""
+        return self.returns.shape[1]
+
+    @staticmethod
+    def normalize(returns, min_moves):
+        """Center and scale every row of returns to unit length, zeroing rows with too few moves."""
+        centered = returns - returns.mean(axis=1, keepdims=True)
+        norms = np.linalg.norm(centered, axis=1, keepdims=True)
+        enough = ((returns != 0).sum(axis=1, keepdims=True) >= min_moves) & (norms > 0)
+        return np.where(enough, centered / np.where(norms > 0, norms, 1), 0).astype(np.float32)
+
+    @classmethod
+    def build(cls, window=None, field=None):
+        """Build the index from the latest window + 1 price catalogs with a single query."""
+        window = window or settings.SIMILARITY_WINDOW
+        field = field or settings.PRICE_FIELD
+
+        card_ids, _, prices = load_price_matrix(field=field, since=recent_catalogs_start(window + 1))
+        returns, last_prices = log_returns(prices[:, 1:], prices[:, 0])
+        last_date = MTGCardPrice.objects.aggregate(Max('catalog_date'))['catalog_date__max']
+        logger.info('Similarity index built for %d cards over %d returns', len(card_ids), returns.shape[1])
+        return cls(card_ids, returns, last_prices, last_date, field)
+
+    def refresh(self):
+        """
+        Slide the window over the catalogs ingested since last_date, reading only their prices.
+
+        Every new catalog appends one return column and drops the oldest; cards first seen are appended with
+        zero returns. Return the number of catalogs applied.
+        """
+        catalog_dates = list(
+            MTGCardPrice.objects.filter(catalog_date__gt=self.last_date)
+            .order_by('catalog_date')
+            .values_list('catalog_date', flat=True)
+            .distinct()
+        )
+        for catalog_date in catalog_dates:
+            lookup = MTGCardPrice.price_lookup(self.field)
+            rows = dict(
+                MTGCardPrice.objects.filter(catalog_date=catalog_date, **{f'{lookup}__isnull': False}).values_list(
+                    'card_id', lookup
+                )
+            )
+            new_ids = np.array(sorted(set(rows) - set(self.positions)), dtype=np.int64)
+            if len(new_ids):
+                self._append_cards(new_ids)
+
+            prices = np.array([rows.get(card_id, np.nan) for card_id in self.card_ids.tolist()], dtype=np.float64)
+            column, self.last_prices = log_returns(prices[:, None], self.last_prices)
+            self.returns = np.hstack([self.returns[:, 1:], column])
+            self.last_date = catalog_date
+
+        if catalog_dates:
+            self.matrix = self.normalize(self.returns, self.min_moves)
+        return len(catalog_dates)
+
+    def _append_cards(self, new_ids):
+        """Append zero return rows for cards the index has not seen yet."""
+        self.positions.update({card_id: len(self.card_ids) + i for i, card_id in enumerate(new_ids.tolist())})
+        self.card_ids = np.concatenate([self.card_ids, new_ids])
+        self.returns = np.vstack([self.returns, np.zeros((len(new_ids), self.window), dtype=np.float32)])
+        self.last_prices = np.concatenate([self.last_prices, np.full(len(new_ids), np.nan)])
+
+    def similar_many(self, card_ids, k=10, batch_size=256):
+        """
+        Return {card_id: [(similar card_id, correlation), ...]} with the k best matches of each card.
+
+        Queries are answered batch_size at a time with one matrix product against the whole index.
+        Unknown cards map to an empty list.
+        """
+        known = [card_id for card_id in card_ids if card_id in self.positions]
+        results = {card_id: [] for card_id in card_ids}
+        known = iter(known)
+        while batch := list(islice(known, batch_size)):
+            rows = np.array([self.positions[card_id] for card_id in batch])
+            scores = self.matrix[rows] @ self.matrix.T
+            scores[np.arange(len(rows)), rows] = -np.inf  # a card is not similar to itself
+
+            top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+            for card_id, row_scores, row_top in zip(batch, scores, top):
+                best = row_top[np.argsort(-row_scores[row_top])]
+                results[card_id] = [(int(self.card_ids[i]), float(row_scores[i])) for i in best if row_scores[i] > 0]
+        return results
+
+    def similar(self, card_id, k=10):
+        """Return the k cards whose price moves correlate best with card_id, as (card_id, correlation)."""
+        return self.similar_many([card_id], k)[card_id]
+
+    def save(self, path=None):
+        """
+        Write the index to path (settings.SIMILARITY_INDEX_DIR): .npy arrays in a version directory, a JSON header.
+
+        The arrays go to a new version directory and the header naming it is swapped in last, so a reader never
+        mixes arrays of two versions. Older versions are removed afterwards; processes holding one memory-mapped
+        keep reading it intact.
+        """
+        path = Path(path or settings.SIMILARITY_INDEX_DIR)
+        version = f'{self.last_date:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}'
+        (path / version).mkdir(parents=True)
+        arrays = {
+            'card_ids': self.card_ids,
+            'returns': self.returns,
+            'last_prices': self.last_prices,
+            'matrix': self.matrix,
+        }
+        for name, array in arrays.items():
+            np.save(path / version / f'{name}.npy', array)
+
+        meta = {
+            'version': version,
+            'last_date': self.last_date.isoformat(),
+            'field': self.field,
+            'min_moves': self.min_moves,
+        }
+        (path / 'index.json.tmp').write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(path / 'index.json.tmp', path / 'index.json')
+
+        for entry in path.iterdir():
+            if entry.is_dir() and entry.name != version:
+                shutil.rmtree(entry, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path=None):
+        """Read an index written by save(), None when there is none."""
+        path = Path(path or settings.SIMILARITY_INDEX_DIR)
+        if not (path / 'index.json').exists():
+            return None
+
+        meta = json.loads((path / 'index.json').read_text(encoding='utf-8'))
+        if 'version' not in meta:
+            return None  # written before versions, rebuilt
+        arrays = path / meta['version']
+        index = cls.__new__(cls)
+        index.card_ids = np.load(arrays / 'card_ids.npy')
+        index.returns = np.load(arrays / 'returns.npy')
+        index.last_prices = np.load(arrays / 'last_prices.npy')
+        index.matrix = np.load(arrays / 'matrix.npy', mmap_mode='r')
+        index.last_date = datetime.fromisoformat(meta['last_date'])
+        index.field = meta['field']
+        index.min_moves = meta['min_moves']
+        index.positions = {card_id: position for position, card_id in enumerate(index.card_ids.tolist())}
+        return index
+
+
+def refresh_similarity_index(path=None):
+    """Slide the stored similarity index to the latest catalog and save it, building it when missing or outdated."""
+    index = SimilarityIndex.load(path)
+    if index is None or index.field != settings.PRICE_FIELD or index.window != settings.SIMILARITY_WINDOW:
+        index = SimilarityIndex.build()
+    else:
+        index.refresh()
+    index.save(path)
+    return index
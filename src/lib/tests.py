@@ -1,3 +1,522 @@
-# from django.test import TestCase
+import math
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from pathlib import Path
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Max, Min, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from lib.analytics import (
+    SharedPriceHistory,
+    SlidingRegression,
+    linear_slope,
+    run_card_stats,
+)
+from lib.backtest import forward_returns, trend_signals
+from lib.cache import PriceHistoryCache, price_history_cache
+from lib.similarity import SimilarityIndex
+from lib.utils import (
+    fetch_latest_prices,
+    find_spiking_cards,
+    get_leaderboard,
+    get_top_20_cards_by_slope,
+    price_increase_ranking,
+    price_slope,
+    rank_card_by_price,
+    rank_cards_by_price,
+    rebuild_leaderboards,
+    update_card_slopes,
+    update_rolling_stats,
+    update_slope_states,
+)
+from prices.benchmarks import create_synthetic_export_dataset
+from prices.constants import LEGAL_PREMODERN_SETS
+from prices.ingest import update_latest_prices
+from prices.models import (
+    Catalog,
+    MTGCard,
+    MTGCardLeaderboard,
+    MTGCardPrice,
+    MTGCardPriceRollup,
+    MTGCardPriceSlope,
+    MTGCardPriceSlopeState,
+    MTGCardRollingStats,
+    MTGPriceArchive,
+    MTGPriceHistoryVersion,
+    MTGSet,
+)
+from prices.partitions import archive_prices
+from prices.retention import rollup_prices
+
+
+class LeaderboardTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Price 120 synthetic premodern cards over 35 catalogs and build their leaderboards."""
+        cur_date = create_synthetic_export_dataset(metacards=120, prints=1, catalogs=35)
+        update_latest_prices(list(MTGCardPrice.objects.filter(catalog_date=cur_date)), cur_date)
+        update_card_slopes(MTGCard.objects.all())
+        rebuild_leaderboards(formats=['premodern'])
+
+    def test_board_matches_live_query(self):
+        """Every gainers board holds what get_top_20_cards_by_slope() returns for the same tier and interval."""
+        cards = MTGCard.objects.filter(expansion_id__in=LEGAL_PREMODERN_SETS).exclude(expansion__code__startswith='X')
+        for interval_days in settings.SLOPE_INTERVALS:
+            for min_price in settings.LEADERBOARD_MIN_PRICES:
+                with self.subTest(interval_days=interval_days, min_price=min_price):
+                    expected = get_top_20_cards_by_slope(cards, min_price, interval_days)
+                    self.assertTrue(expected)
+                    self.assertEqual(get_leaderboard('premodern', interval_days, min_price), expected)
+
+    def test_losers_are_falling(self):
+        """Losers boards only hold cards whose price fell."""
+        losers = get_leaderboard('premodern', 7, 1, direction=MTGCardLeaderboard.LOSERS)
+        self.assertTrue(losers)
+        self.assertTrue(all(percent_change < 0 for _, percent_change, *_ in losers))
+
+    def test_unknown_board(self):
+        """Intervals and min prices without a board are refused."""
+        with self.assertRaises(ValueError):
+            get_leaderboard('premodern', interval_days=5)
+        with self.assertRaises(ValueError):
+            get_leaderboard('premodern', min_price=2)
+
+
+class PriceHistoryCacheTestCase(TestCase):
+    def test_version_bump_drops_entries(self):
+        """Histories cached before stored prices change are not served after."""
+        cache = PriceHistoryCache(max_points=10, version_ttl=0)
+        cache.set((1, 'trend', 7), [(1, 2.0)])
+        self.assertEqual(cache.get((1, 'trend', 7)), ((1, 2.0),))
+
+        MTGPriceHistoryVersion.bump()
+        self.assertIsNone(cache.get((1, 'trend', 7)))
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_point_budget(self):
+        """The least recently used histories are evicted beyond max_points."""
+        cache = PriceHistoryCache(max_points=3, version_ttl=60)
+        cache.set('a', [1, 2])
+        cache.set('b', [3])
+        cache.get('a')
+        cache.set('c', [4])
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class RollingStatsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Price 20 synthetic cards over 40 catalogs."""
+        cls.cur_date = create_synthetic_export_dataset(metacards=20, prints=1, catalogs=40)
+
+    def test_latest_prices_and_windows(self):
+        """Every card priced in the latest catalog gets one row per window, at its latest price."""
+        upserted, _ = update_rolling_stats()
+        latest = dict(MTGCardPrice.objects.filter(catalog_date=self.cur_date).values_list('card_id', 'trend'))
+        self.assertEqual(upserted, len(latest) * len(settings.ROLLING_WINDOWS))
+        for stats in MTGCardRollingStats.objects.all():
+            self.assertAlmostEqual(stats.price, latest[stats.card_id])
+            self.assertIsNotNone(stats.ema)
+
+        self.assertEqual(update_rolling_stats(), (upserted, 0))
+
+
+class BacktestTestCase(SimpleTestCase):
+    def test_forward_returns_in_days(self):
+        """Horizons are calendar days: a missing catalog does not stretch them, the end has no return."""
+        days = np.array([0.4, 1.4, 3.4, 4.4])  # no catalog on day 2
+        prices = np.array([[1.0, 2.0, 4.0, 5.0]])
+        returns = forward_returns(prices, days, 2)
+        np.testing.assert_allclose(returns, [[300.0, 100.0, np.nan, np.nan]])
+
+    def test_trend_signals(self):
+        """A card signals once the slope of its last window catalogs reaches the threshold."""
+        days = np.arange(5, dtype=float)
+        prices = np.array([[1.0, 1.0, 1.0, 2.0, 3.0], [3.0, 2.0, 1.0, 1.0, 1.0]])
+        signals = trend_signals(prices, days, window=3, slope_threshold=0.5)
+        np.testing.assert_array_equal(signals, [[False, False, False, True, True], [False] * 5])
+
+
+class SlidingRegressionTestCase(SimpleTestCase):
+    def test_slide_matches_linear_slope(self):
+        """Slopes slid point by point, evicting and rebasing, match linear_slope over the same window."""
+        rng = np.random.default_rng(0)
+        days = 20_000 + np.cumsum(rng.uniform(0.3, 1.7, 60))  # days since the epoch, as stored
+        prices = 10 + np.cumsum(rng.normal(0, 0.5, 60))
+
+        regression = SlidingRegression()
+        for index, (day, price) in enumerate(zip(days, prices)):
+            regression.slide(day, price, 7)
+            if index == 30:  # as stored in and read back from an MTGCardPriceSlopeState
+                regression = SlidingRegression(regression.points, regression.origin, regression.sums)
+
+            window = days[: index + 1] >= np.floor(day) - 7
+            self.assertEqual(len(regression), window.sum())
+            self.assertEqual(regression.origin, days[: index + 1][window][0])
+            if window.sum() > 1:
+                expected = linear_slope(days[: index + 1][window] - regression.origin, prices[: index + 1][window])
+                self.assertAlmostEqual(regression.slope(), expected, places=9)
+        self.assertLess(len(regression), 20)
+
+
+class SlopeStatesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Price three cards over 40 daily catalogs, with gaps, and build their slope states."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        MTGCard.objects.bulk_create(
+            MTGCard(
+                cm_id=cm_id, name=f'Card {cm_id}', expansion=expansion, metacard_id=cm_id, cm_date_added=timezone.now()
+            )
+            for cm_id in (1, 2, 3)
+        )
+        cls.first = datetime(2026, 1, 1, 10, tzinfo=dt_timezone.utc)
+        MTGCardPrice.objects.bulk_create(price for day in range(40) for price in cls.catalog_prices(day))
+        catalog_date = cls.first + timedelta(days=39)
+        update_latest_prices(list(MTGCardPrice.objects.filter(catalog_date=catalog_date)), catalog_date)
+        update_card_slopes(MTGCard.objects.all())
+
+    @classmethod
+    def catalog_prices(cls, day):
+        """Return the unsaved prices of the catalog of day, low missing for card 2 every fifth day."""
+        return [
+            MTGCardPrice(
+                card_id=cm_id,
+                catalog_date=cls.first + timedelta(days=day, hours=day % 3),
+                trend=cm_id + math.sin(day / 3) + day / 10,
+                low=None if cm_id == 2 and day % 5 == 0 else cm_id + math.cos(day / 4),
+            )
+            for cm_id in (1, 2, 3)
+        ]
+
+    @staticmethod
+    def stored_slopes():
+        """Return {(card_id, price_field, interval_days): (slope, percent_change, initial, final price)}."""
+        return {
+            (card_id, field, days): values
+            for card_id, field, days, *values in MTGCardPriceSlope.objects.values_list(
+                'card_id', 'price_field', 'interval_days', 'slope', 'percent_change', 'initial_price', 'final_price'
+            )
+        }
+
+    def test_slide_matches_rebuild(self):
+        """Sliding the stored states over one new catalog gives the slopes of a full rebuild."""
+        prices = MTGCardPrice.objects.bulk_create(self.catalog_prices(40))
+        catalog_date = prices[0].catalog_date
+        update_latest_prices(prices, catalog_date)
+
+        update_slope_states(catalog_date)
+        slid = self.stored_slopes()
+        self.assertTrue(MTGCardPriceSlopeState.objects.filter(last_date=catalog_date).exists())
+
+        MTGCardPriceSlope.objects.all().delete()
+        MTGCardPriceSlopeState.objects.all().delete()
+        update_card_slopes(MTGCard.objects.all())
+        rebuilt = self.stored_slopes()
+
+        self.assertEqual(slid.keys(), rebuilt.keys())
+        for key, values in rebuilt.items():
+            with self.subTest(key=key):
+                np.testing.assert_allclose(slid[key], values, rtol=1e-9)
+
+
+class SimilarityIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        """Index three cards, the first two moving together."""
+        moves = np.tile([0.1, -0.1, 0.2, -0.05, 0.1, -0.2], 2)
+        returns = np.array([moves, moves * 2, moves[::-1]], dtype=np.float32)
+        self.index = SimilarityIndex([10, 20, 30], returns, [1.0, 2.0, 3.0], timezone.now(), 'trend')
+        self.path = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_similar(self):
+        """Cards are ranked by the correlation of their returns and never match themselves."""
+        (card_id, correlation), *_ = self.index.similar(10)
+        self.assertEqual(card_id, 20)
+        self.assertAlmostEqual(correlation, 1.0, places=5)
+
+    def test_save_replaces_the_version(self):
+        """A save swaps in a complete new version and removes the previous one."""
+        self.index.save(self.path)
+        self.index.save(self.path)
+        self.assertEqual(len([entry for entry in self.path.iterdir() if entry.is_dir()]), 1)
+
+        loaded = SimilarityIndex.load(self.path)
+        self.assertEqual(loaded.card_ids.tolist(), [10, 20, 30])
+        self.assertEqual(loaded.similar(10), self.index.similar(10))
+
+
+class RankCardsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Price a rising, a falling and a rising but cheap card on every ranked field over four daily catalogs."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        cls.cards = MTGCard.objects.bulk_create(
+            MTGCard(
+                cm_id=cm_id, name=f'Card {cm_id}', expansion=expansion, metacard_id=cm_id, cm_date_added=timezone.now()
+            )
+            for cm_id in (1, 2, 3)
+        )
+        now = timezone.now()
+        walks = {1: [2.0, 3.0, 4.0, 5.0], 2: [5.0, 4.0, 3.0, 2.0], 3: [0.2, 0.3, 0.4, 0.5]}
+        for day in range(4):
+            catalog_date = now - timedelta(days=3 - day)
+            Catalog.objects.create(catalog_date=catalog_date, catalog_type=Catalog.PRICES, md5sum=f'{day:032d}')
+            MTGCardPrice.objects.bulk_create(
+                MTGCardPrice(
+                    card_id=cm_id,
+                    catalog_date=catalog_date,
+                    **dict.fromkeys(('avg', 'avg1', 'low', 'trend'), walk[day]),
+                )
+                for cm_id, walk in walks.items()
+            )
+
+    def setUp(self):
+        """Start every test with an empty price history cache of the current version."""
+        price_history_cache.clear()
+        price_history_cache.check_version()
+
+    def test_rising_cards(self):
+        """Only cards rising on every field above the minimum price are ranked, by their mean increase."""
+        self.assertEqual(rank_cards_by_price([1, 2, 3], 7), {1: 150.0})
+        self.assertEqual(rank_card_by_price(self.cards[0], 7), 150.0)
+        self.assertEqual(rank_card_by_price(self.cards[1], 7), 0)
+
+    def test_constant_queries(self):
+        """Ranking many cards takes as many queries as ranking one."""
+        with CaptureQueriesContext(connection) as one:
+            rank_cards_by_price([1], 7)
+        price_history_cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            rank_cards_by_price([1, 2, 3], 7)
+        self.assertEqual(len(many), len(one))
+
+
+class CardStatsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Price cards of different history sizes, created out of card id order, over five daily catalogs."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        walks = {
+            9: [2.0, 2.5, 3.0, 3.5, 4.0],
+            2: [1.5, 2.0, None, 3.0, 3.5],
+            5: [6.0, 5.0, 4.0, 3.0, 2.0],
+            7: [None, None, 2.0, 2.2, 2.6],
+            4: [0.2, 0.3, 0.4, 0.5, 0.6],
+        }
+        cls.cards = MTGCard.objects.bulk_create(
+            MTGCard(
+                cm_id=cm_id, name=f'Card {cm_id}', expansion=expansion, metacard_id=cm_id, cm_date_added=timezone.now()
+            )
+            for cm_id in walks
+        )
+        now = timezone.now()
+        for day in range(5):
+            catalog_date = now - timedelta(days=4 - day, hours=1)
+            Catalog.objects.create(catalog_date=catalog_date, catalog_type=Catalog.PRICES, md5sum=f'{day:032d}')
+            MTGCardPrice.objects.bulk_create(
+                MTGCardPrice(
+                    card_id=cm_id,
+                    catalog_date=catalog_date,
+                    avg=walk[day],
+                    avg1=walk[day],
+                    low=None if cm_id == 2 and day == 1 else walk[day],
+                    trend=walk[day],
+                )
+                for cm_id, walk in walks.items()
+                if walk[day] is not None
+            )
+
+    def setUp(self):
+        """Start every test with an empty price history cache of the current version."""
+        price_history_cache.clear()
+        price_history_cache.check_version()
+
+    @staticmethod
+    def per_card_stats(card, days):
+        """Return (increase, slope) of one card as show_stats() computed them card by card."""
+        slope = price_slope(card, days)
+        last_price = card.prices.filter(catalog_date__gte=timezone.now() - timedelta(days=days)).latest('catalog_date')
+        if last_price.trend and last_price.trend < 1:
+            return 0, slope
+
+        increases = []
+        for field in ('avg', 'avg1', 'low', 'trend'):
+            increase = price_increase_ranking(card, field, days)
+            if increase < 1:
+                return 0, slope
+            increases.append(increase)
+        return sum(increases) / len(increases), slope
+
+    def test_card_rows(self):
+        """Cards are stored in card id order, each with its own prices oldest first."""
+        fields = ['low', 'trend']
+        with SharedPriceHistory.from_queryset(MTGCard.objects.all(), fields, last_catalogs=5) as history:
+            self.assertEqual(list(history.card_ids), [2, 4, 5, 7, 9])
+            for index, card_id in enumerate(history.card_ids):
+                days, values = history.card_rows(index)
+                prices = MTGCardPrice.objects.filter(card_id=card_id).order_by('catalog_date')
+                self.assertEqual(len(days), prices.count())
+                self.assertTrue((np.diff(days) > 0).all())
+                for field in fields:
+                    expected = [np.nan if price is None else price for price in prices.values_list(field, flat=True)]
+                    np.testing.assert_allclose(values[field], expected)
+
+    def test_matches_per_card_stats(self):
+        """The shared history workers return, in card id order, the stats of the former per-card computation."""
+        results = run_card_stats(MTGCard.objects.all(), 5, workers=2)
+        self.assertEqual([card_id for card_id, _, _ in results], [2, 4, 5, 7, 9])
+
+        cards = {card.pk: card for card in self.cards}
+        for card_id, increase, slope in results:
+            with self.subTest(card_id=card_id):
+                expected_increase, expected_slope = self.per_card_stats(cards[card_id], 5)
+                self.assertAlmostEqual(increase, expected_increase)
+                self.assertAlmostEqual(slope, expected_slope)
+        self.assertEqual({card_id for card_id, increase, _ in results if increase}, {2, 7, 9})
+
+
+class SpikingCardsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Price cards over five daily catalogs, oldest first, some rising faster every day."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        walks = {
+            1: [3.0, 3.2, 3.5, 4.0, 5.0],  # accelerating
+            2: [3.0, 3.5, 4.0, 4.3, 4.5],  # slowing down
+            3: [1.0, 1.0, 1.2, 1.5, 2.0],  # below min_price
+            4: [4.0, 4.0, None, 5.0, 6.5],  # missing price
+            5: [10.0, 10.0, 10.0, 10.2, 11.0],
+            6: [6.0, 4.0, 5.0, 5.6, 6.6],  # accelerating over the last three prices only
+            7: [4.0, 4.0, 4.1, 4.3, 4.55],  # enough difference from the fourth newest price only
+            8: [None, None, None, 5.0, 7.0],  # two prices
+        }
+        MTGCard.objects.bulk_create(
+            MTGCard(
+                cm_id=cm_id, name=f'Card {cm_id}', expansion=expansion, metacard_id=cm_id, cm_date_added=timezone.now()
+            )
+            for cm_id in walks
+        )
+        first = datetime(2026, 1, 1, 10, tzinfo=dt_timezone.utc)
+        MTGCardPrice.objects.bulk_create(
+            MTGCardPrice(card_id=cm_id, catalog_date=first + timedelta(days=day), trend=walk[day])
+            for cm_id, walk in walks.items()
+            for day in range(5)
+            if not (cm_id == 8 and walk[day] is None)
+        )
+
+    @staticmethod
+    def per_card_spikes(card_qs, min_price=3, min_percentage_change=5, factor=1.0, min_price_difference=0.50):
+        """Return (card_id, current, previous, earliest, difference) as find_spiking_cards() did card by card."""
+        spikes = []
+        for card in card_qs:
+            prices = list(card.prices.order_by('-catalog_date')[:3])
+            if len(prices) < 3 or any(price.trend is None for price in prices):
+                continue
+            current_price, previous_price, earliest_price = (price.trend for price in prices)
+            percentage_change = (current_price - previous_price) / previous_price * 100 if previous_price != 0 else 0
+            if (
+                current_price > min_price
+                and percentage_change >= min_percentage_change
+                and current_price - previous_price >= factor * (previous_price - earliest_price)
+                and current_price - earliest_price > min_price_difference
+            ):
+                spikes.append((card.pk, current_price, previous_price, earliest_price, current_price - earliest_price))
+        return sorted(spikes, key=lambda spike: spike[4], reverse=True)
+
+    def test_latest_prices(self):
+        """The latest prices come newest first, NaN where missing or beyond the history of a card."""
+        card_ids, prices = fetch_latest_prices(MTGCard.objects.all(), 'trend', 4)
+        latest = dict(zip(card_ids.tolist(), prices))
+        np.testing.assert_array_equal(latest[1], [5.0, 4.0, 3.5, 3.2])
+        np.testing.assert_array_equal(latest[4], [6.5, 5.0, np.nan, 4.0])
+        np.testing.assert_array_equal(latest[8], [7.0, 5.0, np.nan, np.nan])
+
+    def test_three_entries_match_per_card_rules(self):
+        """With three entries the spikes are those of the former per-card loop."""
+        spikes = [(card.pk, *values) for card, *values in find_spiking_cards(MTGCard.objects.all(), last_entries=3)]
+        expected = self.per_card_spikes(MTGCard.objects.all())
+        self.assertEqual([spike[0] for spike in spikes], [6, 1, 5])
+        self.assertEqual([spike[0] for spike in spikes], [spike[0] for spike in expected])
+        for spike, expected_spike in zip(spikes, expected):
+            np.testing.assert_allclose(spike[1:], expected_spike[1:])
+
+    def test_longer_windows(self):
+        """Beyond three entries every increase must beat the one before it and the earliest price is the oldest."""
+        spikes = {card.pk: values for card, *values in find_spiking_cards(MTGCard.objects.all(), last_entries=4)}
+        self.assertEqual(set(spikes), {1, 5, 7})
+        current_price, previous_price, earliest_price, price_difference = spikes[7]
+        self.assertEqual((current_price, previous_price, earliest_price), (4.55, 4.3, 4.0))
+        self.assertAlmostEqual(price_difference, 0.55)
+
+
+class CentsFieldTestCase(TransactionTestCase):
+    def setUp(self):
+        """Price one card, a foil price included, in three catalogs of December 2025."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        MTGCard.objects.create(cm_id=1, name='Card', expansion=expansion, metacard_id=1, cm_date_added=timezone.now())
+        self.dates = [datetime(2025, 12, day, 10, tzinfo=dt_timezone.utc) for day in (1, 2, 3)]
+        self.trends = [1.23, 4.56, 0.07]
+        MTGCardPrice.objects.bulk_create(
+            MTGCardPrice(card_id=1, catalog_date=date, trend=trend, low=None if day else 0.99, trend_foil=trend * 10)
+            for day, (date, trend) in enumerate(zip(self.dates, self.trends))
+        )
+        self.before = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+    def test_lookups(self):
+        """Lookups compare euros."""
+        prices = MTGCardPrice.objects.all()
+        self.assertEqual(prices.filter(trend__gte=1.23).count(), 2)
+        self.assertEqual(prices.filter(trend=4.56).get().catalog_date, self.dates[1])
+        self.assertEqual(prices.filter(trend__lt=0.1).count(), 1)
+        self.assertEqual(prices.filter(trend__gte=3).count(), 1)
+        self.assertEqual(prices.filter(**{f"{MTGCardPrice.price_lookup('trend_foil')}__gte": 12.3}).count(), 2)
+
+    def test_aggregates(self):
+        """Avg, Sum, Min and Max come back in euros, Avg not truncated to whole cents."""
+        aggregates = MTGCardPrice.objects.aggregate(Avg('trend'), Sum('trend'), Min('trend'), Max('trend'))
+        self.assertAlmostEqual(aggregates['trend__avg'], sum(self.trends) / 3)
+        self.assertAlmostEqual(aggregates['trend__sum'], 5.86)
+        self.assertEqual(aggregates['trend__min'], 0.07)
+        self.assertEqual(aggregates['trend__max'], 4.56)
+
+    def test_values_list(self):
+        """values_list() reads euros, raw SQL cents."""
+        prices = MTGCardPrice.objects.order_by('catalog_date')
+        self.assertEqual(list(prices.values_list('trend', flat=True)), self.trends)
+        self.assertEqual(list(prices.values_list('low', flat=True)), [0.99, None, None])
+        self.assertEqual(
+            list(prices.values_list(MTGCardPrice.price_lookup('trend_foil'), flat=True)), [12.3, 45.6, 0.7]
+        )
+        table = connection.ops.quote_name(MTGCardPrice._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT trend FROM {table} ORDER BY catalog_date')  # nosec B608  # nosemgrep
+            self.assertEqual([cents for cents, in cursor.fetchall()], [123, 456, 7])
+
+    def test_rollups_and_archives(self):
+        """Rollups and archived months are read back in euros, like the live prices."""
+        fields = ['trend', 'low', 'trend_foil']
+        daily = list(MTGCardPrice.objects.history(fields, daily=True))
+        self.assertEqual([row[2] for row in daily], self.trends)
+
+        rollup_prices(before=self.before)
+        month = MTGCardPriceRollup.objects.get(period=MTGCardPriceRollup.MONTH, price_field='trend')
+        self.assertEqual((month.open, month.close, month.min, month.max), (1.23, 0.07, 0.07, 4.56))
+        self.assertAlmostEqual(month.mean, round(sum(self.trends) / 3, 2))
+        self.assertEqual([row[2] for row in MTGCardPrice.objects.history(['trend'])], [0.07])
+
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(PRICE_ARCHIVE_DIR=str(directory)):
+            self.assertEqual(archive_prices(before=self.before), 3)
+        self.assertFalse(MTGCardPrice.objects.exists())
+        self.assertEqual(list(MTGPriceArchive.objects.get().price_rows(fields)), daily)
+        self.assertEqual(list(MTGCardPrice.objects.history(fields, daily=True)), daily)
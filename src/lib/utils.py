@@ -1,45 +1,69 @@
 import logging
+import math
 import statistics
 from collections import defaultdict
-from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import timedelta
+from itertools import islice, product
 
+import numpy as np
+import pandas as pd
 import pytz
 from django.conf import settings
-from django.db.models import OuterRef, Prefetch, Subquery
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 from tqdm.auto import tqdm
 
-from prices.constants import LEGAL_PREMODERN_SETS
-from prices.models import MTGCard, MTGCardPrice, MTGCardPriceSlope
+from lib.analytics import (
+    SECONDS_PER_DAY,
+    SlidingRegression,
+    ema_fold,
+    linear_slope,
+    recent_catalogs_start,
+    rising_increase,
+    run_card_stats,
+    spike_mask,
+    window_stats,
+)
+from lib.cache import price_history_cache
+from lib.similarity import SimilarityIndex
+from prices.constants import FORMAT_SETS, LEGAL_PREMODERN_SETS
+from prices.models import (
+    MTGCard,
+    MTGCardLeaderboard,
+    MTGCardPrice,
+    MTGCardPriceMove,
+    MTGCardPriceSlope,
+    MTGCardPriceSlopeState,
+    MTGCardRollingStats,
+    MTGPriceIndex,
+)
 
 logger = logging.getLogger(__name__)
 germany_tz = pytz.timezone('Europe/Berlin')
 MIN_PRICE_VALUE = 1
 MIN_PERCENTAGE = 1
+_similarity_index = None  # loaded lazily by get_similar_cards()
+MOVER_CANDIDATES = 50  # stored slopes measured again by rank_movers()
 
 
-def show_stats(days=7, cards_qs=None):
+def show_stats(days=7, cards_qs=None, workers=None):
     """Show statistics for MTG cards regarding latest price changes over a specified period."""
     if not cards_qs:
         cards_qs = MTGCard.objects.filter(expansion_id__in=LEGAL_PREMODERN_SETS)
 
     always_rising = {}
     trending_cards = {}
-    logger.info('Processing stats for %d cards', cards_qs.count())
 
-    # parallelism
-    with ProcessPoolExecutor() as executor:
-        futures = {executor.submit(rank_card_by_price, card, days): ('rising', card.pk) for card in cards_qs}
-        futures.update({executor.submit(price_slope, card, days): ('trending', card.pk) for card in cards_qs})
-
-        for future in as_completed(futures):
-            task_type, card_id = futures[future]
-            result = future.result()
-            if task_type == 'rising' and result:
-                always_rising[card_id] = result
-            elif task_type == 'trending' and result >= settings.SLOPE_THRESHOLD:
-                trending_cards[card_id] = result
+    # parallelism, workers share the price history and only receive card index ranges
+    for card_id, increase, slope in run_card_stats(
+        cards_qs, days, workers=workers, min_value=MIN_PRICE_VALUE, min_percentage=MIN_PERCENTAGE
+    ):
+        if increase:
+            always_rising[card_id] = increase
+        if slope >= settings.SLOPE_THRESHOLD:
+            trending_cards[card_id] = slope
 
     logger.info('Always Rising:')
     log_sorted_cards(always_rising, "price increase")
@@ -50,29 +74,17 @@ def show_stats(days=7, cards_qs=None):
 
 def log_sorted_cards(card_dict, label):
     """Reusable function to log sorted cards by specified label."""
+    cards = MTGCard.objects.select_related('expansion', 'latest_price').in_bulk(list(card_dict))
     for card_id, value in sorted(card_dict.items(), key=lambda x: x[1], reverse=True):
-        card = MTGCard.objects.only("name").get(pk=card_id)
-        logger.info('%.2f | %s (%s)', value, card, label)
+        logger.info('%.2f | %s (%s)', value, cards[card_id], label)
 
 
 def simple_trend(price_dates, price_values):
     """Calculate the rate of price change (slope) over time using basic linear regression."""
-    num_values = len(price_dates)
-
     # Convert dates to time intervals in days
     base_date = price_dates[0]
     time_values = [(date - base_date).total_seconds() / 86400 for date in price_dates]
-
-    # Precompute sums to avoid multiple passes
-    sum_time = sum(time_values)
-    sum_price = sum(price_values)
-    sum_time_price = sum(t * p for t, p in zip(time_values, price_values))
-    sum_time_squared = sum(t * t for t in time_values)
-
-    # Calculate slope
-    numerator = num_values * sum_time_price - sum_time * sum_price
-    denominator = num_values * sum_time_squared - sum_time * sum_time
-    return numerator / denominator if denominator != 0 else 0
+    return linear_slope(time_values, price_values)
 
 
 def price_slope(card, days=None):
@@ -88,30 +100,34 @@ def price_slope(card, days=None):
 def price_increase_ranking(card, price_field, days=None):
     """Calculate percentage increase for a specified price field over a period."""
     prices = fetch_prices(card, price_field, days)
-    if len(prices) < 2 or prices[0][1] >= prices[-1][1]:
-        return 0
-
-    for i in range(1, len(prices)):
-        if prices[i][1] < prices[i - 1][1]:
-            return 0
-
-    return ((prices[-1][1] - prices[0][1]) / prices[0][1]) * 100
+    return rising_increase([price for _, price in prices])
 
 
 def fetch_prices(card, field, days):
-    """Fetch filtered prices for a specific field and days."""
+    """Fetch filtered prices for a specific field and days, served from the price history cache when possible."""
+
+    key = (card.pk, field, days)
+    cached = price_history_cache.get(key)
+    if cached is not None:
+        return list(cached)
 
     # ############# quick hack, 1 entry per day, lets count entries
     if days:
-        return list(
-            card.prices.filter(**{f"{field}__isnull": False})
+        lookup = MTGCardPrice.price_lookup(field)
+        prices = list(
+            card.prices.filter(**{f"{lookup}__isnull": False})
             .order_by('-catalog_date')
-            .values_list('catalog_date', field)[:days:-1]
+            .values_list('catalog_date', lookup)[:days:-1]
         )
+    else:
+        prices = [
+            (catalog_date, price)
+            for _, catalog_date, price in MTGCardPrice.objects.history([field], card_ids=[card.pk])
+            if price is not None
+        ]
 
-    return list(
-        card.prices.filter(**{f"{field}__isnull": False}).order_by('catalog_date').values_list('catalog_date', field)
-    )
+    price_history_cache.set(key, prices)
+    return prices
 
     # if days:
     #     days_ago = (timezone.now() - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
@@ -125,139 +141,460 @@ def fetch_prices(card, field, days):
     # )
 
 
+def fetch_price_history(cards, fields, last_catalogs=None):
+    """
+    Fetch several price fields for a batch of card ids with a single query.
+
+    Return {card_id: [(catalog_date, value_1, value_2, ...), ...]} sorted by catalog_date, with values in the
+    order of fields. When last_catalogs is given only the latest last_catalogs price catalogs are fetched, as
+    daily prices even where the window reaches into the rolled up weeks. Histories already in the price history
+    cache are not queried again.
+    """
+    fields = tuple(fields)
+    history = defaultdict(list)
+    missing = []
+    for card_id in cards:
+        cached = price_history_cache.get((card_id, fields, last_catalogs))
+        if cached is None:
+            missing.append(card_id)
+        elif cached:
+            history[card_id] = list(cached)
+
+    if not missing:
+        return history
+
+    start_date = recent_catalogs_start(last_catalogs)
+    rows = MTGCardPrice.objects.history(fields, card_ids=missing, since=start_date, daily=last_catalogs is not None)
+    for card_id, *row in rows:
+        history[card_id].append(tuple(row))
+
+    for card_id in missing:
+        price_history_cache.set((card_id, fields, last_catalogs), history.get(card_id, ()))
+    return history
+
+
 def rank_card_by_price(card, days=None):
     """Calculate the mean percentage increase across multiple price metrics for a card over a period."""
+    return rank_cards_by_price([card.pk], days).get(card.pk, 0)
 
-    price_field = settings.PRICE_FIELD
-    price_fields = ['avg', 'avg1', 'low', 'trend']
-    min_value = 1  # Minimum threshold for last price to be considered significant
-    min_percentage = 1  # Minimum threshold for percentage increase
 
-    # Get the latest price to check if it meets the minimum threshold
-    last_prices = (
-        card.prices.filter(catalog_date__gte=timezone.now() - timedelta(days=days)).order_by('-catalog_date').first()
-    )
+def rank_cards_by_price(card_ids, days):
+    """
+    Calculate the mean percentage increase across multiple price metrics for a batch of cards over a period.
 
-    # Skip card if the last low price is below min_value or missing
-    if not last_prices or (getattr(last_prices, price_field) and getattr(last_prices, price_field) < min_value):
-        return 0
+    All price fields of all cards are fetched with a single query. Return {card_id: mean increase} for the
+    cards rising on every metric.
+    """
 
-    # List to hold percentage increases for each price field
-    increase_list = []
-    for p_field in price_fields:
-        increase = price_increase_ranking(card, p_field, days)
-        if increase < min_percentage:
-            return 0  # Discard if any increase is below a threshold
-        increase_list.append(increase)
+    price_field = settings.PRICE_FIELD
+    price_fields = ['avg', 'avg1', 'low', 'trend']
+    fields = list(dict.fromkeys(price_fields + [price_field]))
+    min_value = MIN_PRICE_VALUE  # Minimum threshold for last price to be considered significant
+    min_percentage = MIN_PERCENTAGE  # Minimum threshold for percentage increase
+    since_date = timezone.now() - timedelta(days=days)
+
+    rankings = {}
+    for card_id, rows in fetch_price_history(card_ids, fields, last_catalogs=days).items():
+        # Skip card if the latest price is too old or below min_value
+        last_date, last_price = rows[-1][0], rows[-1][fields.index(price_field) + 1]
+        if last_date < since_date or (last_price and last_price < min_value):
+            continue
+
+        # List to hold percentage increases for each price field
+        increase_list = []
+        for position, _ in enumerate(price_fields, start=1):
+            values = [row[position] for row in rows if row[position] is not None][-days:]
+            increase = rising_increase(values)
+            if increase < min_percentage:
+                break  # Discard if any increase is below a threshold
+            increase_list.append(increase)
+        else:
+            # Keep the mean of the increases if all price fields meet the threshold
+            rankings[card_id] = statistics.mean(increase_list)
 
-    # Return the mean of the increases if all price fields meet the threshold
-    return statistics.mean(increase_list) if increase_list else 0
+    return rankings
 
 
 def update_card_slopes(card_qs=None, chunk_size=990):
-    """Calculate and store slopes for a queryset of MTGCards in chunks and returns created/updated counts."""
+    """Calculate and store slopes for a queryset of MTGCards in chunks and returns upserted/pruned counts."""
 
     if not card_qs:
         card_qs = MTGCard.objects.filter(expansion_id__in=LEGAL_PREMODERN_SETS)
 
-    cards = list(card_qs)
-    created_count = 0
-    deleted_count = 0
+    cards = list(card_qs.select_related('latest_price'))
+    upserted_count = 0
+    pruned_count = 0
     for i in range(0, len(cards), chunk_size):
         end_index = min(i + chunk_size, len(cards))
         chunk = cards[i:end_index]
-        slopes_to_create = []
-        cards_ids_to_delete = []
+        states = []
 
         for card in chunk:
-            cards_ids_to_delete.append(card.cm_id)
-            slopes_to_create.extend(calculate_card_slopes(card))
+            states.extend(calculate_card_slope_states(card))
 
-        deleted_count += MTGCardPriceSlope.objects.filter(card__cm_id__in=cards_ids_to_delete).delete()[0]
-        created_count += len(slopes_to_create)
-        MTGCardPriceSlope.objects.bulk_create(slopes_to_create)
+        upserted, pruned = save_slope_states(states, rebuilt_card_ids=[card.cm_id for card in chunk])
+        upserted_count += upserted
+        pruned_count += pruned
 
-    return created_count, deleted_count
+    return upserted_count, pruned_count
 
 
-def calculate_card_slopes(card):
-    """Calculate and return a list of MTGCardPriceSlope instances for a single MTGCard."""
+def update_slope_states(catalog_date=None, chunk_size=990):
+    """
+    Slide the slope windows of every card priced in catalog_date by one point and refresh their slopes.
 
-    intervals = [2, 7, 30]
-    slopes = []
+    Every field of settings.SLOPE_PRICE_FIELDS is read from the catalog with a single query and each
+    (field, interval) window is updated in O(1) from its stored state. Cards missing a state, or whose state is
+    newer than catalog_date (older catalog loaded late), are rebuilt from their history.
+    Return upserted/pruned slope counts.
+    """
+    fields = settings.SLOPE_PRICE_FIELDS
+    intervals = settings.SLOPE_INTERVALS
+    if catalog_date is None:
+        catalog_date = MTGCardPrice.objects.latest('catalog_date').catalog_date
 
-    latest_price = card.prices.filter(**{f"{settings.PRICE_FIELD}__isnull": False}).order_by("-catalog_date").first()
-    if not latest_price:
-        return []
+    new_prices = {
+        card_id: [(field, value) for field, value in zip(fields, values) if value is not None]
+        for card_id, *values in MTGCardPrice.objects.filter(catalog_date=catalog_date).values_list(
+            'card_id', *map(MTGCardPrice.price_lookup, fields)
+        )
+    }
+    day = catalog_date.timestamp() / SECONDS_PER_DAY
+
+    card_ids = iter(sorted(card_id for card_id, prices in new_prices.items() if prices))
+    upserted_count = 0
+    pruned_count = 0
+    while chunk := list(islice(card_ids, chunk_size)):
+        stored_states = {
+            (state.card_id, state.price_field, state.interval_days): state
+            for state in MTGCardPriceSlopeState.objects.filter(card_id__in=chunk)
+        }
+        states = []
+        cards_to_rebuild = []
+
+        for card_id in chunk:
+            card_states = [
+                (stored_states.get((card_id, field, days)), price)
+                for field, price in new_prices[card_id]
+                for days in intervals
+            ]
+            if any(state is None or state.last_date > catalog_date for state, _ in card_states):
+                cards_to_rebuild.append(card_id)
+                continue
+
+            for state, price in card_states:
+                if state.last_date == catalog_date:
+                    continue  # catalog already applied
+
+                regression = _state_regression(state)
+                regression.slide(day, price, state.interval_days)
+                states.append(_slope_state(card_id, state.price_field, state.interval_days, regression, catalog_date))
+
+        for card in MTGCard.objects.filter(cm_id__in=cards_to_rebuild).select_related('latest_price'):
+            states.extend(calculate_card_slope_states(card))
+
+        upserted, pruned = save_slope_states(states, rebuilt_card_ids=cards_to_rebuild)
+        upserted_count += upserted
+        pruned_count += pruned
+
+    return upserted_count, pruned_count
+
+
+def save_slope_states(states, rebuilt_card_ids=()):
+    """
+    Store slope states and upsert the slopes of their cards derived from them, in a single transaction.
+
+    Slopes are written over the unique_card_field_interval constraint. Stale slopes of these cards are pruned in
+    one statement: those whose state was refreshed with too few prices left in the window, those of fields or
+    intervals no longer configured and, for rebuilt_card_ids, any slope not derived from states.
+    Return upserted/pruned slope counts.
+    """
+    if not states and not rebuilt_card_ids:
+        return 0, 0
+
+    slopes = [slope for slope in map(_state_slope, states) if slope]
+    card_ids = {state.card_id for state in states} | set(rebuilt_card_ids)
+    configured = Q(price_field__in=settings.SLOPE_PRICE_FIELDS, interval_days__in=settings.SLOPE_INTERVALS)
+
+    with transaction.atomic():
+        # rows written below get a newer date_updated (auto_now), anything older for these cards is stale
+        refreshed_since = timezone.now()
+
+        MTGCardPriceSlopeState.objects.bulk_create(
+            states,
+            update_conflicts=True,
+            unique_fields=['card', 'price_field', 'interval_days'],
+            update_fields=[
+                'last_date',
+                'points',
+                'origin',
+                'sum_time',
+                'sum_price',
+                'sum_time_price',
+                'sum_time_squared',
+                'date_updated',
+            ],
+        )
+        MTGCardPriceSlope.objects.bulk_create(
+            slopes,
+            update_conflicts=True,
+            unique_fields=['card', 'price_field', 'interval_days'],
+            update_fields=['slope', 'percent_change', 'initial_price', 'final_price', 'date_updated'],
+        )
+        refreshed_state = MTGCardPriceSlopeState.objects.filter(
+            card=OuterRef('card'),
+            price_field=OuterRef('price_field'),
+            interval_days=OuterRef('interval_days'),
+            date_updated__gte=refreshed_since,
+        )
+        pruned_count, _ = (
+            MTGCardPriceSlope.objects.filter(card_id__in=card_ids, date_updated__lt=refreshed_since)
+            .filter(Q(card_id__in=rebuilt_card_ids) | Exists(refreshed_state) | ~configured)
+            .delete()
+        )
+        MTGCardPriceSlopeState.objects.filter(card_id__in=card_ids, date_updated__lt=refreshed_since).filter(
+            Q(card_id__in=rebuilt_card_ids) | ~configured
+        ).delete()
+
+    return len(slopes), pruned_count
+
+
+def _slope_state(card_id, price_field, interval_days, regression, last_date):
+    """Build an unsaved MTGCardPriceSlopeState out of a SlidingRegression."""
+    sum_time, sum_price, sum_time_price, sum_time_squared = regression.sums
+    return MTGCardPriceSlopeState(
+        card_id=card_id,
+        price_field=price_field,
+        interval_days=interval_days,
+        last_date=last_date,
+        points=[list(point) for point in regression.points],
+        origin=regression.origin,
+        sum_time=sum_time,
+        sum_price=sum_price,
+        sum_time_price=sum_time_price,
+        sum_time_squared=sum_time_squared,
+    )
+
+
+def _state_regression(state):
+    """Rebuild the SlidingRegression stored in an MTGCardPriceSlopeState."""
+    sums = (state.sum_time, state.sum_price, state.sum_time_price, state.sum_time_squared)
+    return SlidingRegression(state.points, state.origin, sums)
 
-    earliest_date = latest_price.catalog_date + timedelta(-(max(intervals) + 2))
-    earliest_date = earliest_date.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    end_date = latest_price.catalog_date.replace(hour=0, minute=0, second=0, microsecond=0)
+def _state_slope(state):
+    """Return the MTGCardPriceSlope of a state, None if its window holds less than two prices."""
+    regression = _state_regression(state)
+    if len(regression) < 2:
+        return None
 
-    prices = list(
-        card.prices.filter(catalog_date__gte=earliest_date, **{f"{settings.PRICE_FIELD}__isnull": False})
-        .order_by("catalog_date")
-        .values_list("catalog_date", settings.PRICE_FIELD)
+    return MTGCardPriceSlope(
+        card_id=state.card_id,
+        price_field=state.price_field,
+        interval_days=state.interval_days,
+        slope=regression.slope(),
+        percent_change=regression.percent_change(),
+        initial_price=regression.points[0][1],
+        final_price=regression.points[-1][1],
     )
 
-    for days in intervals:
-        start_date = end_date - timedelta(days=days)
 
-        interval_prices = [(date, price) for date, price in prices if date >= start_date]
+def calculate_card_slope_states(card, fields=None, intervals=None):
+    """
+    Calculate and return a list of MTGCardPriceSlopeState instances for a single MTGCard.
 
-        if len(interval_prices) < 2:
-            continue
+    All the fields and intervals (settings.SLOPE_PRICE_FIELDS and settings.SLOPE_INTERVALS by default) are
+    computed in one pass over a single history query.
+    """
+    fields = fields or settings.SLOPE_PRICE_FIELDS
+    intervals = intervals or settings.SLOPE_INTERVALS
 
-        price_dates = [item[0] for item in interval_prices]
-        price_values = [item[1] for item in interval_prices]
+    latest_price = getattr(card, 'latest_price', None)
+    if not latest_price:
+        return []
 
-        final_price = price_values[-1]
-        initial_price = price_values[0]
+    earliest_date = latest_price.catalog_date + timedelta(-(max(intervals) + 2))
+    earliest_date = earliest_date.replace(hour=0, minute=0, second=0, microsecond=0)
 
-        if initial_price == 0:
-            percent_change = 0
-        else:
-            percent_change = ((final_price - initial_price) / initial_price) * 100
-
-        slope = simple_trend(price_dates, price_values)
-
-        slopes.append(
-            MTGCardPriceSlope(
-                card=card,
-                interval_days=days,
-                slope=slope,
-                percent_change=percent_change,
-                initial_price=initial_price,
-                final_price=final_price,
+    prices = card.prices.filter(catalog_date__gte=earliest_date).order_by("catalog_date")
+
+    regressions = {(field, days): SlidingRegression() for field in fields for days in intervals}
+    last_dates = {}
+    for date, *values in prices.values_list("catalog_date", *map(MTGCardPrice.price_lookup, fields)):
+        day = date.timestamp() / SECONDS_PER_DAY
+        for field, price in zip(fields, values):
+            if price is None:
+                continue
+            last_dates[field] = date
+            for days in intervals:
+                regressions[field, days].slide(day, price, days)
+
+    return [
+        _slope_state(card.cm_id, field, days, regression, last_dates[field])
+        for (field, days), regression in regressions.items()
+        if len(regression)
+    ]
+
+
+def calculate_card_slopes(card):
+    """Calculate and return a list of MTGCardPriceSlope instances for a single MTGCard."""
+    return [slope for slope in map(_state_slope, calculate_card_slope_states(card)) if slope]
+
+
+def _field_rolling_stats(field, matrix, windows, stored):
+    """
+    Return the MTGCardRollingStats rows of one price field for every window, from its (cards x catalogs) matrix.
+
+    stored maps (card_id, field, window) to the (ema, last catalog timestamp) of the previous refresh. Only
+    cards priced in the latest catalog of matrix get a row.
+    """
+    card_ids = matrix.index.to_numpy()
+    dates = list(matrix.columns)
+    timestamps = np.array([date.timestamp() for date in dates])
+    prices = matrix.to_numpy()
+    listed = ~np.isnan(prices[:, -1])  # cards gone from the latest catalog are pruned
+
+    stats = []
+    for window in windows:
+        last, std, zscore, max_drawdown = window_stats(prices[:, -window:])
+
+        # fold into each EMA only the catalogs it has not seen yet, seeding new ones from their window
+        seed_after = timestamps[-window - 1] if len(dates) > window else -np.inf
+        previous = [stored.get((card_id, field, window), (np.nan, seed_after)) for card_id in card_ids]
+        previous_ema, folded_until = (np.array(column, dtype=float) for column in zip(*previous))
+        unseen = timestamps[None, :] > folded_until[:, None]
+        ema = ema_fold(previous_ema, np.where(unseen, prices, np.nan), window)
+
+        for i in np.flatnonzero(listed & ~np.isnan(ema)):
+            stats.append(
+                MTGCardRollingStats(
+                    card_id=int(card_ids[i]),
+                    price_field=field,
+                    window_days=window,
+                    last_date=dates[-1],
+                    price=float(last[i]),
+                    ema=float(ema[i]),
+                    std=None if np.isnan(std[i]) else float(std[i]),
+                    zscore=None if np.isnan(zscore[i]) else float(zscore[i]),
+                    max_drawdown=None if np.isnan(max_drawdown[i]) else float(max_drawdown[i]),
+                )
             )
+    return stats
+
+
+def update_rolling_stats(batch_size=5000):
+    """
+    Refresh EMA, rolling std, z-score and max drawdown of every card for settings.ROLLING_WINDOWS.
+
+    The latest max(ROLLING_WINDOWS) catalogs of settings.ROLLING_PRICE_FIELDS are read with one query and
+    pivoted into (cards x catalogs) matrices, so every statistic is computed column-wise over all cards at once.
+    EMAs are folded incrementally from their stored value with only the catalogs newer than their last_date;
+    cards without stored stats are seeded from their window. Only cards priced in the latest catalog are kept.
+    Return upserted/pruned row counts.
+    """
+    fields = settings.ROLLING_PRICE_FIELDS
+    windows = settings.ROLLING_WINDOWS
+    prices_qs = MTGCardPrice.objects.values_list('card_id', 'catalog_date', *map(MTGCardPrice.price_lookup, fields))
+    start_date = recent_catalogs_start(max(windows))
+    if start_date:
+        prices_qs = prices_qs.filter(catalog_date__gte=start_date)
+
+    history = pd.DataFrame.from_records(prices_qs.iterator(chunk_size=batch_size), columns=['card_id', 'date', *fields])
+    if history.empty:
+        return 0, 0
+
+    stored = {
+        (card_id, price_field, window_days): (ema, last_date.timestamp())
+        for card_id, price_field, window_days, ema, last_date in MTGCardRollingStats.objects.values_list(
+            'card_id', 'price_field', 'window_days', 'ema', 'last_date'
         )
+    }
 
-    return slopes
+    refreshed_since = timezone.now()
+    upserted_count = 0
+    for field in fields:
+        matrix = history.pivot(index='card_id', columns='date', values=field).astype(float)
+        stats = _field_rolling_stats(field, matrix, windows, stored)
+        MTGCardRollingStats.objects.bulk_create(
+            stats,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['card', 'price_field', 'window_days'],
+            update_fields=['last_date', 'price', 'ema', 'std', 'zscore', 'max_drawdown', 'date_updated'],
+        )
+        upserted_count += len(stats)
+
+    # cards missing from the latest catalog, or fields/windows no longer configured
+    pruned_count, _ = MTGCardRollingStats.objects.filter(date_updated__lt=refreshed_since).delete()
+    return upserted_count, pruned_count
+
+
+def get_rolling_stats(window_days=30, order_by='zscore', min_price=1, limit=20):
+    """
+    Screen all cards on their precomputed rolling statistics for settings.PRICE_FIELD.
+
+    order_by is any MTGCardRollingStats column ('-zscore' for the most stretched cards, 'max_drawdown' for the
+    deepest falls); rows lacking that statistic are skipped.
+    """
+    column = order_by.lstrip('-')
+    stats = MTGCardRollingStats.objects.filter(
+        window_days=window_days,
+        price_field=settings.PRICE_FIELD,
+        price__gte=min_price,
+        **{f'{column}__isnull': False},
+    )
+    return list(stats.select_related('card__expansion').order_by(order_by)[:limit])
 
 
-def get_top_20_cards_by_slope(card_qs, min_price=3, interval_days=7, only_positive=True):
-    """Return up to the top 20 cards with the highest slopes, filtering only positive changes if specified."""
+def fetch_interval_prices(card_ids, field, count):
+    """
+    Fetch the latest count catalog rows of field for a batch of card ids with a single window query.
 
-    p_field = settings.PRICE_FIELD
-    # Fetch the latest price for filtering cards based on min_price
-    latest_price = MTGCardPrice.objects.filter(card=OuterRef('pk')).order_by('-catalog_date').values(p_field)[:1]
-    annotated_qs = card_qs.annotate(latest_price=Subquery(latest_price))
-    filtered_qs = annotated_qs.filter(latest_price__gte=min_price)
+    Return {card_id: [price, ...]} newest first, None where the card is listed without a price.
+    """
+    rows = (
+        MTGCardPrice.objects.filter(card_id__in=card_ids)
+        .annotate(
+            row_number=Window(RowNumber(), partition_by=[F('card_id')], order_by=F('catalog_date').desc()),
+        )
+        .filter(row_number__lte=count)
+        .order_by('card_id', 'row_number')
+        .values_list('card_id', MTGCardPrice.price_lookup(field))
+    )
+
+    interval_prices = defaultdict(list)
+    for card_id, price in rows:
+        interval_prices[card_id].append(price)
+    return interval_prices
 
-    # Retrieve pre-calculated slopes and get a larger initial set
-    slopes = MTGCardPriceSlope.objects.filter(
-        card__in=filtered_qs, interval_days=interval_days, slope__isnull=False
-    ).order_by('-percent_change')[:50]
+
+def rank_movers(
+    slopes_qs, price_field, interval_days, direction=MTGCardLeaderboard.GAINERS, only_moving=True, limit=20
+):
+    """
+    Rank the cards of slopes_qs on their price change over their latest interval_days catalogs.
+
+    The MOVER_CANDIDATES stored slopes moving furthest in direction are measured again on their latest prices,
+    and the first limit of them (still moving in direction when only_moving is set) are returned as
+    (card, (name, percent change, slope, first price, last price, price change, expansion code)) pairs.
+    """
+    ordering = '-percent_change' if direction == MTGCardLeaderboard.GAINERS else 'percent_change'
+    sign = 1 if direction == MTGCardLeaderboard.GAINERS else -1
+    slopes = list(
+        slopes_qs.filter(price_field=price_field, interval_days=interval_days, slope__isnull=False)
+        .select_related('card__expansion')
+        .order_by(ordering, 'card_id')[:MOVER_CANDIDATES]
+    )
+    interval_prices = fetch_interval_prices([slope.card_id for slope in slopes], price_field, interval_days)
 
     top_cards = []
     for slope in slopes:
-        interval_prices = list(slope.card.prices.order_by('-catalog_date')[:interval_days])
-        if len(interval_prices) < 2:
+        prices = interval_prices.get(slope.card_id, [])
+        if len(prices) < 2:
             continue
 
-        first_price = getattr(interval_prices[-1], p_field)
-        last_price = getattr(interval_prices[0], p_field)
+        first_price = prices[-1]
+        last_price = prices[0]
 
         if first_price is None or last_price is None:
             continue  # Skip if prices are missing
@@ -270,38 +607,193 @@ def get_top_20_cards_by_slope(card_qs, min_price=3, interval_days=7, only_positi
             percent_change = ((last_price - first_price) / first_price) * 100 if first_price != 0 else 0
             slope_value = (last_price - first_price) / interval_days
 
-        # Apply positive filtering if specified
-        if only_positive and percent_change <= 0:
+        # Apply direction filtering if specified
+        if only_moving and sign * percent_change <= 0:
             continue
 
         top_cards.append(
             (
-                slope.card.name,
-                round(percent_change, 1),
-                slope_value,
-                first_price,
-                last_price,
-                price_change,
-                slope.card.expansion.code,
+                slope.card,
+                (
+                    slope.card.name,
+                    round(percent_change, 1),
+                    slope_value,
+                    first_price,
+                    last_price,
+                    price_change,
+                    slope.card.expansion.code or '',
+                ),
             )
         )
 
-        if len(top_cards) == 20:  # Stop once we have the top 20
+        if len(top_cards) == limit:  # Stop once we have the top limit
             break
 
     return top_cards
 
 
-def show_changes(card_qs=None, days=7, min_price=3):
-    """Display the top 20 cards based on slope and percentage change."""
-    if not card_qs:
-        card_qs = MTGCard.objects.filter(expansion_id__in=LEGAL_PREMODERN_SETS)
-        card_qs = card_qs.exclude(expansion__code__startswith='X')
+def get_top_20_cards_by_slope(card_qs, min_price=3, interval_days=7, only_positive=True):
+    """Return up to the top 20 cards with the highest slopes, filtering only positive changes if specified."""
 
-    top_20_cards = get_top_20_cards_by_slope(card_qs, min_price, days)
+    p_field = settings.PRICE_FIELD
+    # Filter cards on their latest price snapshot
+    filtered_qs = card_qs.filter(**{f'latest_price__{p_field}__gte': min_price})
+
+    slopes_qs = MTGCardPriceSlope.objects.filter(card__in=filtered_qs)
+    return [row for _, row in rank_movers(slopes_qs, p_field, interval_days, only_moving=only_positive)]
+
+
+def rebuild_leaderboards(formats=None, size=None):
+    """
+    Rebuild the movers leaderboards of formats (all of FORMAT_SETS by default) from the stored slopes.
+
+    There is one board per (min price tier, interval, price field, direction), ranked by rank_movers() on the
+    cards whose latest price reaches the tier, so a board holds what get_top_20_cards_by_slope() returns for
+    the same cards. Boards are written in a single transaction with their display columns, so readers never
+    see a partial board. Return the number of entries written.
+    """
+    formats = list(formats or FORMAT_SETS)
+    size = size or settings.LEADERBOARD_SIZE
+
+    boards = list(
+        product(
+            settings.LEADERBOARD_MIN_PRICES,
+            settings.SLOPE_PRICE_FIELDS,
+            settings.SLOPE_INTERVALS,
+            (direction for direction, _ in MTGCardLeaderboard.DIRECTIONS),
+        )
+    )
+
+    entries = []
+    for format_name in formats:
+        format_cards = MTGCard.objects.filter(expansion_id__in=FORMAT_SETS[format_name]).exclude(
+            expansion__code__startswith='X'
+        )
 
-    # Ensure the results are sorted by percent_change (index 1 in the tuple)
-    top_20_cards = sorted(top_20_cards, key=lambda x: x[1], reverse=True)
+        for min_price, price_field, interval_days, direction in boards:
+            slopes_qs = MTGCardPriceSlope.objects.filter(
+                card__in=format_cards.filter(**{f'latest_price__{price_field}__gte': min_price})
+            )
+            movers = rank_movers(slopes_qs, price_field, interval_days, direction, limit=size)
+            for rank, (card, row) in enumerate(movers, start=1):
+                name, percent_change, slope, initial_price, final_price, _, code = row
+                entries.append(
+                    MTGCardLeaderboard(
+                        format=format_name,
+                        min_price=min_price,
+                        interval_days=interval_days,
+                        price_field=price_field,
+                        direction=direction,
+                        rank=rank,
+                        card=card,
+                        name=name,
+                        expansion_code=code,
+                        percent_change=percent_change,
+                        slope=slope,
+                        initial_price=initial_price,
+                        final_price=final_price,
+                    )
+                )
+
+    with transaction.atomic():
+        MTGCardLeaderboard.objects.filter(format__in=formats).delete()
+        MTGCardLeaderboard.objects.bulk_create(entries, batch_size=1000)
+
+    return len(entries)
+
+
+def get_leaderboard(
+    format_name='premodern', interval_days=7, min_price=3, direction=MTGCardLeaderboard.GAINERS, limit=20
+):
+    """
+    Return the precomputed top movers of a format, in the same layout as get_top_20_cards_by_slope().
+
+    Raise ValueError when interval_days is not one of settings.SLOPE_INTERVALS or min_price not one of
+    settings.LEADERBOARD_MIN_PRICES, no board is built for them.
+    """
+    if interval_days not in settings.SLOPE_INTERVALS:
+        raise ValueError(f"No leaderboard for {interval_days} days, intervals are {settings.SLOPE_INTERVALS}.")
+    if min_price not in settings.LEADERBOARD_MIN_PRICES:
+        raise ValueError(f"No leaderboard for min price {min_price}, tiers are {settings.LEADERBOARD_MIN_PRICES}.")
+
+    entries = MTGCardLeaderboard.objects.filter(
+        format=format_name,
+        min_price=min_price,
+        interval_days=interval_days,
+        price_field=settings.PRICE_FIELD,
+        direction=direction,
+    ).order_by('rank')[:limit]
+
+    return [
+        (
+            entry.name,
+            round(entry.percent_change, 1),
+            entry.slope,
+            entry.initial_price,
+            entry.final_price,
+            entry.final_price - entry.initial_price,
+            entry.expansion_code,
+        )
+        for entry in entries
+    ]
+
+
+def get_price_moves(catalog_date=None, direction=MTGCardPriceMove.GAINERS, min_price=1, limit=20):
+    """
+    Return the day-over-day movers of a catalog (the latest by default) for settings.PRICE_FIELD.
+
+    Rows come straight from the MTGCardPriceMove table filled at ingest, ordered by percent change.
+    """
+    moves = MTGCardPriceMove.objects.filter(
+        price_field=settings.PRICE_FIELD, status=MTGCardPriceMove.CHANGED, price__gte=min_price
+    )
+    if catalog_date is None:
+        catalog_date = MTGCardPriceMove.objects.aggregate(Max('catalog_date'))['catalog_date__max']
+    moves = moves.filter(catalog_date=catalog_date)
+
+    if direction == MTGCardPriceMove.GAINERS:
+        moves = moves.filter(percent_change__gt=0).order_by('-percent_change')
+    else:
+        moves = moves.filter(percent_change__lt=0).order_by('percent_change')
+
+    return list(moves.select_related('card__expansion')[:limit])
+
+
+def get_price_index(scope_key='premodern', scope=MTGPriceIndex.FORMAT, since=None):
+    """
+    Return the precomputed daily price index of a format (or of a set, by expansion id) for settings.PRICE_FIELD.
+
+    Each entry is (catalog_date, count, total, median, p90), oldest first.
+    """
+    series = MTGPriceIndex.objects.filter(scope=scope, scope_key=str(scope_key), price_field=settings.PRICE_FIELD)
+    if since:
+        series = series.filter(catalog_date__gte=since)
+    return list(series.order_by('catalog_date').values_list('catalog_date', 'count', 'total', 'median', 'p90'))
+
+
+def get_similar_cards(card, k=10):
+    """Return the k cards whose daily price moves correlate best with card's, as (MTGCard, correlation) pairs."""
+    global _similarity_index  # pylint: disable=global-statement
+    latest_date = MTGCardPrice.objects.latest('catalog_date').catalog_date
+    if _similarity_index is None or _similarity_index.last_date < latest_date:
+        _similarity_index = SimilarityIndex.load()  # refreshed on disk by update_mtg()
+    if _similarity_index is None:
+        return []
+
+    matches = _similarity_index.similar(card.pk, k)
+    cards = MTGCard.objects.select_related('expansion').in_bulk([card_id for card_id, _ in matches])
+    return [(cards[card_id], correlation) for card_id, correlation in matches if card_id in cards]
+
+
+def show_changes(card_qs=None, days=7, min_price=3, format_name='premodern'):
+    """Display the top 20 cards based on slope and percentage change."""
+    if card_qs:
+        top_20_cards = get_top_20_cards_by_slope(card_qs, min_price, days)
+        # Ensure the results are sorted by percent_change (index 1 in the tuple)
+        top_20_cards = sorted(top_20_cards, key=lambda x: x[1], reverse=True)
+    else:
+        # Precomputed at ingest time, already sorted
+        top_20_cards = get_leaderboard(format_name, days, min_price)
 
     print(f"{'Name':<40} | {'Expansion Code':<14} | {'% Change':<8} | {'Slope':<6} | Price Change")
     print("-" * 90)
@@ -323,45 +815,60 @@ def find_spiking_cards(
     accelerating_increase_factor=1.0,
     min_price_difference=0.50,
 ):
-    """Find cards with potential price spikes based on the increasing trend."""
+    """
+    Find cards with potential price spikes based on the increasing trend.
+
+    The last last_entries trend prices of every card are fetched with a single ROW_NUMBER() window query and
+    the rules are evaluated on all cards at once: the newest price is above min_price and min_percentage_change
+    above the previous one, every daily increase is at least accelerating_increase_factor times the one before
+    it, and the increase over the whole window is above min_price_difference.
+    """
     if not 2 <= last_entries <= 30:
         raise ValueError("last_entries must be between 2 and 30.")
 
     if not card_qs:
         card_qs = MTGCard.objects.filter(expansion_id__in=LEGAL_PREMODERN_SETS)
 
-    # filter cards with trend != 0
-    valid_card_ids = {
-        card.pk
-        for card in card_qs
-        if len(card.prices.order_by('-catalog_date')[:last_entries]) == last_entries
-        and all(p.trend is not None for p in card.prices.order_by('-catalog_date')[:last_entries])
-    }
-    valid_cards_qs = card_qs.filter(pk__in=valid_card_ids)
+    card_ids, latest_prices = fetch_latest_prices(card_qs, 'trend', last_entries)
+    spiking, price_differences = spike_mask(
+        latest_prices, min_price, min_percentage_change, accelerating_increase_factor, min_price_difference
+    )
 
-    spiking_cards = []
+    cards = card_qs.select_related('expansion').in_bulk(card_ids[spiking].tolist())
+    spiking_cards = [
+        (cards[card_id], *prices[[0, 1, -1]].tolist(), price_difference)
+        for card_id, prices, price_difference in zip(
+            card_ids[spiking].tolist(), latest_prices[spiking], price_differences[spiking].tolist()
+        )
+    ]
 
-    for card in valid_cards_qs:
-        prices = list(card.prices.order_by('-catalog_date')[:last_entries])
-        current_price = prices[0].trend
-        previous_price = prices[1].trend
-        earliest_price = prices[2].trend
+    spiking_cards.sort(key=lambda x: x[4], reverse=True)
+    return spiking_cards
 
-        percentage_change = ((current_price - previous_price) / previous_price) * 100 if previous_price != 0 else 0
 
-        if current_price > min_price:
-            if percentage_change >= min_percentage_change:
-                trend_increase_day1 = previous_price - earliest_price
-                trend_increase_day2 = current_price - previous_price
+def fetch_latest_prices(card_qs, field, count):
+    """
+    Fetch the latest count prices of field for every card of card_qs with a single window query.
 
-                if trend_increase_day2 >= accelerating_increase_factor * trend_increase_day1:
-                    price_difference = current_price - earliest_price
+    Return (card_ids, prices): a card_ids array and a (cards x count) matrix holding the newest price first,
+    NaN where the price is missing or the card has fewer than count prices.
+    """
+    rows = (
+        MTGCardPrice.objects.filter(card__in=card_qs)
+        .annotate(
+            row_number=Window(RowNumber(), partition_by=[F('card_id')], order_by=F('catalog_date').desc()),
+        )
+        .filter(row_number__lte=count)
+        .values_list('card_id', 'row_number', MTGCardPrice.price_lookup(field))
+    )
 
-                    if price_difference > min_price_difference:
-                        spiking_cards.append((card, current_price, previous_price, earliest_price, price_difference))
+    latest = defaultdict(lambda: [math.nan] * count)
+    for card_id, row_number, price in rows:
+        latest[card_id][row_number - 1] = math.nan if price is None else price
 
-    spiking_cards.sort(key=lambda x: x[4], reverse=True)
-    return spiking_cards
+    card_ids = np.fromiter(latest, dtype=np.int64, count=len(latest))
+    prices = np.array(list(latest.values()), dtype=np.float64).reshape(len(card_ids), count)
+    return card_ids, prices
 
 
 def display_spiking_cards(spiking_cards):
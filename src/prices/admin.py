@@ -10,6 +10,7 @@ class CustomAdminClass(ModelAdmin):
     """Update all cardmarket prices from admin."""
 
     actions = ['update_all']
+    list_select_related = ['expansion', 'latest_price']
 
     def update_all(self):
         """Update all cardmarket prices from admin."""
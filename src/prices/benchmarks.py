@@ -0,0 +1,108 @@
+import logging
+import statistics
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from prices.constants import EXCLUDED_EXPANSION_IDS, LEGAL_PREMODERN_SETS
+from prices.export import _get_cheapest_premodern_prints, build_export_dataframe
+from prices.gsheets import dataframe_grid
+from prices.ingest import BATCH_SIZE, update_metacard_floors
+from prices.models import Catalog, MTGCard, MTGCardPrice, MTGSet
+
+logger = logging.getLogger(__name__)
+
+
+def create_synthetic_export_dataset(metacards=1000, prints=3, catalogs=80, price_field='trend', seed=0):
+    """
+    Add a premodern set with metacards x prints cards priced over catalogs daily catalogs after the latest one.
+
+    Prices are random walks, a few of them missing. Metacard floors of the newest synthetic catalog are stored
+    so the export picks the synthetic cards. Return the newest catalog date. Meant to run in a transaction
+    that is rolled back, see benchmark_export_build().
+    """
+    rng = np.random.default_rng(seed)
+    expansion_id = next(set_id for set_id in LEGAL_PREMODERN_SETS if set_id not in EXCLUDED_EXPANSION_IDS)
+    expansion, _ = MTGSet.objects.get_or_create(expansion_id=expansion_id, defaults={'name': 'Synthetic set'})
+
+    first_cm_id = (MTGCard.objects.aggregate(Max('cm_id'))['cm_id__max'] or 0) + 1
+    first_metacard_id = (MTGCard.objects.aggregate(Max('metacard_id'))['metacard_id__max'] or 0) + 1
+    now = timezone.now()
+    cards = [
+        MTGCard(
+            cm_id=first_cm_id + i,
+            name=f'Synthetic card {i // prints}',
+            expansion=expansion,
+            metacard_id=first_metacard_id + i // prints,
+            cm_date_added=now,
+        )
+        for i in range(metacards * prints)
+    ]
+    MTGCard.objects.bulk_create(cards, batch_size=BATCH_SIZE)
+
+    latest = MTGCardPrice.objects.aggregate(Max('catalog_date'))['catalog_date__max'] or now
+    catalog_dates = [latest + timedelta(days=day) for day in range(1, catalogs + 1)]
+    Catalog.objects.bulk_create(
+        Catalog(catalog_date=catalog_date, catalog_type=Catalog.PRICES, md5sum=f'synthetic{day:023d}')
+        for day, catalog_date in enumerate(catalog_dates)
+    )
+
+    start = rng.lognormal(mean=0.5, sigma=1.5, size=len(cards))
+    walks = start[:, None] * np.exp(np.cumsum(rng.normal(0, 0.03, size=(len(cards), catalogs)), axis=1))
+    listed = rng.random(walks.shape) > 0.05
+    MTGCardPrice.objects.bulk_create(
+        (
+            MTGCardPrice(card=card, catalog_date=catalog_date, **{price_field: round(price, 2)})
+            for card, card_walk, card_listed in zip(cards, walks.tolist(), listed.tolist())
+            for catalog_date, price, is_listed in zip(catalog_dates, card_walk, card_listed)
+            if is_listed
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    update_metacard_floors(catalog_dates[-1], fields=[price_field])
+    return catalog_dates[-1]
+
+
+def _timed(timings, name, func, *args):
+    """Run func(*args), appending its duration in seconds to timings[name]."""
+    start = time.perf_counter()
+    result = func(*args)
+    timings.setdefault(name, []).append(time.perf_counter() - start)
+    return result
+
+
+def benchmark_export_build(metacards=1000, prints=3, catalogs=80, repeat=5, price_field='trend'):
+    """
+    Time the Google Sheets export build, without the upload, on a synthetic dataset.
+
+    The dataset is created in a transaction that is rolled back afterwards, so any database can be used.
+    Every stage (cheapest prints, history query and pivot, grid) runs repeat times; return
+    {stage: median seconds} with 'total' the median end-to-end time, e.g. from ``shell_plus``:
+    ``from prices.benchmarks import benchmark_export_build; benchmark_export_build()``.
+    """
+    timings = {}
+    with transaction.atomic():
+        cur_date = create_synthetic_export_dataset(metacards, prints, catalogs, price_field)
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            card_ids = _timed(timings, 'cheapest_prints', _get_cheapest_premodern_prints, price_field, cur_date)
+            final_df, _ = _timed(timings, 'history_pivot', build_export_dataframe, card_ids, price_field, cur_date)
+            _timed(timings, 'grid', dataframe_grid, final_df)
+            timings.setdefault('total', []).append(time.perf_counter() - start)
+
+        transaction.set_rollback(True)
+
+    result = {name: statistics.median(values) for name, values in timings.items()}
+    logger.info(
+        "Export build of %d cards x %d columns: %s",
+        len(final_df),
+        final_df.shape[1],
+        ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in result.items()),
+    )
+    return result
@@ -9,10 +9,16 @@ from pathlib import Path
 
 import pytz
 import requests
-from django.db import connection
+from django.db import connection, transaction
 from django.utils import timezone
 
-from prices.models import Catalog, MTGCard, MTGCardPrice
+from prices.ingest import (
+    record_price_moves,
+    update_latest_prices,
+    update_metacard_floors,
+    update_price_indices,
+)
+from prices.models import Catalog, MTGCard, MTGCardPrice, MTGPriceHistoryVersion
 
 logger = logging.getLogger(__name__)
 germany_tz = pytz.timezone("Europe/Berlin")
@@ -210,7 +216,6 @@ def _create_price_records(data, catalog_date, existing_cards, existing_price_ids
         mtg_card_price = MTGCardPrice(
             catalog_date=catalog_date,
             card=card,
-            cm_id=cm_id,
             avg=price_item.get("avg"),
             low=price_item.get("low"),
             trend=price_item.get("trend"),
@@ -238,8 +243,15 @@ def _bulk_create_prices(insert_prices, catalog_date):
     try:
         pre_count = MTGCardPrice.objects.filter(catalog_date=catalog_date).count()
 
-        # Perform the bulk creation
-        MTGCardPrice.objects.bulk_create(insert_prices, batch_size=2000, ignore_conflicts=False)
+        # Perform the bulk creation, keeping the latest-price snapshot in step
+        with transaction.atomic():
+            MTGCardPrice.objects.bulk_create(insert_prices, batch_size=2000, ignore_conflicts=False)
+            update_latest_prices(insert_prices, catalog_date)
+            # insert_prices may only hold the missing rows of a reprocessed catalog, diff what is stored
+            record_price_moves(catalog_date)
+            update_price_indices(catalog_date)
+            update_metacard_floors(catalog_date)
+            MTGPriceHistoryVersion.bump()
 
         post_count = MTGCardPrice.objects.filter(catalog_date=catalog_date).count()
         actual_created = post_count - pre_count
@@ -325,7 +337,7 @@ def update_cm_prices(local_content=None, force_reprocess=False):
     # Get existing data for bulk operations
     all_cm_ids = [item["idProduct"] for item in data["priceGuides"]]
     existing_cards = MTGCard.objects.filter(cm_id__in=all_cm_ids).in_bulk(field_name="cm_id")
-    existing_prices = MTGCardPrice.objects.filter(catalog_date=catalog_date).values_list("cm_id", flat=True)
+    existing_prices = MTGCardPrice.objects.filter(catalog_date=catalog_date).values_list("card_id", flat=True)
     existing_price_ids = set(existing_prices)
 
     # Create price records
@@ -213,3 +213,16 @@ LEGAL_PREMODERN_SETS = [
     42,  # Legions | 2003-02-01
     43,  # Scourge | 2003-06-01
 ]
+
+# Formats with a precomputed movers leaderboard
+FORMAT_SETS = {
+    'standard': LEGAL_STANDARD_SETS,
+    'pioneer': LEGAL_PIONEER_SETS,
+    'premodern': LEGAL_PREMODERN_SETS,
+}
+
+# never considered as the cheapest print of a card
+EXCLUDED_EXPANSION_IDS = [
+    110,  # Oversized 6x9 Promos
+    111,  # Oversized Box Toppers
+]
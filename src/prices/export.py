@@ -3,27 +3,31 @@ import time
 import gspread
 import pandas as pd
 from django.conf import settings
-from django.db.models import Min
 from django.utils import timezone
 from gspread import GSpreadException
 from gspread.exceptions import APIError
 
-from prices.constants import LEGAL_PREMODERN_SETS
-from prices.models import Catalog, MTGCard, MTGCardPrice
+from prices.constants import EXCLUDED_EXPANSION_IDS, LEGAL_PREMODERN_SETS
+from prices.gsheets import (
+    SheetsUploader,
+    dataframe_grid,
+    discard_snapshot,
+    save_snapshot,
+    snapshot_path,
+    sync_worksheet,
+)
+from prices.models import Catalog, MTGCard, MTGCardPrice, MTGMetacardFloor
 
 MAX_HISTORICAL_ENTRIES = 60  # pricing columns
 TOP_N_COUNT = 800  # rows
 
-EXCLUDED_EXPANSION_IDS = [
-    110,  # Oversized 6x9 Promos
-    111,  # Oversized Box Toppers
-]
-
 BUFFER = 20
 
+SPREADSHEET_KEY = "1vQs3vlXHu7BELFoVuK4ysfzMeYHDxMdOWgPAGmPVZjk"
+
 
 def _get_cheapest_premodern_prints(price_field, cur_date):
-    """Find the cheapest print for queryset premodern cards."""
+    """Find the cheapest print ids for queryset premodern cards, read from the metacard floors stored at ingest."""
     pm_metacard_ids = (
         MTGCard.objects.filter(expansion_id__in=LEGAL_PREMODERN_SETS)
         .exclude(expansion_id__in=EXCLUDED_EXPANSION_IDS)
@@ -31,65 +35,39 @@ def _get_cheapest_premodern_prints(price_field, cur_date):
         .distinct()
     )
 
-    floors_qs = (
-        MTGCardPrice.objects.filter(
-            card__metacard_id__in=pm_metacard_ids, catalog_date=cur_date, **{f"{price_field}__gt": 0.01}
-        )
-        .exclude(card__expansion_id__in=EXCLUDED_EXPANSION_IDS)
-        .values("card__metacard_id")
-        .annotate(min_price=Min(price_field))
-        .order_by("-min_price", "card__metacard_id")[:TOP_N_COUNT]
-    )
-
-    target_pairs = {item["card__metacard_id"]: item["min_price"] for item in floors_qs}
-    if not target_pairs:
-        return [], {}
-
-    candidates = (
-        MTGCardPrice.objects.filter(
-            card__metacard_id__in=list(target_pairs.keys()),
-            catalog_date=cur_date,
-            **{f"{price_field}__in": list(target_pairs.values())},
-        )
-        .select_related("card", "card__expansion")
-        .values("card_id", "card__metacard_id", "card__name", "card__expansion__name", price_field)
-        .order_by("card__metacard_id", "card_id")
+    return list(
+        MTGMetacardFloor.objects.filter(metacard_id__in=pm_metacard_ids, catalog_date=cur_date, price_field=price_field)
+        .order_by("-price", "metacard_id")
+        .values_list("card_id", flat=True)[:TOP_N_COUNT]
     )
 
-    cheapest_pks = []
-    card_metadata = {}
-    seen_metacards = set()
 
-    for item in candidates:
-        m_id = item["card__metacard_id"]
-        c_id = item["card_id"]
-        price = item[price_field]
+def _get_price_history(card_ids, price_field, since):
+    """
+    Return the prices of card_ids from since on, with their card and set names, as a DataFrame.
 
-        if target_pairs.get(m_id) == price:
-            if m_id not in seen_metacards and len(cheapest_pks) < TOP_N_COUNT:
-                seen_metacards.add(m_id)
-                card_metadata[c_id] = {"name": item["card__name"], "set_name": item["card__expansion__name"]}
-                cheapest_pks.append(c_id)
+    The date range and card ids are served by the (card, catalog_date) unique key and the names come from the
+    same query.
+    """
+    lookup = MTGCardPrice.price_lookup(price_field)
+    history_qs = MTGCardPrice.objects.filter(
+        card_id__in=card_ids, catalog_date__gte=since, **{f"{lookup}__gt": 0.01}
+    ).values_list("card__expansion__name", "card__name", "catalog_date", lookup)
 
-    return cheapest_pks, card_metadata
+    return pd.DataFrame.from_records(
+        history_qs.iterator(chunk_size=10000), columns=["set_name", "card_name", "catalog_date", price_field]
+    )
 
 
-def _build_pivot_dataframe(df, card_metadata, price_field):
+def _build_pivot_dataframe(df, price_field):
     """Transform a structured historical dataframe into a pivot table."""
     if df.empty:
         return None
 
-    # Map deterministic metadata
-    df["card_name"] = df["card_id"].map(lambda x: card_metadata.get(x, {}).get("name", "Unknown"))
-    df["set_name"] = df["card_id"].map(lambda x: card_metadata.get(x, {}).get("set_name", "Unknown"))
+    df["set_name"] = df["set_name"].fillna("Unknown")
     df["date_only"] = pd.to_datetime(df["catalog_date"]).dt.date
 
-    pivot_df = df.pivot_table(
-        index=["set_name", "card_name"],
-        columns="date_only",
-        values=price_field,
-        aggfunc="mean",
-    )
+    pivot_df = df.groupby(["set_name", "card_name", "date_only"])[price_field].mean().unstack("date_only")
 
     pivot_df = pivot_df.reindex(sorted(pivot_df.columns, reverse=True), axis=1)
     pivot_df = pivot_df.iloc[:, :MAX_HISTORICAL_ENTRIES]
@@ -102,27 +80,54 @@ def _build_pivot_dataframe(df, card_metadata, price_field):
     return pivot_df.reset_index().fillna("")
 
 
-def _upload_to_gsheets(final_df, cur_date, price_field, recent_dates_count, start_time):
+def build_export_dataframe(card_ids, price_field, cur_date):
+    """
+    Build the history sheet of card_ids over the catalogs up to cur_date.
+
+    Return (dataframe, number of catalogs in the history window), dataframe None when there is no history.
+    """
+    recent_catalog_dates = list(
+        Catalog.objects.filter(catalog_id=Catalog.MTG, catalog_type=Catalog.PRICES, catalog_date__lte=cur_date)
+        .order_by("-catalog_date")
+        .values_list("catalog_date", flat=True)[: MAX_HISTORICAL_ENTRIES + BUFFER]
+    )
+    history_df = _get_price_history(card_ids, price_field, since=recent_catalog_dates[-1])
+    return _build_pivot_dataframe(history_df, price_field), len(recent_catalog_dates)
+
+
+def _upload_to_gsheets(final_df, cur_date, price_field, recent_dates_count, start_time, client=None, incremental=None):
     """Handle Google Sheets updates and calculate total end-to-end execution runtime."""
-    try:
-        gdrive_client = gspread.service_account(filename=settings.GOOGLE_SECRET_CREDENTIALS)
-        sheet = gdrive_client.open_by_key("1vQs3vlXHu7BELFoVuK4ysfzMeYHDxMdOWgPAGmPVZjk")
+    if incremental is None:
+        incremental = settings.GSHEETS_INCREMENTAL_EXPORT
 
-        # 1. Main Data Sheet Upload
-        ws_pm_bulk = sheet.worksheet("premodern_bulk")
-        ws_pm_bulk.clear()
-        ws_pm_bulk.update([final_df.columns.values.tolist()] + final_df.values.tolist())
+    try:
+        uploader = SheetsUploader()
+        gdrive_client = client or gspread.service_account(filename=settings.GOOGLE_SECRET_CREDENTIALS)
+        sheet = uploader.call("open spreadsheet", gdrive_client.open_by_key, SPREADSHEET_KEY)
+
+        # 1. Main Data Sheet Upload, only the cells that changed since the last upload when incremental
+        ws_pm_bulk = uploader.call("open premodern_bulk", sheet.worksheet, "premodern_bulk")
+        grid = dataframe_grid(final_df)
+        grid_snapshot = snapshot_path(SPREADSHEET_KEY, ws_pm_bulk.title)
+        if incremental:
+            sync_worksheet(sheet, ws_pm_bulk, grid, grid_snapshot, uploader=uploader)
+        else:
+            discard_snapshot(grid_snapshot)
+            uploader.call("premodern_bulk clear", ws_pm_bulk.clear)
+            uploader.write_grid(ws_pm_bulk, grid)
+            save_snapshot(grid_snapshot, grid)
 
         # 2. Stop the timer HERE after the upload finishes to get true total duration
         elapsed_seconds = time.perf_counter() - start_time
         mins, secs = divmod(elapsed_seconds, 60)
         runtime_str = f"{int(mins)}m {int(secs)}s" if mins > 0 else f"{secs:.2f} seconds"
 
-        # 3. Status Sheet Update
-        ws_status = sheet.worksheet("status")
-        ws_status.clear()
+        # 3. Status Sheet Update, always the same 7x2 block so it is overwritten in place
+        ws_status = uploader.call("open status", sheet.worksheet, "status")
         local_now = timezone.localtime(timezone.now())
-        ws_status.update(
+        uploader.call(
+            "status update",
+            ws_status.update,
             [
                 ["Metric", "Value"],
                 ["Last script run", local_now.strftime("%Y-%m-%d %H:%M:%S")],
@@ -131,8 +136,9 @@ def _upload_to_gsheets(final_df, cur_date, price_field, recent_dates_count, star
                 ["Price Metric Tracked", price_field.upper()],
                 ["Data Window", f"{recent_dates_count} entries"],
                 ["Total Cards Tracked", len(final_df)],
-            ]
+            ],
         )
+        uploader.log_timings()
         return f"Success: {len(final_df)} cards uploaded using {price_field} in {runtime_str}."
     except (GSpreadException, APIError) as err:
         return f"Google Sheets Error: {str(err)}"
@@ -140,8 +146,13 @@ def _upload_to_gsheets(final_df, cur_date, price_field, recent_dates_count, star
         return f"File System Error: {str(err)}"
 
 
-def export_top_cards_to_gdrive():
-    """Find the cheapest printing per metacard and track its 60-day history."""
+def export_top_cards_to_gdrive(client=None, incremental=None):
+    """
+    Find the cheapest printing per metacard and track its 60-day history.
+
+    client replaces the gspread service account client (e.g. the in-memory FakeClient of prices.tests) and
+    incremental overrides settings.GSHEETS_INCREMENTAL_EXPORT.
+    """
     start_time = time.perf_counter()  # Start the timer at the absolute beginning
     price_field = getattr(settings, "PRICE_FIELD", "trend")
 
@@ -149,33 +160,18 @@ def export_top_cards_to_gdrive():
     latest_cat = Catalog.objects.filter(catalog_id=Catalog.MTG, catalog_type=Catalog.PRICES).latest("catalog_date")
     cur_date = latest_cat.catalog_date
 
-    # 2. Fetch the top print IDs and metadata
-    cheapest_pks, card_metadata = _get_cheapest_premodern_prints(price_field, cur_date)
+    # 2. Fetch the top print IDs
+    cheapest_pks = _get_cheapest_premodern_prints(price_field, cur_date)
 
     if not cheapest_pks:
         return "Error: No matching Premodern cards found."
 
-    # 3. Fetch history targeting only those specific versions
-    recent_catalog_dates = list(
-        Catalog.objects.filter(catalog_id=Catalog.MTG, catalog_type=Catalog.PRICES)
-        .order_by("-catalog_date")
-        .values_list("catalog_date", flat=True)[: MAX_HISTORICAL_ENTRIES + BUFFER]
-    )
-
-    history_qs = (
-        MTGCardPrice.objects.filter(
-            catalog_date__in=recent_catalog_dates, card_id__in=cheapest_pks, **{f"{price_field}__gt": 0.01}
-        )
-        .order_by("card_id", "catalog_date")
-        .values_list("card_id", "catalog_date", price_field)
-    )
-
-    history_df = pd.DataFrame(list(history_qs), columns=["card_id", "catalog_date", price_field])
-
-    # 4. Transform using Pandas
-    final_df = _build_pivot_dataframe(history_df, card_metadata, price_field)
+    # 3. Fetch the history of those specific versions with their names and pivot it using Pandas
+    final_df, recent_dates_count = build_export_dataframe(cheapest_pks, price_field, cur_date)
     if final_df is None:
         return "Error: No history data found."
 
-    # 5. Upload via an isolated helper and pass down the initial start timestamp
-    return _upload_to_gsheets(final_df, cur_date, price_field, len(recent_catalog_dates), start_time)
+    # 4. Upload via an isolated helper and pass down the initial start timestamp
+    return _upload_to_gsheets(
+        final_df, cur_date, price_field, recent_dates_count, start_time, client=client, incremental=incremental
+    )
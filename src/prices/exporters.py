@@ -0,0 +1,246 @@
+import csv
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+
+from prices.models import (
+    MTGCardLeaderboard,
+    MTGCardPrice,
+    MTGCardPriceSlope,
+    MTGPriceArchive,
+    PriceGuideModel,
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only the parquet export needs it
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+
+class ExportDataset:
+    """
+    A table exported to local files: a queryset and its columns as (name, lookup, type).
+
+    type is one of 'int', 'float', 'str' or 'datetime'. partitions maps a partition name (e.g. 'date' or 'set')
+    to the lookup whose distinct values split the export into one file each (datetimes one per day);
+    date_lookup is filtered by the since argument of export_dataset(). live_prices marks a queryset of the live
+    MTGCardPrice table, which cannot export the months moved to the archive tier.
+    """
+
+    def __init__(self, name, queryset, columns, partitions=None, date_lookup=None, live_prices=False):
+        """Describe dataset name; queryset is a callable returning the rows to export."""
+        self.name = name
+        self.queryset = queryset
+        self.columns = columns
+        self.partitions = partitions or {}
+        self.date_lookup = date_lookup
+        self.live_prices = live_prices
+
+    @property
+    def column_names(self):
+        """Names of the exported columns, in file order."""
+        return [name for name, _, _ in self.columns]
+
+    def rows(self, since=None, **filters):
+        """Return the queryset of value tuples to export."""
+        queryset = self.queryset()
+        if since and self.date_lookup:
+            queryset = queryset.filter(**{f'{self.date_lookup}__gte': since})
+        return queryset.filter(**filters).values_list(*(lookup for _, lookup, _ in self.columns))
+
+    def partition_keys(self, partition_by, since=None):
+        """Return the sorted distinct values of the partition_by lookup."""
+        lookup = self.partitions[partition_by]
+        keys = self.rows(since).order_by().values_list(lookup, flat=True).distinct()
+        return sorted(keys, key=lambda key: (key is None, key))
+
+
+DATASETS = {
+    dataset.name: dataset
+    for dataset in (
+        ExportDataset(
+            'prices',
+            MTGCardPrice.objects.all,
+            [
+                ('card_id', 'card_id', 'int'),
+                ('expansion_id', 'card__expansion_id', 'int'),
+                ('catalog_date', 'catalog_date', 'datetime'),
+                *((field, MTGCardPrice.price_lookup(field), 'float') for field in PriceGuideModel.PRICE_FIELDS),
+            ],
+            partitions={'date': 'catalog_date', 'set': 'card__expansion_id'},
+            date_lookup='catalog_date',
+            live_prices=True,
+        ),
+        ExportDataset(
+            'slopes',
+            MTGCardPriceSlope.objects.all,
+            [
+                ('card_id', 'card_id', 'int'),
+                ('expansion_id', 'card__expansion_id', 'int'),
+                ('price_field', 'price_field', 'str'),
+                ('interval_days', 'interval_days', 'int'),
+                ('slope', 'slope', 'float'),
+                ('percent_change', 'percent_change', 'float'),
+                ('initial_price', 'initial_price', 'float'),
+                ('final_price', 'final_price', 'float'),
+                ('date_updated', 'date_updated', 'datetime'),
+            ],
+            partitions={'set': 'card__expansion_id'},
+        ),
+        ExportDataset(
+            'leaderboards',
+            MTGCardLeaderboard.objects.all,
+            [
+                ('format', 'format', 'str'),
+                ('interval_days', 'interval_days', 'int'),
+                ('price_field', 'price_field', 'str'),
+                ('direction', 'direction', 'int'),
+                ('rank', 'rank', 'int'),
+                ('card_id', 'card_id', 'int'),
+                ('name', 'name', 'str'),
+                ('expansion_code', 'expansion_code', 'str'),
+                ('percent_change', 'percent_change', 'float'),
+                ('slope', 'slope', 'float'),
+                ('initial_price', 'initial_price', 'float'),
+                ('final_price', 'final_price', 'float'),
+                ('date_updated', 'date_updated', 'datetime'),
+            ],
+            partitions={'format': 'format'},
+        ),
+    )
+}
+
+
+def _text(value):
+    """Return value as written to text formats: datetimes in ISO 8601, None left as is."""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+@contextmanager
+def csv_writer(path, dataset):
+    """Write rows to a CSV file with a header line, every field quoted; None becomes an empty field."""
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file, quoting=csv.QUOTE_ALL)
+        writer.writerow(dataset.column_names)
+
+        def write(rows):
+            writer.writerows([[_text(value) for value in row] for row in rows])
+
+        yield write
+
+
+@contextmanager
+def ndjson_writer(path, dataset):
+    """Write rows as one JSON object per line."""
+    columns = dataset.column_names
+    with open(path, 'w', encoding='utf-8') as file:
+
+        def write(rows):
+            file.writelines(json.dumps(dict(zip(columns, (_text(value) for value in row)))) + '\n' for row in rows)
+
+        yield write
+
+
+@contextmanager
+def parquet_writer(path, dataset):
+    """Write rows to a Parquet file, one row group per chunk. Needs pyarrow."""
+    if not pyarrow:
+        raise ImportError('Parquet export needs pyarrow: pip install pyarrow')
+
+    types = {
+        'int': pyarrow.int64(),
+        'float': pyarrow.float64(),
+        'str': pyarrow.string(),
+        'datetime': pyarrow.timestamp('us', tz='UTC'),
+    }
+    schema = pyarrow.schema([(name, types[column_type]) for name, _, column_type in dataset.columns])
+    with pyarrow.parquet.ParquetWriter(path, schema, compression='zstd') as writer:
+
+        def write(rows):
+            writer.write_table(pyarrow.Table.from_arrays(list(zip(*rows)), schema=schema))
+
+        yield write
+
+
+# {file format: context manager of (path, dataset) yielding a function that appends a chunk of value tuples}
+WRITERS = {
+    'csv': csv_writer,
+    'ndjson': ndjson_writer,
+    'parquet': parquet_writer,
+}
+
+
+def _write_file(path, dataset, writer, rows, chunk_size):
+    """Stream rows into path through writer, chunk_size rows at a time. Return the number of rows."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.name}.tmp')
+
+    count = 0
+    rows = rows.iterator(chunk_size=chunk_size)
+    with writer(tmp_path, dataset) as write:
+        while chunk := list(islice(rows, chunk_size)):
+            write(chunk)
+            count += len(chunk)
+
+    # readers never see a half written file
+    os.replace(tmp_path, path)
+    return count
+
+
+def _partition_name(key):
+    """Return the directory name part of a partition key, datetimes as their UTC day YYYY-MM-DD."""
+    return key.date().isoformat() if isinstance(key, datetime) else str(key)
+
+
+def export_dataset(name, file_format='csv', partition_by=None, since=None, path=None, chunk_size=None):
+    """
+    Export one of DATASETS ('prices', 'slopes' or 'leaderboards') to local files in bounded memory.
+
+    Rows are streamed from the database chunk_size at a time and written as csv, ndjson or parquet
+    (parquet needs pyarrow). partition_by (e.g. 'date' or 'set' for prices) writes one file per distinct
+    value in hive style directories, e.g. ``prices/date=2024-12-03/prices.parquet``, each with its own
+    query; datetimes are grouped by day, so catalogs of the same day share a file. Return
+    {file path: rows written}.
+
+    The prices dataset is read from the live table: once months are archived, since must start after them
+    (ValueError otherwise).
+    """
+    dataset = DATASETS[name]
+    if dataset.live_prices:
+        MTGPriceArchive.check_live(since, f'the {name} export')
+    writer = WRITERS[file_format]
+    root = Path(path or settings.LOCAL_EXPORT_DIR)
+    chunk_size = chunk_size or settings.LOCAL_EXPORT_CHUNK_SIZE
+    file_name = f'{name}.{file_format}'
+
+    if partition_by is None:
+        files = [(root / file_name, dataset.rows(since))]
+    else:
+        if partition_by not in dataset.partitions:
+            raise ValueError(f"{name} cannot be partitioned by {partition_by}, use one of {list(dataset.partitions)}")
+        lookup = dataset.partitions[partition_by]
+        partitions = {}
+        for key in dataset.partition_keys(partition_by, since):
+            partitions.setdefault(_partition_name(key), []).append(key)
+        files = [
+            (
+                root / name / f'{partition_by}={partition}' / file_name,
+                dataset.rows(since, **({lookup: keys[0]} if len(keys) == 1 else {f'{lookup}__in': keys})),
+            )
+            for partition, keys in partitions.items()
+        ]
+
+    written = {}
+    for file_path, rows in files:
+        written[str(file_path)] = _write_file(file_path, dataset, writer, rows, chunk_size)
+    logger.info("%d %s rows exported to %d %s files", sum(written.values()), name, len(written), file_format)
+    return written
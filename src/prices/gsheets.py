@@ -0,0 +1,242 @@
+import json
+import logging
+import random
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+logger = logging.getLogger(__name__)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class SheetsUploader:
+    """
+    Send Sheets API requests in bounded chunks, retrying the rate limited or failing ones.
+
+    Value ranges are grouped into batch_update requests of at most max_cells cells, splitting large ranges by
+    rows. Retryable APIErrors (429 and 5xx) are retried max_retries times with exponential backoff and full
+    jitter, honouring Retry-After when the API sends it. Requests that are not idempotent, like inserting
+    columns, are sent once. Every request is recorded in timings as (label, seconds, attempts).
+    """
+
+    def __init__(self, max_cells=None, max_retries=None, backoff=None, max_backoff=None, sleep=time.sleep):
+        """Use the GSHEETS_* settings for the limits not given, sleep waits between retries."""
+        self.max_cells = max_cells or settings.GSHEETS_MAX_CELLS_PER_REQUEST
+        self.max_retries = settings.GSHEETS_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.GSHEETS_BACKOFF_SECONDS if backoff is None else backoff
+        self.max_backoff = settings.GSHEETS_MAX_BACKOFF_SECONDS if max_backoff is None else max_backoff
+        self.sleep = sleep
+        self.timings = []
+
+    def _retry_delay(self, err, attempt):
+        """Return the seconds to wait before retrying after err, None when it should not be retried."""
+        if err.code not in RETRYABLE_STATUS_CODES or attempt > self.max_retries:
+            return None
+
+        retry_after = getattr(err.response, "headers", {}).get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))  # nosec B311
+
+    def call(self, label, method, *args, retry=True, **kwargs):
+        """Run one API request, retrying it on rate limits and server errors unless retry is False."""
+        start = time.perf_counter()
+        attempt = 1
+        while True:
+            try:
+                result = method(*args, **kwargs)
+                break
+            except APIError as err:
+                delay = self._retry_delay(err, attempt) if retry else None
+                if delay is None:
+                    self.timings.append((label, time.perf_counter() - start, attempt))
+                    raise
+                logger.warning("%s failed (%s), retry %d in %.1fs", label, err.code, attempt, delay)
+                self.sleep(delay)
+                attempt += 1
+
+        self.timings.append((label, time.perf_counter() - start, attempt))
+        return result
+
+    def _split_rows(self, item):
+        """Split a value range into ranges of at most max_cells cells, whole rows each."""
+        values = item["values"]
+        width = max([len(row) for row in values] or [1]) or 1
+        rows_per_chunk = max(1, self.max_cells // width)
+        if len(values) <= rows_per_chunk:
+            return [item]
+
+        row, column = a1_to_rowcol(item["range"].split(":")[0])
+        chunks = []
+        rows = iter(values)
+        while chunk := list(islice(rows, rows_per_chunk)):
+            last_cell = rowcol_to_a1(row + len(chunk) - 1, column + width - 1)
+            chunks.append({"range": f"{rowcol_to_a1(row, column)}:{last_cell}", "values": chunk})
+            row += len(chunk)
+        return chunks
+
+    def write_ranges(self, worksheet, data):
+        """Write value ranges with as few batch_update requests as max_cells allows. Return the request count."""
+        batches, batch, batch_cells = [], [], 0
+        for item in (part for item in data for part in self._split_rows(item)):
+            cells = sum(len(row) for row in item["values"])
+            if batch and batch_cells + cells > self.max_cells:
+                batches.append(batch)
+                batch, batch_cells = [], 0
+            batch.append(item)
+            batch_cells += cells
+        if batch:
+            batches.append(batch)
+
+        for number, batch in enumerate(batches, 1):
+            self.call(f"{worksheet.title} batch_update {number}/{len(batches)}", worksheet.batch_update, batch)
+        return len(batches)
+
+    def write_grid(self, worksheet, grid):
+        """Write a whole grid from A1, chunked by rows."""
+        width = max([len(row) for row in grid] or [1]) or 1
+        return self.write_ranges(worksheet, [{"range": f"A1:{rowcol_to_a1(len(grid), width)}", "values": grid}])
+
+    def log_timings(self):
+        """Log a summary of the requests sent so far."""
+        total = sum(seconds for _, seconds, _ in self.timings)
+        retries = sum(attempts - 1 for _, _, attempts in self.timings)
+        logger.info("%d Sheets requests in %.2fs (%d retries)", len(self.timings), total, retries)
+        for label, seconds, attempts in self.timings:
+            logger.debug("  %s: %.2fs, %d attempt(s)", label, seconds, attempts)
+
+
+def dataframe_grid(dataframe):
+    """Return a DataFrame as the list of rows sent to Sheets, header first."""
+    return [dataframe.columns.values.tolist()] + dataframe.values.tolist()
+
+
+def snapshot_path(spreadsheet_key, title):
+    """Local file holding the last grid uploaded to a worksheet."""
+    return Path(settings.GSHEETS_SNAPSHOT_DIR) / f"{spreadsheet_key}_{title}.json"
+
+
+def load_snapshot(path):
+    """Return the grid stored at path, None when there is none or it is unreadable."""
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(path, grid):
+    """Store grid at path."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(grid), encoding="utf-8")
+
+
+def discard_snapshot(path):
+    """Remove the snapshot at path, before requests after which it no longer matches the worksheet."""
+    Path(path).unlink(missing_ok=True)
+
+
+def inserted_columns(old_header, new_header, first_column):
+    """
+    Return how many columns were inserted at first_column between two headers, None when they do not overlap.
+
+    The export keeps the newest date first, so a new catalog shows up as the old first date moving right.
+    """
+    if len(old_header) <= first_column or len(new_header) <= first_column:
+        return None
+    try:
+        return new_header.index(old_header[first_column], first_column) - first_column
+    except ValueError:
+        return None
+
+
+def diff_ranges(old_grid, new_grid):
+    """
+    Return the value ranges turning old_grid into new_grid, one per run of changed cells in a row.
+
+    Cells outside new_grid but inside old_grid are blanked. Ranges use A1 notation, ready for batch_update.
+    """
+    height = max(len(old_grid), len(new_grid))
+    width = max([len(row) for row in old_grid + new_grid] or [0])
+
+    def cell(grid, row, column):
+        return grid[row][column] if row < len(grid) and column < len(grid[row]) else ""
+
+    data = []
+    for row in range(height):
+        column = 0
+        while column < width:
+            if cell(old_grid, row, column) == cell(new_grid, row, column):
+                column += 1
+                continue
+
+            start = column
+            while column < width and cell(old_grid, row, column) != cell(new_grid, row, column):
+                column += 1
+            values = [cell(new_grid, row, i) for i in range(start, column)]
+            data.append(
+                {
+                    "range": f"{rowcol_to_a1(row + 1, start + 1)}:{rowcol_to_a1(row + 1, column)}",
+                    "values": [values],
+                }
+            )
+    return data
+
+
+def sync_worksheet(spreadsheet, worksheet, grid, path, first_column=2, uploader=None):
+    """
+    Make worksheet show grid by sending only what changed since the snapshot stored at path.
+
+    Date columns inserted at first_column are mirrored with one insertDimension request (surplus columns on
+    the right are deleted in the same request), then the remaining cell differences go out as batch_update
+    requests of row ranges. Without a usable snapshot the worksheet is cleared and fully rewritten. The
+    snapshot is discarded before clearing or moving columns and saved again once every request succeeded, so
+    an interrupted sync is followed by a full rewrite. Requests go through uploader (a SheetsUploader by
+    default). Return the number of cells written.
+    """
+    uploader = uploader or SheetsUploader()
+    old_grid = load_snapshot(path)
+    shift = inserted_columns(old_grid[0], grid[0], first_column) if old_grid else None
+
+    if shift is None:
+        discard_snapshot(path)
+        uploader.call(f"{worksheet.title} clear", worksheet.clear)
+        uploader.write_grid(worksheet, grid)
+        save_snapshot(path, grid)
+        return sum(len(row) for row in grid)
+
+    new_width = len(grid[0])
+    old_width = len(old_grid[0]) + shift
+    old_grid = [row[:first_column] + [""] * shift + row[first_column:] for row in old_grid]
+
+    requests = []
+    if shift:
+        requests.append(_dimension_request("insertDimension", worksheet.id, first_column, first_column + shift))
+    if old_width > new_width:
+        requests.append(_dimension_request("deleteDimension", worksheet.id, new_width, old_width))
+        old_grid = [row[:new_width] for row in old_grid]
+    if requests:
+        # columns move even when a later request fails, the next run must not diff against the old snapshot
+        discard_snapshot(path)
+        # a retried insertDimension whose first attempt went through would insert the columns twice
+        uploader.call(f"{worksheet.title} columns", spreadsheet.batch_update, {"requests": requests}, retry=False)
+
+    data = diff_ranges(old_grid, grid)
+    uploader.write_ranges(worksheet, data)
+
+    save_snapshot(path, grid)
+    cells = sum(len(item["values"][0]) for item in data)
+    logger.info("%s: %d columns inserted, %d cells in %d ranges updated", worksheet.title, shift, cells, len(data))
+    return cells
+
+
+def _dimension_request(kind, sheet_id, start, end):
+    """Build an insertDimension/deleteDimension request over the columns [start, end)."""
+    request = {"range": {"sheetId": sheet_id, "dimension": "COLUMNS", "startIndex": start, "endIndex": end}}
+    if kind == "insertDimension":
+        request["inheritFromBefore"] = False
+    return {kind: request}
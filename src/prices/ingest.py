@@ -0,0 +1,319 @@
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Max
+from django.utils import timezone
+
+from prices.constants import EXCLUDED_EXPANSION_IDS, FORMAT_SETS
+from prices.models import (
+    MTGCard,
+    MTGCardLatestPrice,
+    MTGCardPrice,
+    MTGCardPriceMove,
+    MTGMetacardFloor,
+    MTGPriceArchive,
+    MTGPriceIndex,
+    PriceGuideModel,
+)
+
+logger = logging.getLogger(__name__)
+BATCH_SIZE = 5000
+FLOOR_MIN_PRICE = 0.01  # prices at or below this are placeholders, never a floor
+
+
+def update_latest_prices(prices, catalog_date):
+    """
+    Upsert the latest-price snapshot with freshly inserted prices of one catalog.
+
+    Cards whose snapshot already holds this or a newer catalog are left alone, so re-processing an
+    old catalog file never rolls the snapshot back. Meant to run inside the ingest transaction.
+    """
+
+    if not prices:
+        return 0
+
+    newer_card_ids = set(
+        MTGCardLatestPrice.objects.filter(catalog_date__gte=catalog_date).values_list('card_id', flat=True)
+    )
+    snapshots = [
+        MTGCardLatestPrice(
+            card_id=price.card_id,
+            catalog_date=catalog_date,
+            **{field: getattr(price, field) for field in PriceGuideModel.PRICE_FIELDS},
+        )
+        for price in prices
+        if price.card_id not in newer_card_ids
+    ]
+
+    MTGCardLatestPrice.objects.bulk_create(
+        snapshots,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['card'],
+        update_fields=['catalog_date', 'date_updated', *PriceGuideModel.PRICE_FIELDS],
+    )
+    logger.info("%d latest prices refreshed for %s", len(snapshots), catalog_date.date())
+    return len(snapshots)
+
+
+def _price_frame(catalog_date, fields, prices=None):
+    """Return a DataFrame of card_id and fields for one catalog, from prices in memory or from the database."""
+
+    if prices is None:
+        lookups = map(MTGCardPrice.price_lookup, fields)
+        rows = MTGCardPrice.objects.filter(catalog_date=catalog_date).values_list('card_id', *lookups)
+    else:
+        rows = ((price.card_id, *(getattr(price, field) for field in fields)) for price in prices)
+    return pd.DataFrame.from_records(rows, columns=['card_id', *fields])
+
+
+def _nullable(value):
+    """Return value as a float, or None when it is NaN."""
+    return None if math.isnan(value) else float(value)
+
+
+def record_price_moves(catalog_date, prices=None, fields=None):
+    """
+    Diff a catalog against the previous one and store the changes as MTGCardPriceMove rows.
+
+    prices are the catalog's MTGCardPrice objects when the caller already holds all of them, otherwise they
+    are read back with one query. Only changed, new and disappeared values of settings.MOVES_PRICE_FIELDS are
+    stored; existing moves of catalog_date are replaced. Meant to run inside the ingest transaction.
+    """
+
+    fields = list(fields or settings.MOVES_PRICE_FIELDS)
+    previous_date = MTGCardPrice.objects.filter(catalog_date__lt=catalog_date).aggregate(Max('catalog_date'))[
+        'catalog_date__max'
+    ]
+    if previous_date is None:
+        return 0
+
+    current = _price_frame(catalog_date, fields, prices)
+    previous = _price_frame(previous_date, fields)
+    merged = current.merge(previous, on='card_id', how='outer', suffixes=('', '_previous'))
+    card_ids = merged['card_id'].to_numpy()
+
+    moves = []
+    for field in fields:
+        price = merged[field].to_numpy(dtype=float, na_value=np.nan)
+        previous_price = merged[f'{field}_previous'].to_numpy(dtype=float, na_value=np.nan)
+        listed, was_listed = ~np.isnan(price), ~np.isnan(previous_price)
+
+        status = np.zeros(len(merged), dtype=np.int8)
+        status[listed & was_listed & (price != previous_price)] = MTGCardPriceMove.CHANGED
+        status[listed & ~was_listed] = MTGCardPriceMove.NEW
+        status[~listed & was_listed] = MTGCardPriceMove.DISAPPEARED
+
+        change = price - previous_price
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percent_change = np.where(previous_price > 0, change / previous_price * 100, np.nan)
+
+        for i in np.flatnonzero(status):
+            moves.append(
+                MTGCardPriceMove(
+                    card_id=int(card_ids[i]),
+                    catalog_date=catalog_date,
+                    previous_date=previous_date,
+                    price_field=field,
+                    status=int(status[i]),
+                    previous_price=_nullable(previous_price[i]),
+                    price=_nullable(price[i]),
+                    change=_nullable(change[i]),
+                    percent_change=_nullable(percent_change[i]),
+                )
+            )
+
+    MTGCardPriceMove.objects.filter(catalog_date=catalog_date).delete()
+    MTGCardPriceMove.objects.bulk_create(moves, batch_size=BATCH_SIZE)
+    logger.info("%d price moves recorded for %s against %s", len(moves), catalog_date.date(), previous_date.date())
+    return len(moves)
+
+
+def rebuild_price_moves(since=None):
+    """
+    Recompute the price moves of every catalog (or those from since on), e.g. after a backfill.
+
+    Raise ValueError when archived months would be in range, their moves were recorded before archiving.
+    """
+
+    MTGPriceArchive.check_live(since, 'rebuild_price_moves()')
+    catalog_dates = MTGCardPrice.objects.order_by('catalog_date').values_list('catalog_date', flat=True).distinct()
+    if since:
+        catalog_dates = catalog_dates.filter(catalog_date__gte=since)
+    return sum(record_price_moves(catalog_date) for catalog_date in list(catalog_dates))
+
+
+def _index_stats(prices):
+    """Return the MTGPriceIndex aggregates of a grouped or plain Series of prices."""
+
+    stats = prices.agg(['count', 'sum', 'mean', 'median'])
+    quantiles = prices.quantile([0.25, 0.75, 0.9])
+    if isinstance(prices, pd.Series):
+        stats, quantiles = stats.to_frame().T, quantiles.to_frame().T
+    else:
+        quantiles = quantiles.unstack()
+    quantiles.columns = ['p25', 'p75', 'p90']
+    return stats.rename(columns={'sum': 'total'}).join(quantiles)
+
+
+def price_index_rows(catalog_date, fields=None):
+    """
+    Compute the per-set and per-format price aggregates of one catalog with a single query.
+
+    Return a list of MTGPriceIndex field dicts, one per (scope, key, price field) having prices.
+    """
+
+    fields = list(fields or settings.INDEX_PRICE_FIELDS)
+    prices = pd.DataFrame.from_records(
+        MTGCardPrice.objects.filter(catalog_date=catalog_date).values_list(
+            'card__expansion_id', *map(MTGCardPrice.price_lookup, fields)
+        ),
+        columns=['expansion_id', *fields],
+    )
+
+    rows = []
+    for field in fields:
+        values = prices[['expansion_id', field]].dropna()
+        if values.empty:
+            continue  # no card priced on this field, e.g. a foil field of a small catalog
+        values[field] = values[field].astype(float)
+
+        groups = [(MTGPriceIndex.SET, _index_stats(values.groupby('expansion_id')[field]))]
+        for format_name, sets in FORMAT_SETS.items():
+            stats = _index_stats(values.loc[values['expansion_id'].isin(sets), field])
+            groups.append((MTGPriceIndex.FORMAT, stats.set_axis([format_name])))
+
+        for scope, stats in groups:
+            for key, stat in stats[stats['count'] > 0].iterrows():
+                scope_key = str(int(key)) if scope == MTGPriceIndex.SET else key
+                rows.append(
+                    {'scope': scope, 'scope_key': scope_key, 'catalog_date': catalog_date, 'price_field': field}
+                    | {column: float(stat[column]) for column in ('total', 'mean', 'median', 'p25', 'p75', 'p90')}
+                    | {'count': int(stat['count'])}
+                )
+    return rows
+
+
+def save_price_indices(rows):
+    """Upsert MTGPriceIndex rows given as field dicts."""
+
+    MTGPriceIndex.objects.bulk_create(
+        [MTGPriceIndex(**row) for row in rows],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['scope', 'scope_key', 'price_field', 'catalog_date'],
+        update_fields=['count', 'total', 'mean', 'median', 'p25', 'p75', 'p90', 'date_updated'],
+    )
+    return len(rows)
+
+
+def update_price_indices(catalog_date, fields=None):
+    """Refresh the set and format price indices of one catalog."""
+
+    saved = save_price_indices(price_index_rows(catalog_date, fields))
+    logger.info("%d price indices refreshed for %s", saved, catalog_date.date())
+    return saved
+
+
+def backfill_price_indices(since=None, workers=None, force=False):
+    """
+    Compute price indices for every catalog (or those from since on) missing them, in parallel.
+
+    Worker processes only read and aggregate; rows are written by this process, keeping SQLite to one writer.
+    Raise ValueError when archived months would be in range, their indices were computed before archiving.
+    """
+
+    MTGPriceArchive.check_live(since, 'backfill_price_indices()')
+    workers = workers or getattr(settings, 'ANALYTICS_WORKERS', None) or os.cpu_count() or 1
+    catalog_dates = MTGCardPrice.objects.order_by('catalog_date').values_list('catalog_date', flat=True).distinct()
+    if since:
+        catalog_dates = catalog_dates.filter(catalog_date__gte=since)
+    if not force:
+        indexed = MTGPriceIndex.objects.values_list('catalog_date', flat=True).distinct()
+        catalog_dates = catalog_dates.exclude(catalog_date__in=indexed)
+    catalog_dates = list(catalog_dates)
+    logger.info("Computing price indices for %d catalogs with %d workers", len(catalog_dates), workers)
+    if not catalog_dates:
+        return 0
+
+    # forked workers must not inherit open database connections
+    connections.close_all()
+
+    saved = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rows in pool.map(price_index_rows, catalog_dates):
+            saved += save_price_indices(rows)
+    return saved
+
+
+def update_metacard_floors(catalog_date, fields=None):
+    """
+    Store the cheapest print of every metacard in one catalog with one INSERT ... SELECT per price field.
+
+    ROW_NUMBER() ranks the prints of each metacard by price (lowest card id on ties) and only the first one
+    is inserted, converted from the integer cents of MTGCardPrice (MTGCardFoilPrice for foil fields) to euros.
+    Existing floors of catalog_date are replaced. Meant to run inside the ingest transaction.
+    """
+
+    fields = fields or settings.FLOOR_PRICE_FIELDS
+    quote = connection.ops.quote_name
+    floors_table = quote(MTGMetacardFloor._meta.db_table)
+    cards_table = quote(MTGCard._meta.db_table)
+    excluded = ', '.join(['%s'] * len(EXCLUDED_EXPANSION_IDS))
+    date_param = MTGMetacardFloor._meta.get_field('catalog_date').get_db_prep_value(catalog_date, connection)
+    now_param = MTGMetacardFloor._meta.get_field('date_created').get_db_prep_value(timezone.now(), connection)
+
+    inserted = 0
+    MTGMetacardFloor.objects.filter(catalog_date=catalog_date, price_field__in=fields).delete()
+    with connection.cursor() as cursor:
+        for field in fields:
+            if field not in PriceGuideModel.PRICE_FIELDS:
+                raise ValueError(f"Unknown price field: {field}")
+
+            column = quote(field)
+            price_field = MTGCardPrice.get_price_field(field)
+            prices_table = quote(price_field.model._meta.db_table)
+            min_price = price_field.get_prep_value(FLOOR_MIN_PRICE)  # cents
+            cursor.execute(  # nosemgrep
+                f"""
+                INSERT INTO {floors_table}
+                    (metacard_id, catalog_date, price_field, card_id, price, date_created, date_updated, obs, active)
+                SELECT metacard_id, catalog_date, %s, card_id, price, %s, %s, '', %s
+                FROM (
+                    SELECT c.metacard_id, p.catalog_date, p.card_id, p.{column} / 100.0 AS price,
+                           ROW_NUMBER() OVER (PARTITION BY c.metacard_id ORDER BY p.{column}, p.card_id) AS floor_rank
+                    FROM {prices_table} p
+                    INNER JOIN {cards_table} c ON c.cm_id = p.card_id
+                    WHERE p.catalog_date = %s AND p.{column} > %s AND c.expansion_id NOT IN ({excluded})
+                ) ranked
+                WHERE floor_rank = 1
+                """,  # nosec B608 - identifiers come from model metadata and PRICE_FIELDS, values are parameters
+                [field, now_param, now_param, True, date_param, min_price, *EXCLUDED_EXPANSION_IDS],
+            )
+            inserted += cursor.rowcount
+
+    logger.info("%d metacard floors stored for %s", inserted, catalog_date.date())
+    return inserted
+
+
+def backfill_metacard_floors(since=None, force=False):
+    """
+    Store metacard floors for every catalog (or those from since on) missing them.
+
+    Raise ValueError when archived months would be in range, their floors were stored before archiving.
+    """
+
+    MTGPriceArchive.check_live(since, 'backfill_metacard_floors()')
+    catalog_dates = MTGCardPrice.objects.order_by('catalog_date').values_list('catalog_date', flat=True).distinct()
+    if since:
+        catalog_dates = catalog_dates.filter(catalog_date__gte=since)
+    if not force:
+        stored = MTGMetacardFloor.objects.values_list('catalog_date', flat=True).distinct()
+        catalog_dates = catalog_dates.exclude(catalog_date__in=stored)
+    return sum(update_metacard_floors(catalog_date) for catalog_date in list(catalog_dates))
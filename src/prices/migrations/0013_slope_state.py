@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-19 00:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0012_mtgcard_idx_card_meta_cm"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGCardPriceSlopeState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                ("interval_days", models.PositiveSmallIntegerField()),
+                ("last_date", models.DateTimeField()),
+                ("points", models.JSONField(default=list)),
+                ("origin", models.FloatField()),
+                ("sum_time", models.FloatField()),
+                ("sum_price", models.FloatField()),
+                ("sum_time_price", models.FloatField()),
+                ("sum_time_squared", models.FloatField()),
+                (
+                    "card",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="slope_states",
+                        to="prices.mtgcard",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("card", "interval_days"),
+                        name="unique_state_card_interval",
+                    )
+                ],
+            },
+        ),
+    ]
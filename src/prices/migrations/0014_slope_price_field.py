@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-19 01:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0013_slope_state"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="mtgcardpriceslope",
+            name="unique_card_interval",
+        ),
+        migrations.RemoveConstraint(
+            model_name="mtgcardpriceslopestate",
+            name="unique_state_card_interval",
+        ),
+        migrations.RemoveIndex(
+            model_name="mtgcardpriceslope",
+            name="idx_slope_interval_change",
+        ),
+        migrations.AddField(
+            model_name="mtgcardpriceslope",
+            name="price_field",
+            field=models.CharField(default="trend", max_length=16),
+        ),
+        migrations.AddField(
+            model_name="mtgcardpriceslopestate",
+            name="price_field",
+            field=models.CharField(default="trend", max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name="mtgcardpriceslope",
+            index=models.Index(
+                fields=["interval_days", "price_field", "percent_change"],
+                name="idx_slope_interval_change",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="mtgcardpriceslope",
+            constraint=models.UniqueConstraint(
+                fields=("card", "price_field", "interval_days"),
+                name="unique_card_field_interval",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="mtgcardpriceslopestate",
+            constraint=models.UniqueConstraint(
+                fields=("card", "price_field", "interval_days"),
+                name="unique_state_card_field_interval",
+            ),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2 on 2026-10-19 01:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0014_slope_price_field"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGCardLeaderboard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                ("format", models.CharField(max_length=16)),
+                ("interval_days", models.PositiveSmallIntegerField()),
+                ("price_field", models.CharField(max_length=16)),
+                (
+                    "direction",
+                    models.PositiveSmallIntegerField(choices=[(1, "Gainers"), (2, "Losers")]),
+                ),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("name", models.CharField(max_length=255)),
+                ("expansion_code", models.CharField(blank=True, max_length=10)),
+                ("percent_change", models.FloatField()),
+                ("slope", models.FloatField()),
+                ("initial_price", models.FloatField()),
+                ("final_price", models.FloatField()),
+                (
+                    "card",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="leaderboard_entries",
+                        to="prices.mtgcard",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "format",
+                            "interval_days",
+                            "price_field",
+                            "direction",
+                            "rank",
+                        ),
+                        name="unique_leaderboard_rank",
+                    )
+                ],
+            },
+        ),
+    ]
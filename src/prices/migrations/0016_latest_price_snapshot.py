@@ -0,0 +1,124 @@
+# Generated by Django 5.2 on 2026-10-19 01:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+PRICE_FIELDS = (
+    "avg",
+    "low",
+    "trend",
+    "avg1",
+    "avg7",
+    "avg30",
+    "avg_foil",
+    "low_foil",
+    "trend_foil",
+    "avg1_foil",
+    "avg7_foil",
+    "avg30_foil",
+)
+BATCH_SIZE = 5000
+
+
+def backfill_latest_prices(apps, schema_editor):
+    """Fill the snapshot with the newest price row of every card."""
+
+    card_price = apps.get_model("prices", "MTGCardPrice")
+    latest_price = apps.get_model("prices", "MTGCardLatestPrice")
+
+    latest = (
+        card_price.objects.annotate(
+            row_number=Window(RowNumber(), partition_by=[F("card_id")], order_by=F("catalog_date").desc())
+        )
+        .filter(row_number=1)
+        .values("card_id", "catalog_date", *PRICE_FIELDS)
+    )
+
+    batch = []
+    for row in latest.iterator(chunk_size=BATCH_SIZE):
+        batch.append(latest_price(**row))
+        if len(batch) >= BATCH_SIZE:
+            latest_price.objects.bulk_create(batch)
+            batch = []
+    latest_price.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0015_movers_leaderboard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGCardLatestPrice",
+            fields=[
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                ("avg", models.FloatField(null=True, verbose_name="Average price")),
+                ("low", models.FloatField(null=True, verbose_name="Low price")),
+                ("trend", models.FloatField(null=True, verbose_name="Trend price")),
+                (
+                    "avg1",
+                    models.FloatField(null=True, verbose_name="Average price for 1 day"),
+                ),
+                (
+                    "avg7",
+                    models.FloatField(null=True, verbose_name="Average price for 7 days"),
+                ),
+                (
+                    "avg30",
+                    models.FloatField(null=True, verbose_name="Average price for 30 days"),
+                ),
+                (
+                    "avg_foil",
+                    models.FloatField(null=True, verbose_name="Foil average price"),
+                ),
+                (
+                    "low_foil",
+                    models.FloatField(null=True, verbose_name="Foil low price"),
+                ),
+                (
+                    "trend_foil",
+                    models.FloatField(null=True, verbose_name="Foil trend price"),
+                ),
+                (
+                    "avg1_foil",
+                    models.FloatField(null=True, verbose_name="Foil average price for 1 day"),
+                ),
+                (
+                    "avg7_foil",
+                    models.FloatField(null=True, verbose_name="Foil average price for 7 days"),
+                ),
+                (
+                    "avg30_foil",
+                    models.FloatField(null=True, verbose_name="Foil average price for 30 days"),
+                ),
+                (
+                    "card",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="latest_price",
+                        serialize=False,
+                        to="prices.mtgcard",
+                    ),
+                ),
+                ("catalog_date", models.DateTimeField(verbose_name="Catalog Date")),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(backfill_latest_prices, migrations.RunPython.noop),
+    ]
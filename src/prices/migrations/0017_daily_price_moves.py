@@ -0,0 +1,79 @@
+# Generated by Django 5.2 on 2026-10-19 01:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0016_latest_price_snapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGCardPriceMove",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                ("catalog_date", models.DateTimeField(verbose_name="Catalog Date")),
+                (
+                    "previous_date",
+                    models.DateTimeField(null=True, verbose_name="Previous Catalog Date"),
+                ),
+                ("price_field", models.CharField(max_length=16)),
+                (
+                    "status",
+                    models.PositiveSmallIntegerField(choices=[(1, "Changed"), (2, "New"), (3, "Disappeared")]),
+                ),
+                ("previous_price", models.FloatField(null=True)),
+                ("price", models.FloatField(null=True)),
+                ("change", models.FloatField(null=True)),
+                ("percent_change", models.FloatField(null=True)),
+                (
+                    "card",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_moves",
+                        to="prices.mtgcard",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["catalog_date", "price_field", "percent_change"],
+                        name="idx_move_date_change",
+                    ),
+                    models.Index(
+                        fields=["catalog_date", "price_field", "status"],
+                        name="idx_move_date_status",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("card", "catalog_date", "price_field"),
+                        name="unique_card_move_per_day",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-19 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0017_daily_price_moves"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGPriceIndex",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                (
+                    "scope",
+                    models.PositiveSmallIntegerField(choices=[(1, "Set"), (2, "Format")]),
+                ),
+                ("scope_key", models.CharField(max_length=16)),
+                ("catalog_date", models.DateTimeField(verbose_name="Catalog Date")),
+                ("price_field", models.CharField(max_length=16)),
+                ("count", models.PositiveIntegerField(verbose_name="Cards with price")),
+                ("total", models.FloatField()),
+                ("mean", models.FloatField()),
+                ("median", models.FloatField()),
+                ("p25", models.FloatField(verbose_name="25th percentile")),
+                ("p75", models.FloatField(verbose_name="75th percentile")),
+                ("p90", models.FloatField(verbose_name="90th percentile")),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("scope", "scope_key", "price_field", "catalog_date"),
+                        name="unique_price_index_per_day",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2 on 2026-10-19 01:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0018_price_indices"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGCardRollingStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                ("price_field", models.CharField(max_length=16)),
+                ("window_days", models.PositiveSmallIntegerField()),
+                ("last_date", models.DateTimeField()),
+                ("price", models.FloatField()),
+                ("ema", models.FloatField(verbose_name="Exponential moving average")),
+                (
+                    "std",
+                    models.FloatField(null=True, verbose_name="Standard deviation"),
+                ),
+                ("zscore", models.FloatField(null=True)),
+                (
+                    "max_drawdown",
+                    models.FloatField(null=True, verbose_name="Max drawdown %"),
+                ),
+                (
+                    "card",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rolling_stats",
+                        to="prices.mtgcard",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["window_days", "price_field", "zscore"],
+                        name="idx_rolling_zscore",
+                    ),
+                    models.Index(
+                        fields=["window_days", "price_field", "max_drawdown"],
+                        name="idx_rolling_drawdown",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("card", "price_field", "window_days"),
+                        name="unique_rolling_stats_card_field_window",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2 on 2026-10-19 01:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0019_rolling_stats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGMetacardFloor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                ("metacard_id", models.PositiveIntegerField()),
+                ("catalog_date", models.DateTimeField(verbose_name="Catalog Date")),
+                ("price_field", models.CharField(max_length=16)),
+                ("price", models.FloatField()),
+                (
+                    "card",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="floors",
+                        to="prices.mtgcard",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["catalog_date", "price_field", "price"],
+                        name="idx_floor_date_price",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("metacard_id", "catalog_date", "price_field"),
+                        name="unique_metacard_floor_per_day",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2 on 2026-10-19 02:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+PARTITION_MONTHS_AHEAD = 2
+
+
+def partition_prices_by_month(apps, schema_editor):
+    """Partition the MySQL price table by catalog month, primary key (id, catalog_date). Nothing to do elsewhere."""
+
+    connection = schema_editor.connection
+    if connection.vendor != "mysql":
+        return
+
+    mtg_card_price = apps.get_model("prices", "MTGCardPrice")
+    table = connection.ops.quote_name(mtg_card_price._meta.db_table)
+    first_date = mtg_card_price.objects.order_by("catalog_date").values_list("catalog_date", flat=True).first()
+    month = (first_date or timezone.now()).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    now = timezone.now()
+    last = (now.year * 12 + now.month - 1) + PARTITION_MONTHS_AHEAD
+
+    definitions = []
+    while month.year * 12 + month.month - 1 <= last:
+        following = month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+        definitions.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{following:%Y-%m-%d}')")
+        month = following
+    definitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+
+    schema_editor.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, catalog_date)")  # nosemgrep
+    schema_editor.execute(  # nosemgrep
+        f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS(catalog_date) ({', '.join(definitions)})"
+    )
+
+
+def unpartition_prices(apps, schema_editor):
+    """Undo partition_prices_by_month()."""
+
+    connection = schema_editor.connection
+    if connection.vendor != "mysql":
+        return
+
+    table = connection.ops.quote_name(apps.get_model("prices", "MTGCardPrice")._meta.db_table)
+    schema_editor.execute(f"ALTER TABLE {table} REMOVE PARTITIONING")  # nosemgrep
+    schema_editor.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id)")  # nosemgrep
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0020_metacard_floors"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGPriceArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                ("month", models.DateTimeField(unique=True)),
+                ("first_date", models.DateTimeField()),
+                ("last_date", models.DateTimeField()),
+                ("rows", models.PositiveIntegerField()),
+                ("location", models.CharField(max_length=255)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AlterField(
+            model_name="mtgcardprice",
+            name="card",
+            field=models.ForeignKey(
+                db_constraint=False,
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="prices",
+                to="prices.mtgcard",
+            ),
+        ),
+        migrations.RunPython(partition_prices_by_month, unpartition_prices),
+    ]
@@ -0,0 +1,243 @@
+# Generated by Django 5.2 on 2026-10-19 02:10
+
+import os
+import sqlite3
+import stat
+
+from django.db import migrations
+
+import lib.models
+
+PRICE_FIELDS = (
+    "avg",
+    "low",
+    "trend",
+    "avg1",
+    "avg7",
+    "avg30",
+    "avg_foil",
+    "low_foil",
+    "trend_foil",
+    "avg1_foil",
+    "avg7_foil",
+    "avg30_foil",
+)
+BATCH_SIZE = 100_000
+
+
+def _scaled_assignments(quote, factor):
+    """Return the SET clause multiplying every price column by factor: whole cents up, two decimals down."""
+
+    digits = 2 if factor < 1 else 0
+    return ", ".join(f"{quote(field)} = ROUND({quote(field)} * {factor}, {digits})" for field in PRICE_FIELDS)
+
+
+def _scale_prices(schema_editor, table, factor, batch_column):
+    """Multiply every price column of table by factor, rounding to cents, batch_column range by range."""
+
+    quote = schema_editor.connection.ops.quote_name
+    column = quote(batch_column)
+    assignments = _scaled_assignments(quote, factor)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN({column}), MAX({column}) FROM {quote(table)}")  # nosec B608  # nosemgrep
+        first, last = cursor.fetchone()
+        if first is None:
+            return
+        for start in range(first, last + 1, BATCH_SIZE):
+            cursor.execute(  # nosemgrep
+                f"UPDATE {quote(table)} SET {assignments} WHERE {column} >= %s AND {column} < %s",  # nosec B608
+                [start, start + BATCH_SIZE],
+            )
+
+
+def _scale_archives(apps, schema_editor, factor):
+    """Scale the months already moved to the archive tier (prices.partitions) the same way."""
+
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    assignments = _scaled_assignments(quote, factor)
+    table = apps.get_model("prices", "MTGCardPrice")._meta.db_table
+    for location in apps.get_model("prices", "MTGPriceArchive").objects.values_list("location", flat=True):
+        if connection.vendor == "mysql":
+            _scale_prices(schema_editor, location, factor, "id")
+            continue
+
+        mode = os.stat(location).st_mode
+        os.chmod(location, mode | stat.S_IWUSR)
+        with sqlite3.connect(location) as archive:
+            archive.execute(f"UPDATE {quote(table)} SET {assignments}")  # nosec B608  # nosemgrep
+        archive.close()
+        os.chmod(location, mode)
+
+
+def _modify_mysql_columns(schema_editor, table, column_type):
+    """Change every price column of table to column_type with a single ALTER TABLE."""
+
+    quote = schema_editor.connection.ops.quote_name
+    changes = ", ".join(f"MODIFY {quote(field)} {column_type} NULL" for field in PRICE_FIELDS)
+    schema_editor.execute(f"ALTER TABLE {quote(table)} {changes}")  # nosemgrep
+
+
+def prices_to_cents(apps, schema_editor):
+    """
+    Convert the price columns from float euros to integer cents.
+
+    Values are scaled in place in batches while the columns still hold floats, then every column of a table
+    changes type at once: one ALTER TABLE on MySQL, one table rebuild on SQLite (Django would rebuild once
+    per column).
+    """
+
+    for model_name, batch_column in (("MTGCardPrice", "id"), ("MTGCardLatestPrice", "card_id")):
+        model = apps.get_model("prices", model_name)
+        _scale_prices(schema_editor, model._meta.db_table, 100, batch_column)
+        if schema_editor.connection.vendor == "mysql":
+            _modify_mysql_columns(schema_editor, model._meta.db_table, "integer")
+        else:
+            schema_editor._remake_table(model)  # pylint: disable=protected-access
+    _scale_archives(apps, schema_editor, 100)
+
+
+def prices_to_euros(apps, schema_editor):
+    """Convert the price columns back to float euros."""
+
+    for model_name, batch_column in (("MTGCardPrice", "id"), ("MTGCardLatestPrice", "card_id")):
+        table = apps.get_model("prices", model_name)._meta.db_table
+        if schema_editor.connection.vendor == "mysql":
+            _modify_mysql_columns(schema_editor, table, "double precision")
+        _scale_prices(schema_editor, table, 0.01, batch_column)
+    _scale_archives(apps, schema_editor, 0.01)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0021_price_archive_tier"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="avg",
+                    field=lib.models.CentsField(null=True, verbose_name="Average price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="avg1",
+                    field=lib.models.CentsField(null=True, verbose_name="Average price for 1 day"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="avg1_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil average price for 1 day"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="avg30",
+                    field=lib.models.CentsField(null=True, verbose_name="Average price for 30 days"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="avg30_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil average price for 30 days"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="avg7",
+                    field=lib.models.CentsField(null=True, verbose_name="Average price for 7 days"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="avg7_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil average price for 7 days"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="avg_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil average price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="low",
+                    field=lib.models.CentsField(null=True, verbose_name="Low price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="low_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil low price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="trend",
+                    field=lib.models.CentsField(null=True, verbose_name="Trend price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardlatestprice",
+                    name="trend_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil trend price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="avg",
+                    field=lib.models.CentsField(null=True, verbose_name="Average price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="avg1",
+                    field=lib.models.CentsField(null=True, verbose_name="Average price for 1 day"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="avg1_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil average price for 1 day"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="avg30",
+                    field=lib.models.CentsField(null=True, verbose_name="Average price for 30 days"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="avg30_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil average price for 30 days"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="avg7",
+                    field=lib.models.CentsField(null=True, verbose_name="Average price for 7 days"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="avg7_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil average price for 7 days"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="avg_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil average price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="low",
+                    field=lib.models.CentsField(null=True, verbose_name="Low price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="low_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil low price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="trend",
+                    field=lib.models.CentsField(null=True, verbose_name="Trend price"),
+                ),
+                migrations.AlterField(
+                    model_name="mtgcardprice",
+                    name="trend_foil",
+                    field=lib.models.CentsField(null=True, verbose_name="Foil trend price"),
+                ),
+            ],
+        ),
+        migrations.RunPython(prices_to_cents, prices_to_euros),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2 on 2026-10-19 02:16
+
+from django.db import migrations, models
+
+BATCH_SIZE = 100_000
+
+
+def _id_batches(cursor, table):
+    """Yield (start, end) id ranges of BATCH_SIZE covering table."""
+
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")  # nosec B608  # nosemgrep
+    first, last = cursor.fetchone()
+    if first is not None:
+        for start in range(first, last + 1, BATCH_SIZE):
+            yield start, start + BATCH_SIZE
+
+
+def drop_cm_id(apps, schema_editor):
+    """
+    Drop the cm_id copy of card_id and key price rows by (card, catalog_date) with a single table change.
+
+    cm_id is checked against card_id range by range first, so the new unique key cannot reject rows. MySQL
+    then drops the column and swaps the indexes in one online ALTER TABLE; SQLite rebuilds the table once.
+    """
+
+    connection = schema_editor.connection
+    model = apps.get_model("prices", "MTGCardPrice")
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        for start, end in _id_batches(cursor, table):
+            cursor.execute(  # nosemgrep
+                f"SELECT COUNT(*) FROM {table} WHERE id >= %s AND id < %s AND cm_id <> card_id",  # nosec B608
+                [start, end],
+            )
+            if cursor.fetchone()[0]:
+                raise ValueError(f"Prices with cm_id different from card_id between ids {start} and {end}")
+
+    if connection.vendor == "mysql":
+        schema_editor.execute(
+            f"ALTER TABLE {table} DROP INDEX unique_card_price_per_day, DROP INDEX idx_price_card_date, "
+            "DROP COLUMN cm_id, ADD CONSTRAINT unique_card_price_per_day UNIQUE (card_id, catalog_date), "
+            "ALGORITHM=INPLACE, LOCK=NONE"
+        )
+    else:
+        schema_editor._remake_table(model)  # pylint: disable=protected-access
+
+
+def restore_cm_id(apps, schema_editor):
+    """Add cm_id back, filled from card_id in batches, with its unique key and the card history index."""
+
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(apps.get_model("prices", "MTGCardPrice")._meta.db_table)
+    schema_editor.execute(f"ALTER TABLE {table} ADD COLUMN cm_id integer NOT NULL DEFAULT 0")  # nosemgrep
+    with connection.cursor() as cursor:
+        for start, end in _id_batches(cursor, table):
+            cursor.execute(  # nosemgrep
+                f"UPDATE {table} SET cm_id = card_id WHERE id >= %s AND id < %s",  # nosec B608
+                [start, end],
+            )
+
+    if connection.vendor == "mysql":
+        schema_editor.execute(
+            f"ALTER TABLE {table} DROP INDEX unique_card_price_per_day, "
+            "ADD CONSTRAINT unique_card_price_per_day UNIQUE (catalog_date, cm_id), "
+            "ADD INDEX idx_price_card_date (card_id, catalog_date)"
+        )
+    else:
+        schema_editor.execute(  # nosemgrep
+            f"CREATE UNIQUE INDEX unique_card_price_per_day ON {table} (catalog_date, cm_id)"
+        )
+        schema_editor.execute(f"CREATE INDEX idx_price_card_date ON {table} (card_id, catalog_date)")  # nosemgrep
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0022_price_cents"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveConstraint(
+                    model_name="mtgcardprice",
+                    name="unique_card_price_per_day",
+                ),
+                migrations.RemoveIndex(
+                    model_name="mtgcardprice",
+                    name="idx_price_card_date",
+                ),
+                migrations.RemoveField(
+                    model_name="mtgcardprice",
+                    name="cm_id",
+                ),
+                migrations.AddConstraint(
+                    model_name="mtgcardprice",
+                    constraint=models.UniqueConstraint(
+                        fields=("card", "catalog_date"), name="unique_card_price_per_day"
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(drop_cm_id, restore_cm_id),
+    ]
@@ -0,0 +1,293 @@
+# Generated by Django 5.2 on 2026-10-19 02:22
+
+import os
+import sqlite3
+import stat
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import lib.models
+
+FOIL_PRICE_FIELDS = (
+    "avg_foil",
+    "low_foil",
+    "trend_foil",
+    "avg1_foil",
+    "avg7_foil",
+    "avg30_foil",
+)
+BATCH_SIZE = 100_000
+
+
+def _columns(quote, prefix=""):
+    """Return the foil price columns as a select list."""
+    return ", ".join(f"{prefix}{quote(field)}" for field in FOIL_PRICE_FIELDS)
+
+
+def _present(quote):
+    """Return the condition of a row having a foil price: any of them set and not zero."""
+    return " OR ".join(f"{quote(field)} <> 0" for field in FOIL_PRICE_FIELDS)
+
+
+def _copy_foil_prices(cursor, quote, source, target, batch=None):
+    """Insert the rows of source having a foil price into target, optionally for an id range only."""
+
+    where = f"({_present(quote)})"
+    if batch:
+        where += " AND id >= %s AND id < %s"
+    cursor.execute(
+        f"INSERT INTO {target} (card_id, catalog_date, {_columns(quote)}) "
+        f"SELECT card_id, catalog_date, {_columns(quote)} FROM {source} WHERE {where}",  # nosec B608
+        list(batch or []),
+    )
+
+
+def _restore_foil_prices(cursor, connection, source, target, batch=None):
+    """Set the foil price columns of target from the rows of source, optionally for an id range of target."""
+
+    quote = connection.ops.quote_name
+    params = list(batch or [])
+    if connection.vendor == "mysql":
+        assignments = ", ".join(f"p.{quote(field)} = f.{quote(field)}" for field in FOIL_PRICE_FIELDS)
+        where = "WHERE p.id >= %s AND p.id < %s" if batch else ""
+        cursor.execute(
+            f"UPDATE {target} p INNER JOIN {source} f "  # nosec B608
+            f"ON f.card_id = p.card_id AND f.catalog_date = p.catalog_date SET {assignments} {where}",
+            params,
+        )
+    else:
+        assignments = ", ".join(f"{quote(field)} = f.{quote(field)}" for field in FOIL_PRICE_FIELDS)
+        where = f" AND {target}.id >= %s AND {target}.id < %s" if batch else ""
+        cursor.execute(
+            f"UPDATE {target} SET {assignments} FROM {source} f "  # nosec B608
+            f"WHERE f.card_id = {target}.card_id AND f.catalog_date = {target}.catalog_date{where}",
+            params,
+        )
+
+
+def _id_batches(cursor, table):
+    """Yield (start, end) id ranges of BATCH_SIZE covering table."""
+
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")  # nosec B608  # nosemgrep
+    first, last = cursor.fetchone()
+    if first is not None:
+        for start in range(first, last + 1, BATCH_SIZE):
+            yield start, start + BATCH_SIZE
+
+
+def _partition_like_prices(cursor, connection, prices_table, foil_table):
+    """Partition the MySQL foil price table by catalog month like the price table (migration 0021)."""
+
+    cursor.execute(
+        "SELECT partition_name, partition_description FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL "
+        "ORDER BY partition_ordinal_position",
+        [prices_table],
+    )
+    definitions = [f"PARTITION {name} VALUES LESS THAN ({bound})" for name, bound in cursor.fetchall()]
+    if definitions:
+        table = connection.ops.quote_name(foil_table)
+        cursor.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, catalog_date)")  # nosemgrep
+        cursor.execute(  # nosemgrep
+            f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS(catalog_date) ({', '.join(definitions)})"
+        )
+
+
+def _writable_archive(location):
+    """Open an archive database file for writing, return (connection, original mode)."""
+
+    mode = os.stat(location).st_mode
+    os.chmod(location, mode | stat.S_IWUSR)
+    return sqlite3.connect(location), mode
+
+
+def _split_archives(apps, connection, prices_table, foil_table):
+    """Move the foil prices of the months already in the archive tier (prices.partitions) to their own table."""
+
+    quote = connection.ops.quote_name
+    drops = ", ".join(f"DROP COLUMN {quote(field)}" for field in FOIL_PRICE_FIELDS)
+    for archive in apps.get_model("prices", "MTGPriceArchive").objects.all():
+        if connection.vendor == "mysql":
+            target = quote(f"{foil_table}_{archive.month:%Y%m}")
+            with connection.cursor() as cursor:
+                cursor.execute(f"CREATE TABLE {target} LIKE {quote(foil_table)}")  # nosemgrep
+                cursor.execute(f"ALTER TABLE {target} REMOVE PARTITIONING")  # nosemgrep
+                _copy_foil_prices(cursor, quote, quote(archive.location), target)
+                cursor.execute(f"ALTER TABLE {quote(archive.location)} {drops}")  # nosemgrep
+            continue
+
+        archive_connection, mode = _writable_archive(archive.location)
+        with archive_connection:
+            archive_connection.execute(
+                f"CREATE TABLE {quote(foil_table)} AS SELECT card_id, catalog_date, {_columns(quote)} "  # nosec B608
+                f"FROM {quote(prices_table)} WHERE {_present(quote)} ORDER BY card_id, catalog_date"
+            )
+            archive_connection.execute(  # nosemgrep
+                f"CREATE INDEX idx_archive_foil_card_date ON {quote(foil_table)} (card_id, catalog_date)"
+            )
+            for field in FOIL_PRICE_FIELDS:
+                archive_connection.execute(f"ALTER TABLE {quote(prices_table)} DROP COLUMN {quote(field)}")  # nosemgrep
+        archive_connection.execute("VACUUM")
+        archive_connection.close()
+        os.chmod(archive.location, mode)
+
+
+def _merge_archives(apps, connection, prices_table, foil_table):
+    """Undo _split_archives()."""
+
+    quote = connection.ops.quote_name
+    for archive in apps.get_model("prices", "MTGPriceArchive").objects.all():
+        if connection.vendor == "mysql":
+            source = quote(f"{foil_table}_{archive.month:%Y%m}")
+            additions = ", ".join(f"ADD COLUMN {quote(field)} integer NULL" for field in FOIL_PRICE_FIELDS)
+            with connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {quote(archive.location)} {additions}")  # nosemgrep
+                _restore_foil_prices(cursor, connection, source, quote(archive.location))
+                cursor.execute(f"DROP TABLE {source}")  # nosemgrep
+            continue
+
+        archive_connection, mode = _writable_archive(archive.location)
+        with archive_connection:
+            for field in FOIL_PRICE_FIELDS:
+                archive_connection.execute(  # nosemgrep
+                    f"ALTER TABLE {quote(prices_table)} ADD COLUMN {quote(field)} integer NULL"
+                )
+            _restore_foil_prices(archive_connection.cursor(), connection, quote(foil_table), quote(prices_table))
+            archive_connection.execute(f"DROP TABLE {quote(foil_table)}")  # nosemgrep
+        archive_connection.close()
+        os.chmod(archive.location, mode)
+
+
+def split_foil_prices(apps, schema_editor):
+    """
+    Move the foil prices to the MTGCardFoilPrice side table and drop their columns from the price table.
+
+    Only rows with a foil price set and not zero are copied, in batches of price ids. The columns are then
+    dropped with one ALTER TABLE on MySQL, after partitioning the side table like the price table, and one
+    table rebuild on SQLite.
+    """
+
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    model = apps.get_model("prices", "MTGCardPrice")
+    prices_table = model._meta.db_table
+    foil_table = apps.get_model("prices", "MTGCardFoilPrice")._meta.db_table
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            _partition_like_prices(cursor, connection, prices_table, foil_table)
+        for batch in _id_batches(cursor, quote(prices_table)):
+            _copy_foil_prices(cursor, quote, quote(prices_table), quote(foil_table), batch)
+
+    if connection.vendor == "mysql":
+        drops = ", ".join(f"DROP COLUMN {quote(field)}" for field in FOIL_PRICE_FIELDS)
+        schema_editor.execute(f"ALTER TABLE {quote(prices_table)} {drops}, ALGORITHM=INPLACE, LOCK=NONE")  # nosemgrep
+    else:
+        schema_editor._remake_table(model)  # pylint: disable=protected-access
+    _split_archives(apps, connection, prices_table, foil_table)
+
+
+def merge_foil_prices(apps, schema_editor):
+    """Add the foil price columns back to the price table, filled from the side table in batches."""
+
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    prices_table = apps.get_model("prices", "MTGCardPrice")._meta.db_table
+    foil_table = apps.get_model("prices", "MTGCardFoilPrice")._meta.db_table
+
+    if connection.vendor == "mysql":
+        additions = ", ".join(f"ADD COLUMN {quote(field)} integer NULL" for field in FOIL_PRICE_FIELDS)
+        schema_editor.execute(f"ALTER TABLE {quote(prices_table)} {additions}")  # nosemgrep
+    else:
+        for field in FOIL_PRICE_FIELDS:
+            schema_editor.execute(  # nosemgrep
+                f"ALTER TABLE {quote(prices_table)} ADD COLUMN {quote(field)} integer NULL"
+            )
+
+    with connection.cursor() as cursor:
+        for batch in _id_batches(cursor, quote(prices_table)):
+            _restore_foil_prices(cursor, connection, quote(foil_table), quote(prices_table), batch)
+    _merge_archives(apps, connection, prices_table, foil_table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0023_consolidate_price_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGCardFoilPrice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID"),
+                ),
+                ("avg_foil", lib.models.CentsField(null=True, verbose_name="Foil average price")),
+                ("low_foil", lib.models.CentsField(null=True, verbose_name="Foil low price")),
+                ("trend_foil", lib.models.CentsField(null=True, verbose_name="Foil trend price")),
+                ("avg1_foil", lib.models.CentsField(null=True, verbose_name="Foil average price for 1 day")),
+                ("avg7_foil", lib.models.CentsField(null=True, verbose_name="Foil average price for 7 days")),
+                ("avg30_foil", lib.models.CentsField(null=True, verbose_name="Foil average price for 30 days")),
+                ("catalog_date", models.DateTimeField(verbose_name="Catalog Date")),
+                (
+                    "card",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="foil_prices",
+                        to="prices.mtgcard",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("card", "catalog_date"), name="unique_card_foil_price_per_day")
+                ],
+            },
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveField(
+                    model_name="mtgcardprice",
+                    name="avg1_foil",
+                ),
+                migrations.RemoveField(
+                    model_name="mtgcardprice",
+                    name="avg30_foil",
+                ),
+                migrations.RemoveField(
+                    model_name="mtgcardprice",
+                    name="avg7_foil",
+                ),
+                migrations.RemoveField(
+                    model_name="mtgcardprice",
+                    name="avg_foil",
+                ),
+                migrations.RemoveField(
+                    model_name="mtgcardprice",
+                    name="low_foil",
+                ),
+                migrations.RemoveField(
+                    model_name="mtgcardprice",
+                    name="trend_foil",
+                ),
+                migrations.AddField(
+                    model_name="mtgcardprice",
+                    name="foil",
+                    field=models.ForeignObject(
+                        from_fields=["card", "catalog_date"],
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="prices.mtgcardfoilprice",
+                        to_fields=["card", "catalog_date"],
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(split_foil_prices, merge_foil_prices),
+    ]
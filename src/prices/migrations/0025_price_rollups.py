@@ -0,0 +1,97 @@
+# Generated by Django 5.2 on 2026-10-19 02:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import lib.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0024_foil_price_side_table"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGPriceRollupPeriod",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                (
+                    "period",
+                    models.PositiveSmallIntegerField(choices=[(1, "Week"), (2, "Month")]),
+                ),
+                ("period_start", models.DateField()),
+                ("rows", models.PositiveIntegerField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("period", "period_start"), name="unique_rollup_period")
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="MTGCardPriceRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("price_field", models.CharField(max_length=16)),
+                (
+                    "period",
+                    models.PositiveSmallIntegerField(choices=[(1, "Week"), (2, "Month")]),
+                ),
+                ("period_start", models.DateField()),
+                ("open", lib.models.CentsField()),
+                ("close", lib.models.CentsField()),
+                ("min", lib.models.CentsField()),
+                ("max", lib.models.CentsField()),
+                ("mean", lib.models.CentsField()),
+                (
+                    "count",
+                    models.PositiveSmallIntegerField(verbose_name="Catalogs with price"),
+                ),
+                (
+                    "card",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_rollups",
+                        to="prices.mtgcard",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("card", "period", "price_field", "period_start"),
+                        name="unique_card_rollup_period",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0025_price_rollups"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="catalog",
+            index=models.Index(fields=["catalog_type", "catalog_date"], name="idx_catalog_type_date"),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-19 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0026_catalog_type_date_index"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="mtgcardleaderboard",
+            name="unique_leaderboard_rank",
+        ),
+        migrations.AddField(
+            model_name="mtgcardleaderboard",
+            name="min_price",
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddConstraint(
+            model_name="mtgcardleaderboard",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "format",
+                    "min_price",
+                    "interval_days",
+                    "price_field",
+                    "direction",
+                    "rank",
+                ),
+                name="unique_leaderboard_tier_rank",
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-19 04:32
+
+from django.db import migrations, models
+
+
+def create_version_row(apps, schema_editor):
+    """Create the single counter row, so bumps are plain UPDATEs."""
+
+    apps.get_model("prices", "MTGPriceHistoryVersion").objects.create(pk=1, version=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("prices", "0027_leaderboard_min_price_tiers"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MTGPriceHistoryVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_updated",
+                    models.DateTimeField(auto_now=True, verbose_name="Last update at"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created at"),
+                ),
+                ("obs", models.TextField(blank=True, verbose_name="Observations")),
+                ("active", models.BooleanField(default=True, verbose_name="active")),
+                ("version", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(create_version_row, migrations.RunPython.noop),
+    ]
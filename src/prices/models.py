@@ -1,8 +1,14 @@
+import sqlite3
 import uuid
+from datetime import datetime, timedelta
+from itertools import groupby
 
-from django.db import models
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Max
 
-from lib.models import BaseAbstractModel
+from lib.models import BaseAbstractModel, CentsField
+from prices.periods import day_start, month_start, next_month, week_start
 
 # Create your models here.
 
@@ -66,6 +72,10 @@ class Catalog(BaseAbstractModel):
     catalog_type = models.PositiveSmallIntegerField(choices=CATALOG_TYPES)
     md5sum = models.CharField(max_length=32, verbose_name='MD5sum', unique=True)
 
+    class Meta:
+        # the latest catalogs, .filter(catalog_type=T).order_by('-catalog_date'), see prices.query_plans
+        indexes = [models.Index(fields=['catalog_type', 'catalog_date'], name='idx_catalog_type_date')]
+
     def __str__(self):
         """Return string representation of a Catalog item."""
 
@@ -116,39 +126,197 @@ class MTGCard(BaseAbstractModel):
     def __str__(self):
         """Return representation in string format."""
 
-        latest_price = self.prices.order_by('-catalog_date').first()
+        latest_price = getattr(self, 'latest_price', None)
         low_price = latest_price.low if latest_price else 'No Price'
         set_name = self.expansion.name if self.expansion else 'Unknown Set'
 
         return f"{self.name} - {set_name} - From: {low_price}"
 
 
-class MTGCardPrice(BaseAbstractModel):
-    """MTG card price model."""
+class PriceGuideModel(BaseAbstractModel):
+    """Non-foil price columns of a Cardmarket price guide entry, stored as integer cents."""
+
+    avg = CentsField(null=True, verbose_name="Average price")
+    low = CentsField(null=True, verbose_name="Low price")
+    trend = CentsField(null=True, verbose_name="Trend price")
+
+    avg1 = CentsField(null=True, verbose_name="Average price for 1 day")
+    avg7 = CentsField(null=True, verbose_name="Average price for 7 days")
+    avg30 = CentsField(null=True, verbose_name="Average price for 30 days")
+
+    FOIL_PRICE_FIELDS = (
+        'avg_foil',
+        'low_foil',
+        'trend_foil',
+        'avg1_foil',
+        'avg7_foil',
+        'avg30_foil',
+    )
+    # every field of a price guide entry, foil ones included (see FoilPriceGuideModel)
+    PRICE_FIELDS = (
+        'avg',
+        'low',
+        'trend',
+        'avg1',
+        'avg7',
+        'avg30',
+        *FOIL_PRICE_FIELDS,
+    )
+
+    class Meta:
+        """Meta."""
+
+        abstract = True
+
 
-    card = models.ForeignKey(MTGCard, on_delete=models.CASCADE, related_name='prices', db_index=False)
+class FoilPriceGuideModel(models.Model):
+    """Foil price columns of a Cardmarket price guide entry, stored as integer cents."""
+
+    avg_foil = CentsField(null=True, verbose_name="Foil average price")
+    low_foil = CentsField(null=True, verbose_name="Foil low price")
+    trend_foil = CentsField(null=True, verbose_name="Foil trend price")
+    avg1_foil = CentsField(null=True, verbose_name="Foil average price for 1 day")
+    avg7_foil = CentsField(null=True, verbose_name="Foil average price for 7 days")
+    avg30_foil = CentsField(null=True, verbose_name="Foil average price for 30 days")
+
+    class Meta:
+        """Meta."""
+
+        abstract = True
+
+
+class MTGCardPriceManager(models.Manager):
+    """Manager of MTGCardPrice that can also read the months moved to the archive tier."""
+
+    def history(self, fields, card_ids=None, since=None, until=None, daily=False):
+        """
+        Yield (card_id, catalog_date, *fields) of card_ids (every card by default) between since and until.
+
+        Archived months are read only when they overlap [since, until), oldest first, before the live table,
+        so the rows of every card come oldest first. card_ids may be a list or a queryset.
+
+        Unless daily is set, the part of the window before the weeks rolled up by prices.retention is read from
+        MTGCardPriceRollup instead: one row per card and week (month for the oldest ones) with its close prices.
+        """
+        if not daily:
+            boundary = MTGCardPriceRollup.objects.boundary()
+            if boundary and (since is None or since < boundary):
+                yield from MTGCardPriceRollup.objects.history(
+                    fields, card_ids, since, min(until, boundary) if until else boundary
+                )
+                if until and until <= boundary:
+                    return
+                since = boundary
+
+        archives = MTGPriceArchive.objects.order_by('month')
+        if since:
+            archives = archives.filter(last_date__gte=since)
+        if until:
+            archives = archives.filter(first_date__lt=until)
+        for archive in archives:
+            yield from archive.price_rows(fields, card_ids, since, until)
+
+        prices_qs = self.all()
+        if card_ids is not None:
+            prices_qs = prices_qs.filter(card_id__in=card_ids)
+        if since:
+            prices_qs = prices_qs.filter(catalog_date__gte=since)
+        if until:
+            prices_qs = prices_qs.filter(catalog_date__lt=until)
+        lookups = [self.model.price_lookup(field) for field in fields]
+        prices_qs = prices_qs.order_by('card_id', 'catalog_date').values_list('card_id', 'catalog_date', *lookups)
+        yield from prices_qs.iterator(chunk_size=10000)
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False, update_conflicts=False, **kwargs):
+        """Insert prices as the default manager does, then the MTGCardFoilPrice rows of those having foil prices."""
+
+        prices = super().bulk_create(
+            objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts, update_conflicts=update_conflicts, **kwargs
+        )
+
+        foils = []
+        for price in prices:
+            # only the foil prices set on the objects, price.get_foil() would query once inserted
+            foil = MTGCardPrice.foil.field.get_cached_value(price, default=None)
+            if foil is not None and foil.has_prices():
+                foil.card_id, foil.catalog_date = price.card_id, price.catalog_date
+                foils.append(foil)
+            else:
+                # also keeps later reads of the foil attributes from querying
+                MTGCardPrice.foil.field.set_cached_value(price, None)
+
+        if update_conflicts:
+            MTGCardFoilPrice.objects.bulk_create(
+                foils,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['card', 'catalog_date'],
+                update_fields=list(PriceGuideModel.FOIL_PRICE_FIELDS),
+            )
+        else:
+            MTGCardFoilPrice.objects.bulk_create(foils, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+        return prices
+
+
+def _foil_price_property(field):
+    """Return a property of MTGCardPrice reading and writing field of its MTGCardFoilPrice."""
+
+    def getter(price):
+        foil = price.get_foil()
+        return None if foil is None else getattr(foil, field)
+
+    def setter(price, value):
+        foil = price.get_foil()
+        if foil is None:
+            if value is None:
+                return
+            foil = MTGCardFoilPrice(card_id=price.card_id, catalog_date=price.catalog_date)
+            MTGCardPrice.foil.field.set_cached_value(price, foil)
+        setattr(foil, field, value)
+
+    return property(getter, setter, doc=f"{field} of the MTGCardFoilPrice side table, None without foil prices.")
+
+
+class MTGCardPrice(PriceGuideModel):
+    """
+    MTG card price model.
+
+    Foil prices live in the sparse MTGCardFoilPrice side table, keeping this table narrow for the non-foil
+    scans of every analysis. They are still read and written as attributes (price.trend_foil) and saved
+    with the price by save() and MTGCardPrice.objects.bulk_create(); queries read them through the foil
+    relation, see price_lookup().
+    """
+
+    # no database foreign key: MySQL cannot partition a table that has one (see prices.partitions)
+    card = models.ForeignKey(
+        MTGCard, on_delete=models.CASCADE, related_name='prices', db_index=False, db_constraint=False
+    )
     catalog_date = models.DateTimeField(verbose_name='Catalog Date')
-    cm_id = models.IntegerField(verbose_name="cardmarket id")
-    avg = models.FloatField(null=True, verbose_name="Average price")
-    low = models.FloatField(null=True, verbose_name="Low price")
-    trend = models.FloatField(null=True, verbose_name="Trend price")
-
-    avg1 = models.FloatField(null=True, verbose_name="Average price for 1 day")
-    avg7 = models.FloatField(null=True, verbose_name="Average price for 7 days")
-    avg30 = models.FloatField(null=True, verbose_name="Average price for 30 days")
-
-    avg_foil = models.FloatField(null=True, verbose_name="Foil average price")
-    low_foil = models.FloatField(null=True, verbose_name="Foil low price")
-    trend_foil = models.FloatField(null=True, verbose_name="Foil trend price")
-    avg1_foil = models.FloatField(null=True, verbose_name="Foil average price for 1 day")
-    avg7_foil = models.FloatField(null=True, verbose_name="Foil average price for 7 days")
-    avg30_foil = models.FloatField(null=True, verbose_name="Foil average price for 30 days")
+    # joins the MTGCardFoilPrice of the same card and catalog date, no column of its own
+    foil = models.ForeignObject(
+        'MTGCardFoilPrice',
+        on_delete=models.DO_NOTHING,
+        from_fields=['card', 'catalog_date'],
+        to_fields=['card', 'catalog_date'],
+        null=True,
+        related_name='+',
+    )
+
+    avg_foil = _foil_price_property('avg_foil')
+    low_foil = _foil_price_property('low_foil')
+    trend_foil = _foil_price_property('trend_foil')
+    avg1_foil = _foil_price_property('avg1_foil')
+    avg7_foil = _foil_price_property('avg7_foil')
+    avg30_foil = _foil_price_property('avg30_foil')
+
+    objects = MTGCardPriceManager()
 
     class Meta:
-        constraints = [models.UniqueConstraint(fields=['catalog_date', 'cm_id'], name='unique_card_price_per_day')]
+        constraints = [
+            # also the card history index, optimized for: .filter(card_id=X).order_by('-catalog_date')
+            models.UniqueConstraint(fields=['card', 'catalog_date'], name='unique_card_price_per_day'),
+        ]
         indexes = [
-            # Optimized for: .filter(card_id=X).order_by('-catalog_date')
-            models.Index(fields=['card', 'catalog_date'], name='idx_price_card_date'),
             models.Index(fields=['catalog_date', 'trend'], name='idx_price_date_trend'),
         ]
 
@@ -158,11 +326,472 @@ class MTGCardPrice(BaseAbstractModel):
         catalog_date = self.catalog_date.date()
         return f"{self.card.name} - {catalog_date} (T: {self.trend}, L: {self.low}, A: {self.avg})"
 
+    @classmethod
+    def price_lookup(cls, field):
+        """Return the query lookup of a price field, through the foil relation for foil fields."""
+        return f'foil__{field}' if field in cls.FOIL_PRICE_FIELDS else field
+
+    @classmethod
+    def get_price_field(cls, field):
+        """Return the model field storing a price field, on MTGCardFoilPrice for foil fields."""
+        return (MTGCardFoilPrice if field in cls.FOIL_PRICE_FIELDS else cls)._meta.get_field(field)
+
+    def get_foil(self):
+        """Return the MTGCardFoilPrice of this price, None without foil prices. Unsaved prices never query it."""
+
+        if not MTGCardPrice.foil.is_cached(self):
+            foil = None
+            if not self._state.adding:
+                foil = MTGCardFoilPrice.objects.filter(card_id=self.card_id, catalog_date=self.catalog_date).first()
+            MTGCardPrice.foil.field.set_cached_value(self, foil)
+        return MTGCardPrice.foil.field.get_cached_value(self)
+
+    def save(self, *args, **kwargs):
+        """Save the price and its foil prices, removing the MTGCardFoilPrice row once none is left."""
+
+        super().save(*args, **kwargs)
+        foil = MTGCardPrice.foil.field.get_cached_value(self, default=None)
+        if foil is None:
+            return
+        foil.card_id, foil.catalog_date = self.card_id, self.catalog_date
+        if foil.has_prices():
+            foil.save()
+        elif foil.pk:
+            foil.delete()
+
+    def delete(self, *args, **kwargs):
+        """Delete the price and its foil prices."""
+
+        MTGCardFoilPrice.objects.filter(card_id=self.card_id, catalog_date=self.catalog_date).delete()
+        return super().delete(*args, **kwargs)
+
+
+class MTGCardFoilPrice(FoilPriceGuideModel):
+    """
+    Foil prices of an MTGCardPrice, stored only when one of them is present.
+
+    Cardmarket lists a 0 foil trend for printings that have no foil version, so a row made of zeros and
+    nulls is not stored and those prices read back as None. The timestamps stay on the MTGCardPrice row.
+    """
+
+    # no database foreign key: partitioned by catalog month like MTGCardPrice (see prices.partitions)
+    card = models.ForeignKey(
+        MTGCard, on_delete=models.CASCADE, related_name='foil_prices', db_index=False, db_constraint=False
+    )
+    catalog_date = models.DateTimeField(verbose_name='Catalog Date')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'catalog_date'], name='unique_card_foil_price_per_day'),
+        ]
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        catalog_date = self.catalog_date.date()
+        return f"{self.card_id} - {catalog_date} foil (T: {self.trend_foil}, L: {self.low_foil}, A: {self.avg_foil})"
+
+    def has_prices(self):
+        """Return whether any foil price is set and not zero."""
+        return any(getattr(self, field) for field in PriceGuideModel.FOIL_PRICE_FIELDS)
+
+
+class MTGPriceArchive(BaseAbstractModel):
+    """
+    A catalog month of MTGCardPrice moved out of the live table to the read-only archive tier.
+
+    location is the SQLite database file holding the month or, on MySQL, the table its partition was
+    exchanged with. See prices.partitions.
+    """
+
+    CARD_FILTER_MAX = 500  # larger card id lists are filtered in Python when reading an archive
+
+    month = models.DateTimeField(unique=True)  # first instant of the month, UTC
+    first_date = models.DateTimeField()  # first and last catalog dates of the month
+    last_date = models.DateTimeField()
+    rows = models.PositiveIntegerField()
+    location = models.CharField(max_length=255)
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        return f"{self.month:%Y-%m}: {self.rows} prices in {self.location}"
+
+    @staticmethod
+    def table_name(model, month):
+        """Return the MySQL archive table of a month of model, MTGCardPrice or MTGCardFoilPrice."""
+        return f'{model._meta.db_table}_{month:%Y%m}'
+
+    @classmethod
+    def check_live(cls, since, reader):
+        """
+        Raise ValueError unless every price from since on (all prices when None) is in the live table.
+
+        For readers of the live table only, such as reader: archived months are read back by
+        MTGCardPrice.objects.history() alone.
+        """
+        newest = cls.objects.aggregate(Max('month'))['month__max']
+        if newest is not None and (since is None or since < next_month(newest)):
+            raise ValueError(
+                f"{reader} reads live prices only and the months up to {newest:%Y-%m} are archived, "
+                f"pass a since of {next_month(newest):%Y-%m-%d} or later"
+            )
+
+    def price_rows(self, fields, card_ids=None, since=None, until=None):
+        """
+        Yield (card_id, catalog_date, *fields) of the archived month, like MTGCardPrice.objects.history().
+
+        Foil fields are read from the archived foil price table of the month, joined only when asked for.
+        """
+        quote = connection.ops.quote_name
+        columns = ', '.join(
+            ['p.card_id', 'p.catalog_date']
+            + [f'{"f" if field in MTGCardPrice.FOIL_PRICE_FIELDS else "p"}.{quote(field)}' for field in fields]
+        )
+        conditions, params = [], []
+        if since:
+            conditions.append('p.catalog_date >= %s')
+            params.append(connection.ops.adapt_datetimefield_value(since))
+        if until:
+            conditions.append('p.catalog_date < %s')
+            params.append(connection.ops.adapt_datetimefield_value(until))
+
+        card_set = None
+        if card_ids is not None:
+            card_ids = (
+                list(card_ids.values_list('pk', flat=True)) if hasattr(card_ids, 'values_list') else list(card_ids)
+            )
+            if len(card_ids) > self.CARD_FILTER_MAX:
+                card_set = set(card_ids)
+            elif card_ids:
+                conditions.append(f'p.card_id IN ({", ".join(["%s"] * len(card_ids))})')
+                params.extend(card_ids)
+            else:
+                return
+
+        join = ''
+        if set(fields) & set(MTGCardPrice.FOIL_PRICE_FIELDS):
+            join = 'LEFT JOIN {foil_table} f ON f.card_id = p.card_id AND f.catalog_date = p.catalog_date'
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        sql = f'SELECT {columns} FROM {{table}} p {join} {where} ORDER BY p.card_id, p.catalog_date'  # nosec B608
+
+        if connection.vendor == 'mysql':
+            cursor = connection.cursor()
+            foil_table = quote(self.table_name(MTGCardFoilPrice, month_start(self.month)))
+            cursor.execute(sql.format(table=quote(self.location), foil_table=foil_table), params)  # nosemgrep
+        else:
+            # archives are opened read-only on their own connection: no ATTACH limit, usable inside transactions
+            archive_connection = sqlite3.connect(f'file:{self.location}?mode=ro', uri=True)
+            cursor = archive_connection.cursor()
+            sql = sql.format(
+                table=quote(MTGCardPrice._meta.db_table), foil_table=quote(MTGCardFoilPrice._meta.db_table)
+            )
+            cursor.execute(sql.replace('%s', '?'), params)
+
+        # prices are stored as cents, converted like the ORM does
+        converters = [MTGCardPrice.get_price_field(field).from_db_value for field in fields]
+        try:
+            while rows := cursor.fetchmany(10000):
+                for card_id, catalog_date, *values in rows:
+                    if card_set is None or card_id in card_set:
+                        yield (
+                            card_id,
+                            _archived_datetime(catalog_date),
+                            *(convert(value, None, connection) for convert, value in zip(converters, values)),
+                        )
+        finally:
+            cursor.close()
+            if connection.vendor != 'mysql':
+                archive_connection.close()
+
+
+def _archived_datetime(value):
+    """Return a catalog_date read from an archive as an aware datetime, like the ORM does."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return connection.ops.convert_datetimefield_value(value, None, connection)
+
+
+class MTGCardPriceRollupManager(models.Manager):
+    """Manager of MTGCardPriceRollup reading rollups back as price history rows."""
+
+    def boundary(self):
+        """Return the end of the latest week rolled up, before which history() reads rollups, None when none is."""
+        latest = MTGPriceRollupPeriod.objects.filter(period=self.model.WEEK).aggregate(Max('period_start'))
+        if latest['period_start__max'] is None:
+            return None
+        return self.model.period_end(self.model.WEEK, day_start(latest['period_start__max']))
+
+    def weekly_month(self):
+        """
+        Return the month from which weeks are read rather than months, None without rollups.
+
+        It is the month settings.PRICE_ROLLUP_WEEKLY_DAYS days before boundary(); weekly rollups are kept from
+        the week holding its first day on.
+        """
+        boundary = self.boundary()
+        return boundary and month_start(boundary - timedelta(days=settings.PRICE_ROLLUP_WEEKLY_DAYS))
+
+    def _segment(self, period, fields, card_ids, since, until):
+        """Yield (card_id, period_start, {price_field: close}) of the rollups of period starting in [since, until)."""
+        rollups = self.filter(period=period, price_field__in=fields, period_start__lt=until.date())
+        if since:
+            rollups = rollups.filter(period_start__gte=since.date())
+        if card_ids is not None:
+            rollups = rollups.filter(card_id__in=card_ids)
+        rows = rollups.order_by('card_id', 'period_start').values_list(
+            'card_id', 'period_start', 'price_field', 'close'
+        )
+        for (card_id, start), closes in groupby(rows.iterator(chunk_size=10000), key=lambda row: row[:2]):
+            yield card_id, start, {price_field: close for _, _, price_field, close in closes}
+
+    def history(self, fields, card_ids=None, since=None, until=None):
+        """
+        Yield (card_id, date, *fields) of the rollups between since and until, as the price history rows.
+
+        Each row holds the close prices of a period and is dated on its last day; fields not in
+        settings.ROLLUP_PRICE_FIELDS are None. Weeks are read from weekly_month() on, months before, so long
+        windows stay short. until defaults to, and is capped at, boundary().
+        """
+        boundary = self.boundary()
+        if boundary is None:
+            return
+        until = min(until, boundary) if until else boundary
+        # the first week read may also hold the last days of the last month read
+        months_until = self.weekly_month()
+        weeks_since = week_start(months_until)
+
+        segments = [
+            (self.model.MONTH, since and month_start(since), min(months_until, until)),
+            (self.model.WEEK, max(weeks_since, week_start(since)) if since else weeks_since, until),
+        ]
+        for period, first, last in segments:
+            if first and first >= last:
+                continue
+            for card_id, start, closes in self._segment(period, fields, card_ids, first, last):
+                last_day = self.model.period_end(period, day_start(start)) - timedelta(days=1)
+                yield (card_id, last_day, *(closes.get(field) for field in fields))
+
+
+class MTGCardPriceRollup(models.Model):
+    """
+    Open, close, min, max and mean of one price field of a card over a week or a month of daily prices.
+
+    Written by prices.retention before old daily prices are archived or deleted, read back by
+    MTGCardPrice.objects.history() for windows reaching past the daily retention. No timestamps: a period is
+    rolled up once, see MTGPriceRollupPeriod.
+    """
+
+    WEEK = 1
+    MONTH = 2
+
+    PERIODS = (
+        (WEEK, 'Week'),
+        (MONTH, 'Month'),
+    )
+
+    card = models.ForeignKey(MTGCard, on_delete=models.CASCADE, related_name='price_rollups', db_index=False)
+    price_field = models.CharField(max_length=16)
+    period = models.PositiveSmallIntegerField(choices=PERIODS)
+    period_start = models.DateField()  # Monday of the week or first day of the month, UTC
+    open = CentsField()
+    close = CentsField()
+    min = CentsField()
+    max = CentsField()
+    mean = CentsField()
+    count = models.PositiveSmallIntegerField(verbose_name='Catalogs with price')
+
+    objects = MTGCardPriceRollupManager()
+
+    class Meta:
+        constraints = [
+            # also the history index: .filter(card_id__in=X, period=P, price_field__in=F, period_start__gte=D)
+            models.UniqueConstraint(
+                fields=['card', 'period', 'price_field', 'period_start'], name='unique_card_rollup_period'
+            )
+        ]
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        return f"{self.card_id} {self.price_field} {self.get_period_display()} {self.period_start}: {self.close}"
+
+    @classmethod
+    def period_end(cls, period, start):
+        """Return the first instant after the week or month starting at start."""
+        return start + timedelta(days=7) if period == cls.WEEK else next_month(start)
+
+
+class MTGPriceRollupPeriod(BaseAbstractModel):
+    """A week or month rolled up into MTGCardPriceRollup, registered in the transaction writing its rows."""
+
+    period = models.PositiveSmallIntegerField(choices=MTGCardPriceRollup.PERIODS)
+    period_start = models.DateField()
+    rows = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['period', 'period_start'], name='unique_rollup_period')]
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        return f"{self.get_period_display()} {self.period_start}: {self.rows} rollups"
+
+
+class MTGPriceHistoryVersion(BaseAbstractModel):
+    """
+    Counter of the changes to stored price history, a single row.
+
+    Bumped in the transaction of every ingest, archive and retention step, so per-process caches of price
+    histories (lib.cache) know when to drop their entries.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        return f"Price history version {self.version}"
+
+    @classmethod
+    def current(cls):
+        """Return the current version, 0 before the first change."""
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        """Increment the version, to be called in the transaction changing the prices."""
+        if not cls.objects.filter(pk=1).update(version=models.F('version') + 1):
+            cls.objects.create(pk=1, version=1)
+
+
+class MTGCardLatestPrice(PriceGuideModel, FoilPriceGuideModel):
+    """Newest MTGCardPrice of each card, maintained at ingest so current prices are a join away."""
+
+    card = models.OneToOneField(MTGCard, on_delete=models.CASCADE, primary_key=True, related_name='latest_price')
+    catalog_date = models.DateTimeField(verbose_name='Catalog Date')
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        catalog_date = self.catalog_date.date()
+        return f"{self.card_id} - {catalog_date} (T: {self.trend}, L: {self.low}, A: {self.avg})"
+
+
+class MTGMetacardFloor(BaseAbstractModel):
+    """Cheapest print of a metacard on one catalog date, filled at ingest by a single INSERT ... SELECT."""
+
+    metacard_id = models.PositiveIntegerField()
+    catalog_date = models.DateTimeField(verbose_name='Catalog Date')
+    price_field = models.CharField(max_length=16)
+    card = models.ForeignKey(MTGCard, on_delete=models.CASCADE, related_name='floors', db_index=False)
+    price = models.FloatField()  # nosemgrep
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['metacard_id', 'catalog_date', 'price_field'], name='unique_metacard_floor_per_day'
+            )
+        ]
+        indexes = [models.Index(fields=['catalog_date', 'price_field', 'price'], name='idx_floor_date_price')]
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        catalog_date = self.catalog_date.date()
+        return f"Metacard {self.metacard_id} {self.price_field} {catalog_date}: {self.price} ({self.card_id})"
+
+
+class MTGCardPriceMove(BaseAbstractModel):
+    """Day-over-day change of one price field of a card, diffed against the previous catalog at ingest."""
+
+    CHANGED = 1
+    NEW = 2
+    DISAPPEARED = 3
+
+    STATUSES = (
+        (CHANGED, 'Changed'),
+        (NEW, 'New'),
+        (DISAPPEARED, 'Disappeared'),
+    )
+
+    # directions of lib.utils.get_price_moves(), on the sign of percent_change
+    GAINERS = 1
+    LOSERS = 2
+
+    DIRECTIONS = (
+        (GAINERS, 'Gainers'),
+        (LOSERS, 'Losers'),
+    )
+
+    card = models.ForeignKey(MTGCard, on_delete=models.CASCADE, related_name='price_moves', db_index=False)
+    catalog_date = models.DateTimeField(verbose_name='Catalog Date')
+    previous_date = models.DateTimeField(null=True, verbose_name='Previous Catalog Date')
+    price_field = models.CharField(max_length=16)
+    status = models.PositiveSmallIntegerField(choices=STATUSES)
+    previous_price = models.FloatField(null=True)  # nosemgrep
+    price = models.FloatField(null=True)  # nosemgrep
+    change = models.FloatField(null=True)
+    percent_change = models.FloatField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'catalog_date', 'price_field'], name='unique_card_move_per_day')
+        ]
+        indexes = [
+            models.Index(fields=['catalog_date', 'price_field', 'percent_change'], name='idx_move_date_change'),
+            models.Index(fields=['catalog_date', 'price_field', 'status'], name='idx_move_date_status'),
+        ]
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        catalog_date = self.catalog_date.date()
+        return f"{self.card_id} {self.price_field} {catalog_date}: {self.previous_price} -> {self.price}"
+
+
+class MTGPriceIndex(BaseAbstractModel):
+    """Aggregated prices of a set or a format on one catalog date, computed after every ingest."""
+
+    SET = 1
+    FORMAT = 2
+
+    SCOPES = (
+        (SET, 'Set'),
+        (FORMAT, 'Format'),
+    )
+
+    scope = models.PositiveSmallIntegerField(choices=SCOPES)
+    scope_key = models.CharField(max_length=16)  # MTGSet.expansion_id or key of prices.constants.FORMAT_SETS
+    catalog_date = models.DateTimeField(verbose_name='Catalog Date')
+    price_field = models.CharField(max_length=16)
+    count = models.PositiveIntegerField(verbose_name='Cards with price')
+    total = models.FloatField()
+    mean = models.FloatField()
+    median = models.FloatField()
+    p25 = models.FloatField(verbose_name='25th percentile')
+    p75 = models.FloatField(verbose_name='75th percentile')
+    p90 = models.FloatField(verbose_name='90th percentile')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope', 'scope_key', 'price_field', 'catalog_date'], name='unique_price_index_per_day'
+            )
+        ]
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        catalog_date = self.catalog_date.date()
+        return f"{self.get_scope_display()} {self.scope_key} {self.price_field} {catalog_date}: {self.total:.2f}"
+
 
 class MTGCardPriceSlope(BaseAbstractModel):
     """MTGCard price slope and percentage model."""
 
     card = models.ForeignKey(MTGCard, on_delete=models.CASCADE, related_name="price_slopes")
+    price_field = models.CharField(max_length=16, default='trend')  # MTGCardPrice field, e.g. trend, low, trend_foil
     interval_days = models.PositiveSmallIntegerField()  # e.g., 2, 7, or 30 days
     slope = models.FloatField()  # Raw slope value for calculations
     percent_change = models.FloatField()  # Slope represented as a percentage changer
@@ -170,15 +799,120 @@ class MTGCardPriceSlope(BaseAbstractModel):
     final_price = models.FloatField()  # nosemgrep
 
     class Meta:
-        constraints = [models.UniqueConstraint(fields=['card', 'interval_days'], name='unique_card_interval')]
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'price_field', 'interval_days'], name='unique_card_field_interval')
+        ]
         indexes = [
             # Keep this: filters strictly by the lookback window (e.g., 2, 7, 30)
             models.Index(fields=['interval_days'], name='idx_slope_interval'),
-            # CRUCIAL: For finding the biggest gainers/losers: .filter(interval_days=7).order_by('-percent_change')
-            models.Index(fields=['interval_days', 'percent_change'], name='idx_slope_interval_change'),
+            # CRUCIAL: For finding the biggest gainers/losers:
+            # .filter(interval_days=7, price_field='trend').order_by('-percent_change')
+            models.Index(fields=['interval_days', 'price_field', 'percent_change'], name='idx_slope_interval_change'),
+        ]
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        return f"{self.card.name} - {self.price_field} {self.interval_days} days = {self.slope} | {self.percent_change}"
+
+
+class MTGCardPriceSlopeState(BaseAbstractModel):
+    """Sliding window regression sums behind an MTGCardPriceSlope, updated in O(1) on every new catalog."""
+
+    card = models.ForeignKey(MTGCard, on_delete=models.CASCADE, related_name="slope_states")
+    price_field = models.CharField(max_length=16, default='trend')
+    interval_days = models.PositiveSmallIntegerField()
+    last_date = models.DateTimeField()  # catalog date of the newest point in the window
+    points = models.JSONField(default=list)  # [[day, price], ...] inside the window, days since the epoch
+    origin = models.FloatField()  # day the sums are relative to
+    sum_time = models.FloatField()
+    sum_price = models.FloatField()  # nosemgrep
+    sum_time_price = models.FloatField()  # nosemgrep
+    sum_time_squared = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['card', 'price_field', 'interval_days'], name='unique_state_card_field_interval'
+            )
+        ]
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        return f"{self.card_id} - {self.price_field} {self.interval_days} days = {len(self.points)} points"
+
+
+class MTGCardRollingStats(BaseAbstractModel):
+    """Rolling statistics of one price field of a card over its latest window_days catalogs."""
+
+    card = models.ForeignKey(MTGCard, on_delete=models.CASCADE, related_name='rolling_stats', db_index=False)
+    price_field = models.CharField(max_length=16)
+    window_days = models.PositiveSmallIntegerField()
+    last_date = models.DateTimeField()  # newest catalog folded into ema
+    price = models.FloatField()  # nosemgrep
+    ema = models.FloatField(verbose_name='Exponential moving average')
+    std = models.FloatField(null=True, verbose_name='Standard deviation')
+    zscore = models.FloatField(null=True)
+    max_drawdown = models.FloatField(null=True, verbose_name='Max drawdown %')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['card', 'price_field', 'window_days'], name='unique_rolling_stats_card_field_window'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['window_days', 'price_field', 'zscore'], name='idx_rolling_zscore'),
+            models.Index(fields=['window_days', 'price_field', 'max_drawdown'], name='idx_rolling_drawdown'),
+        ]
+
+    def __str__(self):
+        """Return representation in string format."""
+
+        return f"{self.card_id} {self.price_field} {self.window_days} days: ema {self.ema:.2f}, z {self.zscore}"
+
+
+class MTGCardLeaderboard(BaseAbstractModel):
+    """Top movers per (format, min price tier, interval, price field, direction), rebuilt after every slopes update."""
+
+    GAINERS = 1
+    LOSERS = 2
+
+    DIRECTIONS = (
+        (GAINERS, 'Gainers'),
+        (LOSERS, 'Losers'),
+    )
+
+    format = models.CharField(max_length=16)  # key of prices.constants.FORMAT_SETS
+    min_price = models.PositiveSmallIntegerField(default=1)  # tier of settings.LEADERBOARD_MIN_PRICES
+    interval_days = models.PositiveSmallIntegerField()
+    price_field = models.CharField(max_length=16)
+    direction = models.PositiveSmallIntegerField(choices=DIRECTIONS)
+    rank = models.PositiveSmallIntegerField()
+
+    # display columns, copied so reads need no join
+    card = models.ForeignKey(MTGCard, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    name = models.CharField(max_length=255)
+    expansion_code = models.CharField(max_length=10, blank=True)
+    percent_change = models.FloatField()
+    slope = models.FloatField()
+    initial_price = models.FloatField()  # nosemgrep
+    final_price = models.FloatField()  # nosemgrep
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['format', 'min_price', 'interval_days', 'price_field', 'direction', 'rank'],
+                name='unique_leaderboard_tier_rank',
+            )
         ]
 
     def __str__(self):
         """Return representation in string format."""
 
-        return f"{self.card.name} - {self.interval_days} days = {self.slope} | {self.percent_change}"
+        direction = self.get_direction_display()
+        return (
+            f"{self.format} {self.price_field} >= {self.min_price} {self.interval_days} days {direction} "
+            f"#{self.rank}: {self.name}"
+        )
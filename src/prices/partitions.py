@@ -0,0 +1,204 @@
+import logging
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from prices.models import (
+    MTGCardFoilPrice,
+    MTGCardPrice,
+    MTGPriceArchive,
+    MTGPriceHistoryVersion,
+)
+from prices.periods import add_months, month_start, months_between, next_month
+
+logger = logging.getLogger(__name__)
+
+
+def partition_name(month):
+    """Return the MySQL partition name of a month, e.g. p202412."""
+    return f'p{month:%Y%m}'
+
+
+# tables partitioned and archived by catalog month together: the prices and their foil side table
+PARTITIONED_MODELS = (MTGCardPrice, MTGCardFoilPrice)
+
+
+def _prices_table(model=MTGCardPrice):
+    """Return the quoted name of the price table, or of the foil price table."""
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _mysql_partitions(cursor, model=MTGCardPrice):
+    """Return the partition names of a MySQL price table, empty when it is not partitioned."""
+    cursor.execute(
+        'SELECT partition_name FROM information_schema.partitions '
+        'WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL',
+        [model._meta.db_table],
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _mysql_partition_definitions(months):
+    """Return the PARTITION clauses of months, each bounded by the start of the next month."""
+    return [f"PARTITION {partition_name(month)} VALUES LESS THAN ('{next_month(month):%Y-%m-%d}')" for month in months]
+
+
+def add_mysql_partitions(months_ahead=None):
+    """
+    Split the upcoming months out of pmax so new catalogs land in their own partition. MySQL only.
+
+    The price tables are partitioned by catalog month in migrations 0021 and 0024; return the number of
+    partitions added.
+    """
+    if connection.vendor != 'mysql':
+        return 0
+    months_ahead = settings.PRICE_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+
+    added = 0
+    this_month = month_start(timezone.now())
+    with connection.cursor() as cursor:
+        for model in PARTITIONED_MODELS:
+            existing = _mysql_partitions(cursor, model)
+            if not existing:
+                continue
+
+            months = [
+                month
+                for month in months_between(this_month, add_months(this_month, months_ahead))
+                if partition_name(month) not in existing
+            ]
+            if months:
+                definitions = _mysql_partition_definitions(months) + ['PARTITION pmax VALUES LESS THAN (MAXVALUE)']
+                cursor.execute(  # nosemgrep
+                    f'ALTER TABLE {_prices_table(model)} REORGANIZE PARTITION pmax INTO ({", ".join(definitions)})'
+                )
+                added += len(months)
+    return added
+
+
+def archive_path(month):
+    """Return the SQLite archive file of a month."""
+    return Path(settings.PRICE_ARCHIVE_DIR) / f'prices_{month:%Y%m}.sqlite3'
+
+
+def _archive_month_sqlite(month):
+    """Copy a month of prices and foil prices into its own read-only database file and return (path, rows)."""
+    path = archive_path(month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.name}.tmp')
+    tmp_path.unlink(missing_ok=True)
+
+    table, foil_table = _prices_table(), _prices_table(MTGCardFoilPrice)
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.execute('ATTACH DATABASE %s AS price_archive', [str(tmp_path)])
+        try:
+            for name in (table, foil_table):
+                cursor.execute(
+                    f'CREATE TABLE price_archive.{name} AS SELECT * FROM main.{name} '
+                    'WHERE catalog_date >= %s AND catalog_date < %s ORDER BY card_id, catalog_date',  # nosec B608
+                    [adapt(month), adapt(next_month(month))],
+                )
+            cursor.execute(  # nosemgrep
+                f'CREATE INDEX price_archive.idx_archive_card_date ON {table} (card_id, catalog_date)'
+            )
+            cursor.execute(f'CREATE INDEX price_archive.idx_archive_date ON {table} (catalog_date)')  # nosemgrep
+            cursor.execute(  # nosemgrep
+                f'CREATE INDEX price_archive.idx_archive_foil_card_date ON {foil_table} (card_id, catalog_date)'
+            )
+            cursor.execute(f'SELECT COUNT(*) FROM price_archive.{table}')  # nosec B608  # nosemgrep
+            rows = cursor.fetchone()[0]
+        finally:
+            cursor.execute('DETACH DATABASE price_archive')
+
+    os.replace(tmp_path, path)
+    path.chmod(0o444)
+    return str(path), rows
+
+
+def _archive_month_mysql(month):
+    """
+    Exchange a month's partition of both price tables with archive tables of their own and drop the partitions.
+
+    Return (price archive table, rows).
+    """
+    with connection.cursor() as cursor:
+        for model in PARTITIONED_MODELS:
+            table = _prices_table(model)
+            quoted_archive = connection.ops.quote_name(MTGPriceArchive.table_name(model, month))
+            cursor.execute(f'CREATE TABLE {quoted_archive} LIKE {table}')  # nosemgrep
+            cursor.execute(f'ALTER TABLE {quoted_archive} REMOVE PARTITIONING')  # nosemgrep
+            cursor.execute(  # nosemgrep
+                f'ALTER TABLE {table} EXCHANGE PARTITION {partition_name(month)} WITH TABLE {quoted_archive}'
+            )
+            cursor.execute(f'ALTER TABLE {table} DROP PARTITION {partition_name(month)}')  # nosemgrep
+        archive = MTGPriceArchive.table_name(MTGCardPrice, month)
+        cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(archive)}')  # nosec B608  # nosemgrep
+        rows = cursor.fetchone()[0]
+    return archive, rows
+
+
+def archive_month(month):
+    """
+    Move one catalog month of prices to the archive tier and register it. Return the rows moved.
+
+    The SQLite copy is counted before the month is deleted from the live table, and registering the archive
+    and deleting happen in one transaction: an interrupted run leaves the month live and can simply be re-run.
+    """
+    month = month_start(month)
+    if MTGPriceArchive.objects.filter(month=month).exists():
+        return 0
+
+    month_range = {'catalog_date__gte': month, 'catalog_date__lt': next_month(month)}
+    month_prices = MTGCardPrice.objects.filter(**month_range)
+    bounds = month_prices.aggregate(first_date=Min('catalog_date'), last_date=Max('catalog_date'))
+    if bounds['first_date'] is None:
+        return 0
+
+    if connection.vendor == 'mysql':
+        location, rows = _archive_month_mysql(month)
+        with transaction.atomic():
+            MTGPriceArchive.objects.create(month=month, rows=rows, location=location, **bounds)
+            MTGPriceHistoryVersion.bump()
+    else:
+        location, rows = _archive_month_sqlite(month)
+        with transaction.atomic():
+            MTGPriceArchive.objects.create(month=month, rows=rows, location=location, **bounds)
+            MTGCardFoilPrice.objects.filter(**month_range).delete()
+            deleted, _ = month_prices.delete()
+            if deleted != rows:
+                raise RuntimeError(f'{month:%Y-%m}: archived {rows} prices but {deleted} were live')
+            MTGPriceHistoryVersion.bump()
+
+    logger.info('%d prices of %s moved to %s', rows, f'{month:%Y-%m}', location)
+    return rows
+
+
+def archive_cutoff():
+    """Return the first month kept live: settings.PRICE_ARCHIVE_AFTER_MONTHS months before the current month."""
+    return add_months(month_start(timezone.now()), -settings.PRICE_ARCHIVE_AFTER_MONTHS)
+
+
+def archive_prices(before=None):
+    """
+    Add upcoming MySQL partitions and archive every month older than before.
+
+    On MySQL the price table is partitioned by catalog month, so date bounded queries only touch the months
+    involved and an old month is archived by exchanging its partition. On SQLite each archived month is
+    copied to a read-only database file of its own. Archived months are read back through
+    MTGCardPrice.objects.history(), which opens only the archives overlapping the requested dates.
+
+    before defaults to archive_cutoff(), keeping every window the analytics read in the live table. Return the
+    number of prices archived.
+    """
+    add_mysql_partitions()
+    before = month_start(before or archive_cutoff())
+
+    first_date = MTGCardPrice.objects.aggregate(Min('catalog_date'))['catalog_date__min']
+    if first_date is None:
+        return 0
+    return sum(archive_month(month) for month in months_between(first_date, before) if month < before)
@@ -0,0 +1,39 @@
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+
+
+def day_start(day):
+    """Return the first instant of a date, UTC."""
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def week_start(value):
+    """Return the first instant (Monday, UTC) of the week of value."""
+    day = value.astimezone(dt_timezone.utc).date()
+    return day_start(day - timedelta(days=day.weekday()))
+
+
+def month_start(value):
+    """Return the first instant of the UTC month of value."""
+    return value.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(month):
+    """Return the first instant of the month after month."""
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def add_months(month, months):
+    """Return month moved by months (negative for earlier months)."""
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def months_between(first, last):
+    """Return the month starts from the month of first to the month of last, both included."""
+    months = []
+    month = month_start(first)
+    while month <= last:
+        months.append(month)
+        month = next_month(month)
+    return months
@@ -0,0 +1,212 @@
+import json
+import logging
+import re
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from lib.cache import price_history_cache
+from lib.utils import (
+    fetch_latest_prices,
+    fetch_price_history,
+    fetch_prices,
+    get_leaderboard,
+    get_price_index,
+    get_price_moves,
+    get_rolling_stats,
+    get_top_20_cards_by_slope,
+)
+from prices.benchmarks import create_synthetic_export_dataset
+from prices.constants import LEGAL_PREMODERN_SETS
+from prices.export import _get_cheapest_premodern_prints, build_export_dataframe
+from prices.ingest import price_index_rows, record_price_moves, update_metacard_floors
+from prices.models import MTGCard, MTGCardPrice, MTGPriceArchive, MTGPriceRollupPeriod
+
+logger = logging.getLogger(__name__)
+
+# registries of one row per month, read whole
+SMALL_TABLES = {MTGPriceArchive._meta.db_table, MTGPriceRollupPeriod._meta.db_table}
+# known plan problems of a hot query no index can avoid, as {query name: problem prefixes}
+ALLOWED_PLAN_PROBLEMS = {
+    # the premodern metacard ids are deduplicated before the floors are searched by them
+    'export.cheapest_prints': ('temp b-tree for distinct', 'using temporary'),
+    # the ROW_NUMBER() window sorts the priced cards of the catalog by metacard and price
+    'ingest.metacard_floors': ('temp b-tree for order by', 'using temporary', 'using filesort'),
+}
+
+_EXPLAINED = re.compile(r'^\s*(SELECT|WITH|UPDATE|DELETE|INSERT\b.*\bSELECT\b)', re.IGNORECASE | re.DOTALL)
+_SQLITE_DERIVED = re.compile(r'^(CO-ROUTINE|MATERIALIZE|MULTI-INDEX OR|COMPOUND QUERY)\s+(\S+)')
+_SQLITE_SCAN = re.compile(r'^SCAN (\S+)')
+_SQLITE_TEMP_BTREE = re.compile(r'^USE TEMP B-TREE FOR (.+)$')
+
+
+def hot_queries(cur_date, price_field='trend'):
+    """
+    Return {name: callable} of the hot read paths of lib.utils, prices.export and the ingest, as they run.
+
+    cur_date is the catalog they read, every call runs the queries of one real request or ingest step.
+    """
+    premodern_cards = MTGCard.objects.filter(expansion_id__in=LEGAL_PREMODERN_SETS)
+    card_ids = _get_cheapest_premodern_prints(price_field, cur_date)
+    card = MTGCard.objects.get(pk=card_ids[0])
+
+    return {
+        'export.cheapest_prints': lambda: _get_cheapest_premodern_prints(price_field, cur_date),
+        'export.history': lambda: build_export_dataframe(card_ids, price_field, cur_date),
+        'utils.fetch_prices': lambda: fetch_prices(card, price_field, 30),
+        'utils.fetch_price_history': lambda: fetch_price_history(card_ids, [price_field, 'avg', 'low'], 30),
+        'utils.fetch_latest_prices': lambda: fetch_latest_prices(premodern_cards, price_field, 3),
+        'utils.top_cards_by_slope': lambda: get_top_20_cards_by_slope(premodern_cards),
+        'utils.leaderboard': get_leaderboard,
+        'utils.price_moves': lambda: get_price_moves(cur_date),
+        'utils.rolling_stats': get_rolling_stats,
+        'utils.price_index': get_price_index,
+        'ingest.price_moves': lambda: record_price_moves(cur_date, fields=[price_field]),
+        'ingest.metacard_floors': lambda: update_metacard_floors(cur_date, fields=[price_field]),
+        'ingest.price_index': lambda: price_index_rows(cur_date, fields=[price_field]),
+    }
+
+
+def explain(sql):
+    """Return the plan of a statement as text lines: SQLite EXPLAIN QUERY PLAN details or MySQL EXPLAIN rows."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}')  # nosemgrep
+            columns = [column[0] for column in cursor.description]
+            return [
+                'table={table} type={type} key={key} rows={rows} extra={Extra}'.format(**dict(zip(columns, row)))
+                for row in cursor.fetchall()
+            ]
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')  # nosemgrep
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """
+    Return the full table scans and temporary sorts of a plan from explain().
+
+    A SQLite SCAN of a table (through an index or not) reads all of it, as a MySQL access type ALL or index
+    does; subqueries the plan materializes itself and SMALL_TABLES are left out. USE TEMP B-TREE (SQLite),
+    Using temporary and Using filesort (MySQL) are sorts the indexes do not serve. A SQLite RIGHT PART OF
+    ORDER BY only sorts the ties of an order an index gives, it is not a problem.
+    """
+    problems = []
+    if connection.vendor == 'mysql':
+        for line in plan:
+            fields = dict(field.split('=', 1) for field in line.split(' ', 4))
+            derived = fields['table'].startswith('<')  # <derivedN>, <subqueryN>, <union...>
+            if fields['type'] in ('ALL', 'index') and not derived and fields['table'] not in SMALL_TABLES:
+                problems.append(f'full scan of {fields["table"]}')
+            for sort in ('Using temporary', 'Using filesort'):
+                if sort in fields['extra']:
+                    problems.append(f'{sort.lower()} on {fields["table"]}')
+        return problems
+
+    derived = {match.group(2) for match in map(_SQLITE_DERIVED.match, plan) if match} | {'CONSTANT'}
+    for line in plan:
+        if (scan := _SQLITE_SCAN.match(line)) and scan.group(1) not in derived | SMALL_TABLES:
+            problems.append(f'full scan of {scan.group(1)}')
+        elif (sort := _SQLITE_TEMP_BTREE.match(line)) and not sort.group(1).startswith('RIGHT PART'):
+            problems.append(f'temp b-tree for {sort.group(1).lower()}')
+    return problems
+
+
+def _normalized(sql):
+    """Return a statement with its literals replaced, so the same query shape is reported once."""
+    return re.sub(r"'[^']*'|\b\d+(\.\d+)?\b", '?', sql)
+
+
+def _run_hot_query(name, func, repeat):
+    """Run func repeat times. Return (median seconds, {normalized statement: (sql, plan, problems)})."""
+    timings, statements = [], {}
+    for _ in range(repeat):
+        price_history_cache.clear()
+        reset_queries()  # the capture is a slice of the bounded query log, full after the dataset is created
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if _EXPLAINED.match(sql) and _normalized(sql) not in statements:
+                plan = explain(sql)
+                allowed = ALLOWED_PLAN_PROBLEMS.get(name, ())
+                problems = [problem for problem in plan_problems(plan) if not problem.startswith(allowed)]
+                statements[_normalized(sql)] = (sql, plan, problems)
+    return statistics.median(timings), statements
+
+
+def _record_run(run):
+    """Append a run to settings.QUERY_PLAN_LOG and return the previous run of the same database and scale."""
+    path = Path(settings.QUERY_PLAN_LOG)
+    previous = None
+    if path.exists():
+        for line in path.read_text(encoding='utf-8').splitlines():
+            logged = json.loads(line)
+            if (logged['vendor'], logged['scale']) == (run['vendor'], run['scale']):
+                previous = logged
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('a', encoding='utf-8') as log:
+        log.write(json.dumps(run) + '\n')
+    return previous
+
+
+def check_query_plans(metacards=35000, prints=3, catalogs=20, repeat=3, price_field='trend', record=True):
+    """
+    EXPLAIN every statement of the hot queries on a synthetic dataset and fail on full scans or temp sorts.
+
+    The dataset is created by create_synthetic_export_dataset() in a transaction that is rolled back, so any
+    database can be used; the defaults make one catalog about the size of a real one. Each hot query of
+    hot_queries() runs repeat times and its median time is appended to settings.QUERY_PLAN_LOG with the
+    plan problems found, next to the previous run on the same database and scale. Problems listed in
+    ALLOWED_PLAN_PROBLEMS are ignored. Raise RuntimeError listing the statements with problems, otherwise
+    return {name: median seconds}, e.g. from ``shell_plus``:
+    ``from prices.query_plans import check_query_plans; check_query_plans()``.
+    """
+    results = {}
+    with transaction.atomic():
+        cur_date = create_synthetic_export_dataset(metacards, prints, catalogs, price_field)
+        for name, func in hot_queries(cur_date, price_field).items():
+            results[name] = _run_hot_query(name, func, repeat)
+        prices = MTGCardPrice.objects.count()
+        transaction.set_rollback(True)
+
+    run = {
+        'date': timezone.now().isoformat(),
+        'vendor': connection.vendor,
+        'scale': [metacards, prints, catalogs],
+        'prices': prices,
+        'queries': {
+            name: {
+                'seconds': round(seconds, 4),
+                'problems': sorted({problem for _, _, problems in statements.values() for problem in problems}),
+            }
+            for name, (seconds, statements) in results.items()
+        },
+    }
+    previous = _record_run(run) if record else None
+
+    failures = []
+    for name, (seconds, statements) in results.items():
+        before = previous and previous['queries'].get(name, {}).get('seconds')
+        logger.info(
+            '%s: %d statements in %.1fms%s',
+            name,
+            len(statements),
+            seconds * 1000,
+            f' (was {before * 1000:.1f}ms)' if before else '',
+        )
+        for sql, plan, problems in statements.values():
+            if problems:
+                failures.append(f'{name}: {", ".join(problems)}\n  {sql[:500]}\n    ' + '\n    '.join(plan))
+
+    if failures:
+        raise RuntimeError(f'{len(failures)} hot statements without a usable index:\n' + '\n'.join(failures))
+    return {name: seconds for name, (seconds, _) in results.items()}
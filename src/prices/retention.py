@@ -0,0 +1,224 @@
+import logging
+from datetime import timedelta
+from itertools import islice, repeat
+from pathlib import Path
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from prices.models import (
+    MTGCardFoilPrice,
+    MTGCardPrice,
+    MTGCardPriceRollup,
+    MTGPriceArchive,
+    MTGPriceHistoryVersion,
+    MTGPriceRollupPeriod,
+)
+from prices.partitions import PARTITIONED_MODELS, archive_cutoff, archive_prices
+from prices.periods import month_start, months_between, week_start
+
+logger = logging.getLogger(__name__)
+BATCH_SIZE = 5000
+STATS = ('open', 'close', 'min', 'max', 'mean')
+
+
+def retention_cutoff():
+    """Return the first month not rolled up: the month of settings.PRICE_RETENTION_DAYS days ago."""
+    return month_start(timezone.now() - timedelta(days=settings.PRICE_RETENTION_DAYS))
+
+
+def _chunks(rows, size):
+    """Yield lists of up to size rows."""
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _first_price_date():
+    """Return the oldest catalog date of the live and archived prices, None without prices."""
+    dates = [
+        MTGCardPrice.objects.aggregate(Min('catalog_date'))['catalog_date__min'],
+        MTGPriceArchive.objects.aggregate(Min('first_date'))['first_date__min'],
+    ]
+    return min((date for date in dates if date), default=None)
+
+
+def pending_periods(before):
+    """Return the (period, start) of the weeks and months starting before before not rolled up yet, oldest first."""
+    first_date = _first_price_date()
+    if first_date is None:
+        return []
+
+    # a week is rolled up once it is over, its last days may belong to the month of before
+    now = timezone.now()
+    periods = []
+    start = week_start(first_date)
+    while start < before and MTGCardPriceRollup.period_end(MTGCardPriceRollup.WEEK, start) <= now:
+        periods.append((MTGCardPriceRollup.WEEK, start))
+        start = MTGCardPriceRollup.period_end(MTGCardPriceRollup.WEEK, start)
+    periods += [(MTGCardPriceRollup.MONTH, month) for month in months_between(first_date, before) if month < before]
+
+    done = set(MTGPriceRollupPeriod.objects.values_list('period', 'period_start'))
+    pending = [(period, start) for period, start in periods if (period, start.date()) not in done]
+    return sorted(pending, key=lambda item: (item[1], item[0]))
+
+
+def _period_stats(period, start, fields):
+    """
+    Return open, close, min, max, mean and count of every (card_id, price_field) of one period as a DataFrame.
+
+    Daily prices, archived ones included, are read settings.PRICE_ROLLUP_CHUNK_SIZE rows at a time and reduced
+    chunk by chunk, so memory is bounded by the cards of the period rather than by its prices. The rows of a
+    card come oldest first, so the first chunk holding a card has its open and the last one its close.
+    """
+    rows = MTGCardPrice.objects.history(
+        fields, since=start, until=MTGCardPriceRollup.period_end(period, start), daily=True
+    )
+    partials = []
+    for chunk in _chunks(rows, settings.PRICE_ROLLUP_CHUNK_SIZE):
+        prices = pd.DataFrame.from_records(chunk, columns=['card_id', 'catalog_date', *fields])
+        prices = prices.drop(columns='catalog_date').melt(id_vars='card_id', var_name='price_field', value_name='price')
+        prices = prices.dropna(subset=['price']).astype({'price': float})
+        grouped = prices.groupby(['card_id', 'price_field'], sort=False)['price']
+        partials.append(grouped.agg(['first', 'last', 'min', 'max', 'sum', 'count']))
+
+    if not partials:
+        return pd.DataFrame(
+            columns=[*STATS, 'count'], index=pd.MultiIndex.from_tuples([], names=['card_id', 'price_field'])
+        )
+    stats = pd.concat(partials).groupby(level=['card_id', 'price_field'], sort=False)
+    stats = stats.agg({'first': 'first', 'last': 'last', 'min': 'min', 'max': 'max', 'sum': 'sum', 'count': 'sum'})
+    stats['mean'] = stats['sum'] / stats['count']
+    return stats.rename(columns={'first': 'open', 'last': 'close'})[[*STATS, 'count']]
+
+
+def _insert_rollups(period, start, stats):
+    """Insert the rollups of one period from _period_stats(), replacing existing ones, BATCH_SIZE rows per query."""
+    quote = connection.ops.quote_name
+    model = MTGCardPriceRollup._meta
+    fields = [model.get_field(name) for name in ('card', 'price_field', 'period', 'period_start', *STATS, 'count')]
+    unique_fields = [model.get_field(name).column for name in ('card', 'period', 'price_field', 'period_start')]
+    on_conflict = connection.ops.on_conflict_suffix_sql(
+        fields, OnConflict.UPDATE, [field.column for field in fields[4:]], unique_fields
+    )
+    # identifiers come from the model, values are parameters
+    sql = (
+        f'INSERT INTO {quote(model.db_table)} ({", ".join(quote(field.column) for field in fields)}) '  # nosec B608
+        f'VALUES ({", ".join(["%s"] * len(fields))}) {on_conflict}'
+    )
+
+    # CentsField columns hold cents, see lib.models.CentsField
+    cents = (stats[list(STATS)] * 100).round().astype('int64')
+    rows = zip(
+        stats.index.get_level_values('card_id').tolist(),
+        stats.index.get_level_values('price_field').tolist(),
+        repeat(period),
+        repeat(connection.ops.adapt_datefield_value(start.date())),
+        *(cents[stat].tolist() for stat in STATS),
+        stats['count'].astype('int64').tolist(),
+    )
+    with connection.cursor() as cursor:
+        for chunk in _chunks(rows, BATCH_SIZE):
+            cursor.executemany(sql, chunk)
+
+
+def rollup_period(period, start, fields=None):
+    """
+    Roll the daily prices of one week or month up into MTGCardPriceRollup rows and register the period.
+
+    Rows and registration are written in one transaction, so an interrupted period is simply rolled up again.
+    Return the number of rollups written.
+    """
+    stats = _period_stats(period, start, list(fields or settings.ROLLUP_PRICE_FIELDS))
+    with transaction.atomic():
+        _insert_rollups(period, start, stats)
+        MTGPriceRollupPeriod.objects.update_or_create(
+            period=period, period_start=start.date(), defaults={'rows': len(stats)}
+        )
+        MTGPriceHistoryVersion.bump()
+
+    logger.info("%d %s rollups stored for %s", len(stats), dict(MTGCardPriceRollup.PERIODS)[period], start.date())
+    return len(stats)
+
+
+def rollup_prices(before=None, fields=None):
+    """
+    Roll up every week and month of daily prices starting before before (retention_cutoff() by default).
+
+    Periods are rolled up oldest first, each in its own transaction, and the registered ones are skipped: the
+    job can be stopped at any time and resumes where it stopped. Return the number of rollups written.
+    """
+    before = before or retention_cutoff()
+    return sum(rollup_period(period, start, fields) for period, start in pending_periods(before))
+
+
+def delete_daily_prices(before):
+    """
+    Delete the daily prices, live and archived, of the months before before. Every period is rolled up first.
+
+    Live prices are deleted one catalog at a time, each in its own transaction; archived months are dropped
+    whole. Return the number of prices deleted.
+    """
+    if pending_periods(before):
+        raise RuntimeError(f'Prices before {before:%Y-%m} are not all rolled up, run rollup_prices() first')
+
+    deleted = 0
+    catalog_dates = MTGCardPrice.objects.filter(catalog_date__lt=before).order_by('catalog_date')
+    for catalog_date in list(catalog_dates.values_list('catalog_date', flat=True).distinct()):
+        with transaction.atomic():
+            MTGCardFoilPrice.objects.filter(catalog_date=catalog_date).delete()
+            deleted += MTGCardPrice.objects.filter(catalog_date=catalog_date).delete()[0]
+            MTGPriceHistoryVersion.bump()
+
+    for archive in MTGPriceArchive.objects.filter(month__lt=before).order_by('month'):
+        if connection.vendor == 'mysql':
+            with connection.cursor() as cursor:
+                for model in PARTITIONED_MODELS:
+                    table = connection.ops.quote_name(MTGPriceArchive.table_name(model, archive.month))
+                    cursor.execute(f'DROP TABLE IF EXISTS {table}')  # nosemgrep
+        else:
+            Path(archive.location).unlink(missing_ok=True)
+        deleted += archive.rows
+        with transaction.atomic():
+            archive.delete()
+            MTGPriceHistoryVersion.bump()
+
+    logger.info('%d daily prices before %s deleted', deleted, f'{before:%Y-%m}')
+    return deleted
+
+
+def apply_price_retention(before=None):
+    """
+    Roll up the daily prices older than settings.PRICE_RETENTION_DAYS, whole months, then archive or delete them.
+
+    settings.PRICE_RETENTION_ACTION 'archive' moves those months to the archive tier (prices.partitions) once
+    they are also older than settings.PRICE_ARCHIVE_AFTER_MONTHS, so this job is the one archiving prices and
+    the live table keeps the months the archive setting promises; 'delete' deletes them. Both run in batches
+    and can be interrupted and run again. Return the number of rollups written and of daily prices archived
+    or deleted.
+    """
+    before = before or retention_cutoff()
+    rollups = rollup_prices(before)
+    prune_weekly_rollups()
+    if settings.PRICE_RETENTION_ACTION == 'delete':
+        return rollups, delete_daily_prices(before)
+    return rollups, archive_prices(min(before, archive_cutoff()))
+
+
+def prune_weekly_rollups():
+    """Delete the weekly rollups no longer read, monthly ones are read for them. Return the number deleted."""
+    month = MTGCardPriceRollup.objects.weekly_month()
+    if month is None:
+        return 0
+    weekly = MTGCardPriceRollup.objects.filter(
+        period=MTGCardPriceRollup.WEEK, period_start__lt=week_start(month).date()
+    )
+    with transaction.atomic():
+        deleted = weekly.delete()[0]
+        MTGPriceHistoryVersion.bump()
+    logger.info('%d weekly rollups before %s deleted', deleted, week_start(month).date())
+    return deleted
@@ -12,11 +12,19 @@ import requests
 from bs4 import BeautifulSoup
 from curl_cffi import requests as curl
 from dateutil import parser
+from django.db import transaction
 from django.utils import timezone
 
-from lib.utils import update_card_slopes
+from lib.similarity import refresh_similarity_index
+from lib.utils import rebuild_leaderboards, update_rolling_stats, update_slope_states
 from prices.export import export_top_cards_to_gdrive
-from prices.models import Catalog, MTGCard, MTGCardPrice, MTGSet
+from prices.ingest import (
+    record_price_moves,
+    update_latest_prices,
+    update_metacard_floors,
+    update_price_indices,
+)
+from prices.models import Catalog, MTGCard, MTGCardPrice, MTGPriceHistoryVersion, MTGSet
 
 logging.basicConfig(level=logging.INFO)  # temporary
 logger = logging.getLogger(__name__)
@@ -57,12 +65,22 @@ def update_mtg():
     if updated_prices:
         start = time.time()
         catalog_date = MTGCardPrice.objects.order_by("catalog_date").last().catalog_date
-        card_ids = MTGCardPrice.objects.filter(catalog_date=catalog_date).values_list("cm_id", flat=True)
-        card_qs = MTGCard.objects.filter(cm_id__in=card_ids)
-        new_slopes, updated_slopes = update_card_slopes(card_qs=card_qs)
-        logger.info("-> update_card_slopes() took: %.2fs", time.time() - start)
-        result["new_slopes"] = new_slopes
-        result["updated_slopes"] = updated_slopes
+        upserted_slopes, pruned_slopes = update_slope_states(catalog_date)
+        logger.info("-> update_slope_states() took: %.2fs", time.time() - start)
+        result["upserted_slopes"] = upserted_slopes
+        result["pruned_slopes"] = pruned_slopes
+
+        start = time.time()
+        result["upserted_rolling_stats"], result["pruned_rolling_stats"] = update_rolling_stats()
+        logger.info("-> update_rolling_stats() took: %.2fs", time.time() - start)
+
+        start = time.time()
+        refresh_similarity_index()
+        logger.info("-> refresh_similarity_index() took: %.2fs", time.time() - start)
+
+        start = time.time()
+        result["leaderboard_entries"] = rebuild_leaderboards()
+        logger.info("-> rebuild_leaderboards() took: %.2fs", time.time() - start)
 
         # update google spreadsheet
         start = time.time()
@@ -209,7 +227,7 @@ def update_cm_prices(local_content=None):
         # List all existing cards within the current JSON
         all_cm_ids = [item["idProduct"] for item in data["priceGuides"]]
         valid_card_ids = set(MTGCard.objects.filter(cm_id__in=all_cm_ids).values_list("cm_id", flat=True))
-        existing_prices = MTGCardPrice.objects.filter(catalog_date=catalog_date).values_list("cm_id", flat=True)
+        existing_prices = MTGCardPrice.objects.filter(catalog_date=catalog_date).values_list("card_id", flat=True)
         existing_price_ids = set(existing_prices)
         unknown_cards = set()
 
@@ -236,7 +254,6 @@ def update_cm_prices(local_content=None):
             mtg_card_price = MTGCardPrice(
                 catalog_date=catalog_date,
                 card_id=cm_id,
-                cm_id=cm_id,
                 avg=price_item.get("avg", None),
                 low=price_item.get("low", None),
                 trend=price_item.get("trend", None),
@@ -255,7 +272,13 @@ def update_cm_prices(local_content=None):
 
         # Bulk create all prices
         if insert_prices:
-            MTGCardPrice.objects.bulk_create(insert_prices, batch_size=BATCH_SIZE)
+            with transaction.atomic():
+                MTGCardPrice.objects.bulk_create(insert_prices, batch_size=BATCH_SIZE)
+                update_latest_prices(insert_prices, catalog_date)
+                record_price_moves(catalog_date)  # the whole catalog, prices of an earlier run included
+                update_price_indices(catalog_date)
+                update_metacard_floors(catalog_date)
+                MTGPriceHistoryVersion.bump()
             logger.info("%d new prices inserted.", len(insert_prices))
 
         if unknown_cards:
@@ -1,6 +1,8 @@
 from celery.utils.log import get_task_logger
 
 from cm_prices.celery import app
+from prices.partitions import archive_prices
+from prices.retention import apply_price_retention
 from prices.services import update_mtg
 
 logger = get_task_logger('tasks.common')
@@ -10,3 +12,15 @@ logger = get_task_logger('tasks.common')
 def update_mtg_task():
     """Fetch new cards, new prices and save them in the local models."""
     update_mtg()
+
+
+@app.task(name='archive_prices_task')
+def archive_prices_task():
+    """Move price months older than settings.PRICE_ARCHIVE_AFTER_MONTHS to the archive tier, on demand."""
+    archive_prices()
+
+
+@app.task(name='apply_price_retention_task')
+def apply_price_retention_task():
+    """Roll up daily prices older than settings.PRICE_RETENTION_DAYS, then archive or delete them."""
+    apply_price_retention()
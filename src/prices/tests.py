@@ -1,3 +1,457 @@
-# from django.test import TestCase
+import csv
+import json
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from pathlib import Path
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+
+from lib.cache import price_history_cache
+from lib.utils import fetch_prices, get_price_moves
+from prices import catalog_processor
+from prices.benchmarks import benchmark_export_build
+from prices.exporters import export_dataset
+from prices.gsheets import SheetsUploader, diff_ranges, inserted_columns, sync_worksheet
+from prices.ingest import backfill_metacard_floors
+from prices.models import (
+    MTGCard,
+    MTGCardPrice,
+    MTGCardPriceMove,
+    MTGPriceArchive,
+    MTGSet,
+)
+from prices.periods import month_start
+from prices.query_plans import check_query_plans
+from prices.retention import apply_price_retention, retention_cutoff, rollup_prices
+from prices.services import update_cm_prices
+
+
+def price_catalog(created_at, prices):
+    """Return a price guide JSON file of {cm_id: trend} as update_cm_prices() downloads it."""
+    return json.dumps(
+        {
+            'version': 1,
+            'createdAt': created_at,
+            'priceGuides': [{'idProduct': cm_id, 'trend': trend} for cm_id, trend in prices.items()],
+        }
+    )
+
+
+class PriceMovesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Three cards of one set."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        MTGCard.objects.bulk_create(
+            MTGCard(
+                cm_id=cm_id, name=f'Card {cm_id}', expansion=expansion, metacard_id=cm_id, cm_date_added=timezone.now()
+            )
+            for cm_id in (1, 2, 3)
+        )
+
+    def test_moves_against_the_whole_catalog(self):
+        """Prices of the catalog stored by an earlier run are diffed too, not reported as disappeared."""
+        update_cm_prices(local_content=price_catalog('2026-01-01T10:00:00+0000', {1: 1.0, 2: 2.0, 3: 3.0}))
+        MTGCardPrice.objects.create(
+            card_id=3, catalog_date=datetime.fromisoformat('2026-01-02T10:00:00+00:00'), trend=3.0
+        )
+        update_cm_prices(local_content=price_catalog('2026-01-02T10:00:00+0000', {1: 1.5, 2: 1.0, 3: 3.0}))
+
+        self.assertFalse(MTGCardPriceMove.objects.filter(status=MTGCardPriceMove.DISAPPEARED).exists())
+        self.assertEqual([move.card_id for move in get_price_moves()], [1])
+        self.assertEqual([move.card_id for move in get_price_moves(direction=MTGCardPriceMove.LOSERS)], [2])
+
+
+class CatalogProcessorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """One card of one set."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        cls.card = MTGCard.objects.create(
+            cm_id=1, name='Card', expansion=expansion, metacard_id=1, cm_date_added=timezone.now()
+        )
+
+    def setUp(self):
+        """Check the price history version on every read."""
+        version_ttl = price_history_cache.version_ttl
+        self.addCleanup(setattr, price_history_cache, 'version_ttl', version_ttl)
+        price_history_cache.version_ttl = 0
+        price_history_cache.clear()
+
+    def test_ingest_drops_cached_histories(self):
+        """Histories cached before the local files are processed are not served after."""
+        catalog_processor.update_cm_prices(local_content=price_catalog('2026-01-01T10:00:00+0000', {1: 1.0}))
+        self.assertEqual([price for _, price in fetch_prices(self.card, 'trend', None)], [1.0])
+
+        catalog_processor.update_cm_prices(local_content=price_catalog('2026-01-02T10:00:00+0000', {1: 2.0}))
+        self.assertEqual([price for _, price in fetch_prices(self.card, 'trend', None)], [1.0, 2.0])
+
+
+class PriceHistoryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Price one card daily over the six weeks from Monday 2026-01-05 and roll them up."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        cls.card = MTGCard.objects.create(
+            cm_id=1, name='Card', expansion=expansion, metacard_id=1, cm_date_added=timezone.now()
+        )
+        first = datetime(2026, 1, 5, 10, tzinfo=dt_timezone.utc)
+        MTGCardPrice.objects.bulk_create(
+            MTGCardPrice(card=cls.card, catalog_date=first + timedelta(days=day), trend=day + 1) for day in range(42)
+        )
+        rollup_prices(before=datetime(2026, 3, 1, tzinfo=dt_timezone.utc))
+
+    def test_rolled_up_weeks(self):
+        """Weeks rolled up are read as one row per week, dated on its last day, at its close price."""
+        rows = list(MTGCardPrice.objects.history(['trend'], card_ids=[self.card.pk]))
+        self.assertEqual([row[2] for row in rows], [7.0, 14.0, 21.0, 28.0, 35.0, 42.0])
+        self.assertEqual(rows[0][1], datetime(2026, 1, 11, tzinfo=dt_timezone.utc))
+
+    def test_daily(self):
+        """daily=True reads every stored price."""
+        rows = list(MTGCardPrice.objects.history(['trend'], card_ids=[self.card.pk], daily=True))
+        self.assertEqual([row[2] for row in rows], [float(day + 1) for day in range(42)])
+
+
+class RetentionTestCase(TransactionTestCase):
+    def test_archive_after_months(self):
+        """Months past PRICE_RETENTION_DAYS are rolled up but stay live until PRICE_ARCHIVE_AFTER_MONTHS."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        card = MTGCard.objects.create(
+            cm_id=1, name='Card', expansion=expansion, metacard_id=1, cm_date_added=timezone.now()
+        )
+        first = month_start(timezone.now() - timedelta(days=250)) + timedelta(hours=10)
+        MTGCardPrice.objects.bulk_create(
+            MTGCardPrice(card=card, catalog_date=first + timedelta(days=day), trend=day + 1) for day in range(10)
+        )
+        self.assertLess(first, retention_cutoff())
+
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(PRICE_ARCHIVE_DIR=str(directory), PRICE_ARCHIVE_AFTER_MONTHS=12):
+            rollups, archived = apply_price_retention()
+        self.assertGreater(rollups, 0)
+        self.assertEqual(archived, 0)
+        self.assertEqual(MTGCardPrice.objects.count(), 10)
+
+        with override_settings(PRICE_ARCHIVE_DIR=str(directory), PRICE_ARCHIVE_AFTER_MONTHS=1):
+            self.assertEqual(apply_price_retention(), (0, 10))
+        self.assertFalse(MTGCardPrice.objects.exists())
+
+
+class BenchmarksTestCase(TestCase):
+    def test_export_build(self):
+        """Every stage of the export build is timed and the synthetic dataset is rolled back."""
+        timings = benchmark_export_build(metacards=20, prints=2, catalogs=10, repeat=1)
+        self.assertEqual(set(timings), {'cheapest_prints', 'history_pivot', 'grid', 'total'})
+        self.assertFalse(MTGCard.objects.exists())
+
+
+class QueryPlansTestCase(TestCase):
+    def test_hot_queries_use_indexes(self):
+        """No hot statement scans a whole table or sorts without an index, at a small scale."""
+        timings = check_query_plans(metacards=20, prints=2, catalogs=5, repeat=1, record=False)
+        self.assertIn('export.history', timings)
+        self.assertFalse(MTGCard.objects.exists())
+
+
+class ExportDatasetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Price two cards in two catalogs of one day and one of the next."""
+        expansion = MTGSet.objects.create(expansion_id=1, name='Test set')
+        MTGCard.objects.bulk_create(
+            MTGCard(
+                cm_id=cm_id,
+                name=f'Card, "{cm_id}"',
+                expansion=expansion,
+                metacard_id=cm_id,
+                cm_date_added=timezone.now(),
+            )
+            for cm_id in (1, 2)
+        )
+        MTGCardPrice.objects.bulk_create(
+            MTGCardPrice(card_id=cm_id, catalog_date=datetime.fromisoformat(catalog_date), trend=cm_id * 1.5)
+            for catalog_date in ('2026-01-01T10:00:00+00:00', '2026-01-01T22:00:00+00:00', '2026-01-02T10:00:00+00:00')
+            for cm_id in (1, 2)
+        )
+
+    def setUp(self):
+        """Export into a directory of the test."""
+        self.path = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_csv(self):
+        """Every price is written below a header line, in chunks of chunk_size rows."""
+        written = export_dataset('prices', path=self.path, chunk_size=4)
+        self.assertEqual(written, {str(self.path / 'prices.csv'): 6})
+        with open(self.path / 'prices.csv', newline='', encoding='utf-8') as file:
+            header, *rows = list(csv.reader(file))
+        self.assertEqual(header[:3], ['card_id', 'expansion_id', 'catalog_date'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(float(rows[0][header.index('trend')]), 1.5)
+        self.assertFalse(list(self.path.glob('*.tmp')))
+
+    def test_partitioned_by_day(self):
+        """Catalogs of the same day share one date partition."""
+        written = export_dataset('prices', 'ndjson', partition_by='date', path=self.path)
+        self.assertEqual(
+            written,
+            {
+                str(self.path / 'prices' / 'date=2026-01-01' / 'prices.ndjson'): 4,
+                str(self.path / 'prices' / 'date=2026-01-02' / 'prices.ndjson'): 2,
+            },
+        )
+        lines = (self.path / 'prices' / 'date=2026-01-02' / 'prices.ndjson').read_text(encoding='utf-8').splitlines()
+        self.assertEqual(json.loads(lines[0])['catalog_date'], '2026-01-02T10:00:00+00:00')
+
+    def test_unknown_partition(self):
+        """Partitions a dataset does not have are refused."""
+        with self.assertRaises(ValueError):
+            export_dataset('slopes', partition_by='date', path=self.path)
+
+    def test_archived_months(self):
+        """Prices are exported, and their derived rows backfilled, only from the first month still live."""
+        december = datetime(2025, 12, 1, tzinfo=dt_timezone.utc)
+        MTGPriceArchive.objects.create(
+            month=december, first_date=december, last_date=december + timedelta(days=30), rows=0, location='unused'
+        )
+        with self.assertRaises(ValueError):
+            export_dataset('prices', path=self.path)
+        with self.assertRaises(ValueError):
+            export_dataset('prices', since=datetime(2025, 12, 31, tzinfo=dt_timezone.utc), path=self.path)
+        with self.assertRaises(ValueError):
+            backfill_metacard_floors()
+
+        since = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        self.assertEqual(export_dataset('prices', since=since, path=self.path), {str(self.path / 'prices.csv'): 6})
+        self.assertEqual(export_dataset('slopes', path=self.path), {str(self.path / 'slopes.csv'): 0})
+        backfill_metacard_floors(since=since)
+
+
+class FakeResponse:
+    """Minimal HTTP error response from which gspread builds an APIError."""
+
+    def __init__(self, code, headers=None):
+        """Answer with HTTP status code and headers."""
+        self.status_code = code
+        self.headers = headers or {}
+        self.text = f'HTTP {code}'
+
+    def json(self):
+        """Return the Sheets API error body."""
+        return {'error': {'code': self.status_code, 'message': self.text, 'status': 'FAKE'}}
+
+
+class FakeWorksheet:
+    """In-memory stand-in for gspread.Worksheet, covering the calls made by the export."""
+
+    def __init__(self, spreadsheet, title, sheet_id):
+        """Start an empty worksheet of spreadsheet."""
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id  # pylint: disable=invalid-name
+        self.grid = []
+
+    def _set(self, row, column, value):
+        while len(self.grid) <= row:
+            self.grid.append([])
+        cells = self.grid[row]
+        cells.extend([''] * (column + 1 - len(cells)))
+        cells[column] = value
+
+    def _write(self, range_name, values):
+        row, column = a1_to_rowcol(range_name.split(':')[0])
+        for i, row_values in enumerate(values):
+            for j, value in enumerate(row_values):
+                self._set(row - 1 + i, column - 1 + j, value)
+
+    def clear(self):
+        """Empty the worksheet."""
+        self.spreadsheet.log('clear', self.title)
+        self.grid = []
+
+    def update(self, values, range_name='A1'):
+        """Write values starting at range_name."""
+        self.spreadsheet.log('update', self.title, sum(len(row) for row in values))
+        self._write(range_name, values)
+
+    def batch_update(self, data):
+        """Write several value ranges in one request."""
+        self.spreadsheet.log('batch_update', self.title, sum(len(row) for item in data for row in item['values']))
+        for item in data:
+            self._write(item['range'], item['values'])
+
+    def get_all_values(self):
+        """Return the grid with rows padded to the same width and trailing blanks trimmed."""
+        rows = [list(row) for row in self.grid]
+        while rows and not any(value != '' for value in rows[-1]):
+            rows.pop()
+        width = max([len(row) for row in rows] or [0])
+        while width and all(len(row) < width or row[width - 1] == '' for row in rows):
+            width -= 1
+        return [(row + [''] * width)[:width] for row in rows]
+
+
+class FakeSpreadsheet:
+    """In-memory stand-in for gspread.Spreadsheet, recording every API request made."""
+
+    def __init__(self, key, titles=('premodern_bulk', 'status')):
+        """Start a spreadsheet holding empty worksheets titles."""
+        self.key = key
+        self.requests = []
+        self.failures = []  # status codes the next requests fail with, e.g. [429, 429]
+        self.worksheets = {title: FakeWorksheet(self, title, sheet_id) for sheet_id, title in enumerate(titles)}
+
+    def log(self, method, title, cells=0):
+        """Record one API request, raising the next queued failure instead if any."""
+        if self.failures:
+            code = self.failures.pop(0)
+            self.requests.append((f'{method} failed {code}', title, cells))
+            raise APIError(FakeResponse(code))
+        self.requests.append((method, title, cells))
+
+    def worksheet(self, title):
+        """Return the worksheet named title."""
+        if title not in self.worksheets:
+            raise WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def batch_update(self, body):
+        """Apply insertDimension/deleteDimension column requests."""
+        self.log('spreadsheet_batch_update', self.key)
+        by_id = {worksheet.id: worksheet for worksheet in self.worksheets.values()}
+        for request in body['requests']:
+            ((kind, spec),) = request.items()
+            worksheet = by_id[spec['range']['sheetId']]
+            start, end = spec['range']['startIndex'], spec['range']['endIndex']
+            for row in worksheet.grid:
+                if kind == 'insertDimension' and len(row) > start:
+                    row[start:start] = [''] * (end - start)
+                elif kind == 'deleteDimension':
+                    del row[start:end]
+
+
+class FakeClient:
+    """In-memory stand-in for the gspread client returned by gspread.service_account()."""
+
+    def __init__(self):
+        """Start without spreadsheets."""
+        self.spreadsheets = {}
+
+    def open_by_key(self, key):
+        """Return the spreadsheet identified by key, created empty on first use."""
+        return self.spreadsheets.setdefault(key, FakeSpreadsheet(key))
+
+
+class GsheetsSyncTestCase(SimpleTestCase):
+    def setUp(self):
+        """Use an empty spreadsheet, an uploader that never waits and a snapshot path of the test."""
+        self.spreadsheet = FakeClient().open_by_key('key')
+        self.worksheet = self.spreadsheet.worksheet('premodern_bulk')
+        self.uploader = SheetsUploader(max_cells=100, sleep=lambda seconds: None)
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        self.snapshot = directory / 'snapshot.json'
+
+    def sync(self, grid):
+        """Sync grid to the worksheet."""
+        return sync_worksheet(self.spreadsheet, self.worksheet, grid, self.snapshot, uploader=self.uploader)
+
+    def test_inserted_columns(self):
+        """A new first date column is one inserted column, headers without a common date are not comparable."""
+        old = ['Name', 'Set', '2026-01-02', '2026-01-01']
+        self.assertEqual(inserted_columns(old, ['Name', 'Set', '2026-01-03', *old[2:]], 2), 1)
+        self.assertEqual(inserted_columns(old, old, 2), 0)
+        self.assertIsNone(inserted_columns(old, ['Name', 'Set', '2026-02-01'], 2))
+        self.assertIsNone(inserted_columns(old[:2], old, 2))
+
+    def test_diff_ranges(self):
+        """Runs of changed cells become one range each, cells gone from the new grid are blanked."""
+        old = [['a', 'b', 'c'], ['d', 'e', 'f']]
+        new = [['a', 'X', 'Y'], ['d', 'e']]
+        self.assertEqual(
+            diff_ranges(old, new),
+            [{'range': 'B1:C1', 'values': [['X', 'Y']]}, {'range': 'C2:C2', 'values': [['']]}],
+        )
+        self.assertEqual(diff_ranges(new, new), [])
+
+    def test_sync_new_date_column(self):
+        """A new catalog inserts one column and writes only the cells that changed."""
+        first = [['Name', 'Set', 'd2', 'd1'], ['A', 's', 1, 2], ['B', 's', 3, 4]]
+        second = [['Name', 'Set', 'd3', 'd2', 'd1'], ['A', 's', 5, 1, 2], ['B', 's', 3, 3, 4]]
+        self.assertEqual(self.sync(first), 12)
+        self.assertEqual(self.sync(second), 3)
+        self.assertEqual(self.worksheet.get_all_values(), second)
+        self.assertEqual(
+            [method for method, _, _ in self.spreadsheet.requests][-2:], ['spreadsheet_batch_update', 'batch_update']
+        )
+
+    def test_failed_column_move_rewrites_next_time(self):
+        """Once columns may have moved the snapshot is gone, the next sync rewrites the worksheet."""
+        first = [['Name', 'Set', 'd2', 'd1'], ['A', 's', 1, 2]]
+        second = [['Name', 'Set', 'd3', 'd2', 'd1'], ['A', 's', 5, 1, 2]]
+        self.sync(first)
+        self.spreadsheet.failures = [400]
+        with self.assertRaises(APIError):
+            self.sync(second)
+        self.assertFalse(self.snapshot.exists())
+
+        self.sync(second)
+        self.assertEqual(self.worksheet.get_all_values(), second)
+        self.assertIn('clear', [method for method, _, _ in self.spreadsheet.requests])
+
+
+class SheetsUploaderTestCase(SimpleTestCase):
+    def setUp(self):
+        """Use an empty worksheet and record the delays slept instead of waiting."""
+        self.spreadsheet = FakeClient().open_by_key('key')
+        self.worksheet = self.spreadsheet.worksheet('premodern_bulk')
+        self.delays = []
+
+    def uploader(self, **kwargs):
+        """Return an uploader sleeping into self.delays."""
+        return SheetsUploader(sleep=self.delays.append, **kwargs)
+
+    def test_exponential_backoff(self):
+        """Retryable errors are retried after delays bounded by a doubling backoff, up to max_backoff."""
+        uploader = self.uploader(max_retries=3, backoff=1, max_backoff=3)
+        self.spreadsheet.failures = [429, 503, 500]
+        uploader.call('clear', self.worksheet.clear)
+        self.assertEqual(len(self.delays), 3)
+        for delay, bound in zip(self.delays, (1, 2, 3)):
+            self.assertTrue(0 <= delay <= bound)
+        self.assertEqual(uploader.timings[-1][2], 4)
+
+    def test_retry_after(self):
+        """The delay asked by Retry-After is honoured."""
+        errors = [APIError(FakeResponse(429, {'Retry-After': '7'}))]
+
+        def request():
+            if errors:
+                raise errors.pop()
+
+        self.uploader(backoff=1, max_backoff=30).call('request', request)
+        self.assertEqual(self.delays, [7.0])
+
+    def test_not_retried(self):
+        """Client errors, requests sent with retry=False and errors past max_retries are raised."""
+        uploader = self.uploader(max_retries=1)
+        for failures, retry in (([400], True), ([503], False), ([503, 503], True)):
+            with self.subTest(failures=failures, retry=retry):
+                self.spreadsheet.failures = list(failures)
+                with self.assertRaises(APIError):
+                    uploader.call('clear', self.worksheet.clear, retry=retry)
+        self.assertEqual(len(self.delays), 1)
+
+    def test_chunked_by_rows(self):
+        """A grid is written in requests of whole rows and at most max_cells cells."""
+        grid = [[f'{row}{column}' for column in 'abc'] for row in range(5)]
+        self.assertEqual(self.uploader(max_cells=6).write_grid(self.worksheet, grid), 3)
+        self.assertEqual([cells for _, _, cells in self.spreadsheet.requests], [6, 6, 3])
+        self.assertEqual(self.worksheet.get_all_values(), grid)